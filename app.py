@@ -10,21 +10,40 @@ import camelot
 import tempfile
 import os
 import re
+import hashlib
+import zlib
+import json
+import pickle
+import weakref
+import threading
+import time
+import importlib
+import logging
+import sqlite3
+import tracemalloc
+from contextlib import closing, contextmanager, nullcontext
 from datetime import datetime, timedelta
 import io
-from typing import List, Dict, Tuple, Optional
+import bisect
+import multiprocessing as mp
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache, wraps
+from typing import Callable, Iterator, List, Dict, Tuple, Optional
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 import holidays
+from PyPDF2 import PdfReader
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
 
-st.set_page_config(
-    page_title="Camelot PDF Extractor Pro v3.0",
-    page_icon="📄",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+logger = logging.getLogger(__name__)
 
 # ============================================================================
 # HEADER PROFESIONAL
@@ -44,10 +63,878 @@ def render_header():
         </div>
     """, unsafe_allow_html=True)
 
+# ============================================================================
+# TOKENIZADOR DE TABLAS
+# ============================================================================
+
+SLIP_RE = re.compile(r'7290000\d{5}')
+STATE_RE = re.compile(r'\b[A-Z]{2}\b')
+TABLET_RE = re.compile(r'\b\d{2,4}\b')
+OPEN_CODE_RE = re.compile(r'\d{2,4}[MALT]')
+WAREHOUSE_RE = re.compile(r'RO-[A-Z]{2}|\d+[A-Za-z]*', re.IGNORECASE)
+
+SKIP_ROW_MARKERS = ['Outstanding count', 'Page', 'Return packing', 'Customer name', 'Alsina Forms']
+
+
+class TableTokens:
+    """
+    Tokens de una tabla, calculados en una sola pasada.
+
+    - slips: primer slip de cada celda ('' si no hay), matriz filas × columnas
+    - row_text: texto unido de cada fila; has_slip / is_data_row por fila
+    - row_numbers / row_open_codes: números y códigos [MALT] de una fila,
+      calculados al pedirlos
+
+    Lo comparten el filtrado de filas de datos (process_page, validaciones),
+    la unión de continuaciones (merge_continuation_rows) y score_extraction.
+    Las correcciones fix_* trabajan sobre la tabla ya modificada y siguen
+    usando sus propios patrones.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        cells = df.to_numpy(dtype=object)
+        n_rows, n_cols = cells.shape
+
+        self.row_text = [' '.join(str(cell) for cell in row if pd.notna(cell)) for row in cells]
+
+        flat = pd.Series([str(cell) for cell in cells.ravel()], dtype=object)
+        slips = flat.str.extract(f'({SLIP_RE.pattern})')[0].fillna('')
+        states = flat.str.contains(STATE_RE.pattern)
+
+        self.slips = slips.to_numpy(dtype=object).reshape(n_rows, n_cols)
+        self.slip_cells = self.slips != ''
+
+        # Los patrones no cruzan el separador ' ', así que "alguna celda"
+        # equivale a buscar en el texto unido de la fila
+        self.has_slip = self.slip_cells.any(axis=1)
+        has_state = states.to_numpy(dtype=bool).reshape(n_rows, n_cols).any(axis=1)
+        # Los marcadores sí pueden cruzar celdas: se buscan en el texto unido
+        is_marker = np.array([any(marker in text for marker in SKIP_ROW_MARKERS)
+                              for text in self.row_text], dtype=bool)
+        self.is_data_row = self.has_slip & has_state & ~is_marker
+
+        self._numbers = {}
+        self._open_codes = {}
+
+    def __len__(self):
+        return len(self.row_text)
+
+    def row_numbers(self, idx: int) -> List[str]:
+        """Números de tablilla (2-4 dígitos) de una fila"""
+        if idx not in self._numbers:
+            self._numbers[idx] = TABLET_RE.findall(self.row_text[idx])
+        return self._numbers[idx]
+
+    def row_open_codes(self, idx: int) -> List[str]:
+        """Códigos de tablilla abierta [MALT] de una fila"""
+        if idx not in self._open_codes:
+            self._open_codes[idx] = OPEN_CODE_RE.findall(self.row_text[idx])
+        return self._open_codes[idx]
+
+
+def memo_by_frame(cache: Dict, df: pd.DataFrame, factory: Callable):
+    """
+    Calcula factory(df) una sola vez por DataFrame y reutiliza el resultado
+    mientras siga vivo (la entrada se retira al recolectarlo). Las tablas
+    extraídas se tratan como inmutables: quien las modifique en sitio debe
+    trabajar sobre una copia.
+    """
+    key = id(df)
+    entry = cache.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+
+    value = factory(df)
+    cache[key] = (weakref.ref(df, lambda _, key=key: cache.pop(key, None)), value)
+    return value
+
+
+_TOKEN_CACHE = {}
+
+
+def tokenize_table(df: pd.DataFrame) -> TableTokens:
+    """Tokeniza una tabla una sola vez y reutiliza el resultado mientras el DataFrame siga vivo"""
+    return memo_by_frame(_TOKEN_CACHE, df, TableTokens)
+
+
+# ============================================================================
+# EVENTOS DE PROGRESO
+# ============================================================================
+
+ExtractionEvent = namedtuple('ExtractionEvent', ['kind', 'message', 'data'])
+
+
+class ProgressEvents:
+    """
+    Canal de eventos de progreso del extractor. El núcleo no conoce la
+    interfaz: la UI de Streamlit, la CLI o un test se suscriben aquí.
+
+    Tipos de evento (kind → data):
+        method_started    method
+        method_finished   method, success
+        methods_progress  completed, total         (ejecución paralela)
+        quality_passed    method, skipped          (modo adaptativo)
+        pages_detected    pages
+        pages_scanned     page_count, skipped, seconds   (pre-escaneo de texto)
+        layout_template   signature, hit           (plantilla de columnas)
+        page_processing   page, shape
+        page_rows         page, page_count, data, slip_count   (extracción progresiva)
+        validation        total_rows, slip_count, completeness
+        error             detail (opcional, p. ej. traceback)
+    """
+
+    def __init__(self, listeners=None):
+        self._listeners = list(listeners or [])
+
+    def subscribe(self, listener: Callable[[ExtractionEvent], None]):
+        self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def emit(self, kind: str, message: str = '', **data):
+        event = ExtractionEvent(kind, message, data)
+        for listener in list(self._listeners):
+            listener(event)
+
+
+# ============================================================================
+# PERFILADO POR ETAPAS
+# ============================================================================
+
+_profile_local = threading.local()
+
+
+class StageProfiler:
+    """
+    Tiempo de pared y número de llamadas por etapa, anidadas por la pila de
+    llamadas (como un flame graph): ('method_stream_standard', 'process_tables',
+    'fix_tablets_total_split') acumula las llamadas a esa corrección dentro de
+    ese método.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self._stack = []
+
+    def _record(self, path: Tuple[str, ...]) -> Dict:
+        # 'order' conserva el orden de primera entrada para dibujar el árbol
+        return self.stages.setdefault(path, {'seconds': 0.0, 'calls': 0, 'order': len(self.stages)})
+
+    @contextmanager
+    def stage(self, name: str):
+        self._stack.append(name)
+        record = self._record(tuple(self._stack))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] += time.perf_counter() - start
+            record['calls'] += 1
+            self._stack.pop()
+
+    def merge(self, stages: Dict):
+        """Incorpora las etapas medidas en otro proceso bajo la etapa actual"""
+        for path, other in sorted(stages.items(), key=lambda item: item[1]['order']):
+            record = self._record(tuple(self._stack) + tuple(path))
+            record['seconds'] += other['seconds']
+            record['calls'] += other['calls']
+
+    def flame_table(self) -> pd.DataFrame:
+        """Árbol de etapas en preorden con segundos, llamadas y % del padre / del total"""
+        if not self.stages:
+            return pd.DataFrame(columns=['Etapa', 'Llamadas', 'Segundos', '% padre', '% total'])
+
+        def tree_key(path):
+            return tuple(self.stages[path[:i + 1]]['order'] for i in range(len(path)))
+
+        total = sum(record['seconds'] for path, record in self.stages.items() if len(path) == 1) or 1.0
+        rows = []
+        for path in sorted(self.stages, key=tree_key):
+            record = self.stages[path]
+            parent = self.stages.get(path[:-1]) if len(path) > 1 else None
+            parent_seconds = parent['seconds'] if parent else total
+            rows.append({
+                'Etapa': '\u2003' * (len(path) - 1) + path[-1],
+                'Llamadas': record['calls'],
+                'Segundos': record['seconds'],
+                '% padre': record['seconds'] / parent_seconds * 100 if parent_seconds else 0.0,
+                '% total': record['seconds'] / total * 100,
+            })
+        return pd.DataFrame(rows)
+
+
+def active_stage_profiler() -> Optional[StageProfiler]:
+    """Perfilador activo en este hilo (None fuera de stage_profiler)"""
+    return getattr(_profile_local, 'profiler', None)
+
+
+@contextmanager
+def stage_profiler():
+    """Activa un StageProfiler en este hilo; si ya hay uno activo se reutiliza"""
+    active = active_stage_profiler()
+    if active is not None:
+        yield active
+        return
+
+    profiler = StageProfiler()
+    _profile_local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profile_local.profiler = None
+
+
+def profile_stage(name: str):
+    """Mide el bloque como etapa name si hay un perfilador activo (si no, no cuesta nada)"""
+    profiler = active_stage_profiler()
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+def profiled(name: Optional[str] = None):
+    """Decorador: registra cada llamada a la función como etapa del perfilador activo"""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = active_stage_profiler()
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.stage(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+# ============================================================================
+# ESQUEMA TIPADO DE DATOS EXTRAÍDOS
+# ============================================================================
+
+# Las 18 columnas del reporte, en el orden del PDF
+REPORT_COLUMNS = [
+    'Wh', 'Return_Prefix', 'Return_Slip', 'Return_Date',
+    'Jobsite', 'Cost_Center', 'Invoice_Date1', 'Invoice_Date2',
+    'Customer', 'Job_Name', 'Definitive', 'Counted_Date',
+    'Tablets', 'Total', 'Open', 'Tablets_Total',
+    'Counting_Delay', 'Validation_Delay'
+]
+SCHEMA_DATE_COLUMNS = ['Return_Date', 'Invoice_Date1', 'Invoice_Date2', 'Counted_Date']
+SCHEMA_INT_COLUMNS = ['Total', 'Tablets_Total']
+# Columnas de pocos valores distintos que se repiten en todo el reporte
+SCHEMA_CATEGORY_COLUMNS = ['Wh', 'Return_Prefix', 'Customer', 'Definitive']
+
+
+def _schema_text(column: pd.Series) -> pd.Series:
+    """Texto con dtype string; celdas vacías como <NA>"""
+    text = column.astype('string')
+    return text.mask(text == '')
+
+
+def _schema_dates(column: pd.Series) -> pd.Series:
+    """Fechas M/D/YYYY del reporte (o ISO, p. ej. del almacén histórico) a datetime64; inválidas como NaT"""
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return column.astype('datetime64[us]')
+    text = column.astype('string').str.strip()
+    dates = pd.to_datetime(text, format='%m/%d/%Y', errors='coerce').astype('datetime64[us]')
+    retry = dates.isna() & text.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(text[retry], format='ISO8601', errors='coerce')
+    # Misma resolución venga del PDF, del almacén o de Excel
+    return dates
+
+
+def _schema_integers(column: pd.Series) -> pd.Series:
+    """Conteos a Int64; texto no numérico o no entero como <NA>"""
+    if pd.api.types.is_integer_dtype(column.dtype):
+        return column.astype('Int64')
+    if pd.api.types.is_float_dtype(column.dtype):
+        numbers = column.astype('Float64')
+    else:
+        numbers = pd.to_numeric(column.astype('string').str.strip(), errors='coerce').astype('Float64')
+    return numbers.where(numbers == numbers.round()).astype('Int64')
+
+
+def _schema_column(name: str, column: pd.Series) -> pd.Series:
+    if name in SCHEMA_DATE_COLUMNS:
+        return _schema_dates(column)
+    if name in SCHEMA_INT_COLUMNS:
+        return _schema_integers(column)
+    if name in SCHEMA_CATEGORY_COLUMNS:
+        return _schema_text(column).astype('category')
+    return _schema_text(column)
+
+
+@profiled()
+def normalize_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Esquema tipado de una tabla extraída (salida de process_tables, Excel
+    exportado o almacén histórico):
+    - columnas por nombre (REPORT_COLUMNS) en lugar de posiciones 0-17
+    - fechas datetime64, Total / Tablets_Total Int64, Wh / Return_Prefix
+      (warehouse) / Customer / Definitive category y el resto string
+
+    Es idempotente. Las columnas a partir de la 18 se conservan al final
+    (las de texto como string); las que falten se crean vacías.
+    """
+    if df is None:
+        return None
+
+    columns = {}
+    for position, name in enumerate(REPORT_COLUMNS):
+        if position < df.shape[1]:
+            column = df.iloc[:, position].reset_index(drop=True)
+        else:
+            column = pd.Series(pd.NA, index=pd.RangeIndex(len(df)), dtype=object)
+        columns[name] = _schema_column(name, column)
+
+    for position in range(len(REPORT_COLUMNS), df.shape[1]):
+        label = df.columns[position]
+        column = df.iloc[:, position].reset_index(drop=True)
+        if column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+            column = _schema_text(column)
+        columns[label if isinstance(label, str) else f'Columna_{label + 1}'] = column
+
+    return pd.DataFrame(columns)
+
+
+def ensure_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """df si ya tiene el esquema tipado; si no, normalize_schema(df)"""
+    if list(df.columns[:len(REPORT_COLUMNS)]) == REPORT_COLUMNS:
+        return df
+    return normalize_schema(df)
+
+
+def schema_memory(raw: pd.DataFrame, typed: pd.DataFrame) -> Dict:
+    """Memoria (deep) antes y después de normalize_schema"""
+    return schema_memory_bytes(int(raw.memory_usage(deep=True).sum()), int(typed.memory_usage(deep=True).sum()))
+
+
+def schema_memory_bytes(raw_bytes: int, typed_bytes: int) -> Dict:
+    """Como schema_memory, con los bytes ya medidos (extracción progresiva: página a página)"""
+    return {
+        'raw_bytes': raw_bytes,
+        'typed_bytes': typed_bytes,
+        'saved_pct': (1 - typed_bytes / raw_bytes) * 100 if raw_bytes else 0.0
+    }
+
+
+# ============================================================================
+# MEMOIZACIÓN DE ARTEFACTOS DERIVADOS
+# ============================================================================
+
+# Presupuesto por defecto de ArtifactMemo (por sesión de Streamlit)
+ARTIFACT_MEMO_MAX_BYTES = 256 * 1024 * 1024
+
+_FINGERPRINT_CACHE = {}
+
+
+def _hash_frame(df: pd.DataFrame) -> str:
+    digest = hashlib.sha1(repr((df.shape, [str(c) for c in df.columns])).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Huella del contenido de un DataFrame (forma, columnas y hash de celdas).
+    Se calcula una vez por objeto: dos extracciones con el mismo contenido
+    comparten huella aunque sean objetos distintos.
+    """
+    return memo_by_frame(_FINGERPRINT_CACHE, df, _hash_frame)
+
+
+def estimate_nbytes(value) -> int:
+    """Tamaño aproximado en memoria de un artefacto (DataFrames, bytes, figuras, contenedores)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, io.BytesIO):
+        return value.getbuffer().nbytes
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values()) + 64 * len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value) + 8 * len(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return 64 + (len(value) if isinstance(value, str) else 0)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class ArtifactMemo:
+    """
+    Caché LRU en memoria, acotada en bytes, para artefactos derivados de una
+    extracción (frame de análisis, agregados de tablillas, figuras, Excel).
+
+    Las claves son tuplas que normalmente empiezan por frame_fingerprint(df).
+    Un artefacto mayor que el presupuesto completo se calcula pero no se guarda.
+    """
+
+    def __init__(self, max_bytes: int = ARTIFACT_MEMO_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # Las descargas diferidas de Streamlit calculan en otro hilo
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple, default=None):
+        """Artefacto ya calculado (sin calcularlo ni contar acierto/fallo)"""
+        with self._lock:
+            entry = self.entries.get(key)
+        return default if entry is None else entry[0]
+
+    def get_or_compute(self, key: Tuple, compute: Callable):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.entries[key][0]
+            self.stats['misses'] += 1
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Tuple, value):
+        """Guarda un artefacto calculado fuera de la memo (p. ej. en un pool de procesos)"""
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = (value, nbytes)
+                self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# ============================================================================
+# EXTRACCIÓN NATIVA POR COORDENADAS DE PALABRAS
+# ============================================================================
+# Para reportes generados digitalmente: las palabras se leen con su posición
+# de la capa de texto (pdfminer sin análisis de layout) y se asignan a las 18
+# columnas por las x de inicio del encabezado. No hay detección de tablas ni
+# rasterizado, y cada albarán se arma completo (celdas multilínea incluidas).
+
+# Tabla de una página con la interfaz que usan process_tables y calculate_accuracy
+WordTable = namedtuple('WordTable', ['df', 'accuracy', 'page'])
+
+# Carácter y palabra de la capa de texto: caja horizontal, línea base y cuerpo de letra
+TextChar = namedtuple('TextChar', ['x0', 'x1', 'y', 'size', 'text'])
+Word = namedtuple('Word', ['x0', 'x1', 'y', 'size', 'text'])
+
+# Columnas que pueden ocupar varias líneas de un albarán: primera celda
+# apilada (estado / warehouse / slip), Tablets, Total y Open. Una línea con
+# texto en cualquier otra columna abre un albarán nuevo.
+WORD_MULTILINE_COLUMNS = frozenset([0, 1, 2, 12, 13, 14])
+
+
+def parse_page_ranges(pages: str, page_count: int) -> List[int]:
+    """'1-3,7' → [1, 2, 3, 7]; 'all' → todas (inverso de format_page_ranges)"""
+    if pages == 'all':
+        return list(range(1, page_count + 1))
+    numbers = []
+    for part in str(pages).split(','):
+        start, _, end = part.strip().partition('-')
+        last = page_count if end == 'end' else int(end or start)
+        numbers.extend(range(int(start), min(last, page_count) + 1))
+    return numbers
+
+
+class _TextCharCollector(PDFPageAggregator):
+    """
+    Dispositivo pdfminer que solo anota posición y texto de cada carácter
+    horizontal (sin construir LTChar ni el árbol de layout). El texto girado
+    no forma parte de la tabla y se ignora.
+    """
+
+    def __init__(self, resources: PDFResourceManager):
+        super().__init__(resources, laparams=None)
+        self.chars = []
+
+    def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate) -> float:
+        try:
+            text = font.to_unichr(cid)
+        except PDFUnicodeNotDefined:
+            text = self.handle_undefined_char(font, cid)
+        adv = font.char_width(cid) * fontsize * scaling
+        a, b, c, d, e, f = matrix
+        if b == 0 and c == 0 and a > 0 and d > 0:
+            self.chars.append(TextChar(e, e + adv * a, f + rise * d, fontsize * d, text))
+        return adv
+
+
+def _text_lines(chars: List[TextChar]) -> List[List[Word]]:
+    """Agrupa los caracteres en líneas (de arriba abajo) y palabras (de izquierda a derecha)"""
+    lines = []
+    for char in sorted(chars, key=lambda c: -c.y):
+        if lines and abs(lines[-1][0].y - char.y) <= char.size * 0.3:
+            lines[-1].append(char)
+        else:
+            lines.append([char])
+
+    text_lines = []
+    for line in lines:
+        words = []
+        current = []
+        for char in sorted(line, key=lambda c: c.x0):
+            if char.text.isspace() or (current and char.x0 - current[-1].x1 > char.size * 0.2):
+                if current:
+                    words.append(current)
+                current = [] if char.text.isspace() else [char]
+            else:
+                current.append(char)
+        if current:
+            words.append(current)
+        if words:
+            text_lines.append([Word(w[0].x0, w[-1].x1, line[0].y, w[0].size,
+                                    ''.join(c.text for c in w)) for w in words])
+    return text_lines
+
+
+def _is_header_line(line: List[Word]) -> bool:
+    texts = {word.text.lower() for word in line}
+    return 'customer' in texts and 'tablets' in texts
+
+
+def _header_phrases(line: List[Word]) -> Optional[List[List[Word]]]:
+    """
+    Los 18 títulos de la línea de encabezado, agrupando palabras por la
+    separación entre ellas; None si no salen exactamente 18.
+    """
+    size = max(word.size for word in line)
+    # De un ancho de espacio (~0.28 cuerpos) en adelante, hasta dar con 18 títulos
+    for factor in (0.35, 0.5, 0.75, 1.0, 1.5):
+        phrases = [[line[0]]]
+        for word in line[1:]:
+            if word.x0 - phrases[-1][-1].x1 <= size * factor:
+                phrases[-1].append(word)
+            else:
+                phrases.append([word])
+        if len(phrases) == len(REPORT_COLUMNS):
+            return phrases
+    return None
+
+
+def detect_column_starts(lines: List[List[Word]]) -> Optional[List[float]]:
+    """x de inicio de las 18 columnas, leída de la línea de encabezado (la que tiene "Customer" y "Tablets")"""
+    for line in lines:
+        if _is_header_line(line):
+            phrases = _header_phrases(line)
+            if phrases is not None:
+                return [phrase[0].x0 for phrase in phrases]
+    return None
+
+
+def _word_column(bounds: List[float], word: Word) -> int:
+    # Los valores del reporte van alineados a la izquierda bajo su título
+    return max(0, bisect.bisect_right(bounds, word.x0) - 1)
+
+
+def _word_record_row(record: List[Dict[int, List[str]]]) -> List[str]:
+    """Las líneas de un albarán (columna → palabras) a las 18 celdas de texto"""
+    cells = [[] for _ in REPORT_COLUMNS]
+    for line in record:
+        for col, words in line.items():
+            cells[col].append(' '.join(words))
+
+    row = ['\n'.join(parts) if col < 3 else ' '.join(parts) for col, parts in enumerate(cells)]
+
+    # Primera celda apilada "FL\n61D\n729000010011": se reparte en sus tres columnas
+    if '\n' in row[0] and not row[1] and not row[2]:
+        row[0], row[1], row[2] = CamelotExtractorPro._parse_multiline_first_cell(row[0])
+    row[1] = row[1].upper()
+
+    # Customer pegado a Definitive ("Coastal Forms Inc No"): el Yes/No final es Definitive
+    if not row[10]:
+        for col in (8, 9):
+            head, _, last = row[col].rpartition(' ')
+            if head and last in ('Yes', 'Ye', 'No'):
+                row[col], row[10] = head, last
+                break
+    return row
+
+
+def iter_page_text_lines(pdf_path: str, pages: str = 'all') -> Iterator[Tuple[int, Tuple, List[List[Word]]]]:
+    """(número de página, mediabox, líneas de palabras) de las páginas pedidas"""
+    resources = PDFResourceManager(caching=True)
+    device = _TextCharCollector(resources)
+    interpreter = PDFPageInterpreter(resources, device)
+
+    with open(pdf_path, 'rb') as f:
+        page_list = list(PDFPage.get_pages(f))
+        wanted = set(parse_page_ranges(pages, len(page_list)))
+
+        for number, page in enumerate(page_list, start=1):
+            if number not in wanted:
+                continue
+            device.chars = []
+            interpreter.process_page(page)
+            yield number, tuple(page.mediabox), _text_lines(device.chars)
+
+
+def read_word_tables(pdf_path: str, pages: str = 'all') -> List[WordTable]:
+    """
+    Una WordTable por página con albaranes. Cada línea con texto fuera de las
+    columnas multilínea abre un albarán; las líneas siguientes (a menos de
+    2.5 cuerpos de letra) son sus continuaciones. Solo se conservan los
+    albaranes con slip (7290000NNNNN). Las fronteras de columna se heredan
+    de la última página con encabezado.
+    """
+    tables = []
+    bounds = None
+    for number, _, lines in iter_page_text_lines(pdf_path, pages):
+        starts = detect_column_starts(lines)
+        if starts is not None:
+            size = min(word.size for line in lines for word in line)
+            bounds = [x - size * 0.5 for x in starts]
+        if bounds is None:
+            continue
+
+        records = []
+        current = None
+        last_y = None
+        # Precisión: palabras bajo el encabezado que acaban en un albarán
+        in_table = starts is None
+        total_words = used_words = 0
+        for line in lines:
+            if _is_header_line(line):
+                in_table = True
+                current = None
+                continue
+            if not in_table:
+                continue
+
+            columns = {}
+            for word in line:
+                col = _word_column(bounds, word)
+                # Total y Open juntos ("3 1656T, 1661A"): Total solo admite el número
+                if col == 13 and not word.text.isdigit():
+                    col = 14
+                columns.setdefault(col, []).append(word.text)
+
+            total_words += len(line)
+            near = last_y is not None and last_y - line[0].y <= line[0].size * 2.5
+            if any(col not in WORD_MULTILINE_COLUMNS for col in columns):
+                current = [columns]
+                records.append(current)
+            elif current is not None and near:
+                current.append(columns)
+            else:
+                current = None
+                continue
+            last_y = line[0].y
+
+        rows = []
+        for record in records:
+            row = _word_record_row(record)
+            if any(SLIP_RE.search(cell) for cell in row):
+                rows.append(row)
+                used_words += sum(len(words) for line in record for words in line.values())
+
+        if rows:
+            accuracy = used_words / total_words * 100 if total_words else 0.0
+            tables.append(WordTable(pd.DataFrame(rows), accuracy, str(number)))
+    return tables
+
+
+# ============================================================================
+# PLANTILLAS DE LAYOUT
+# ============================================================================
+# camelot stream adivina las columnas en cada página y de ahí salen los
+# desplazamientos que corrigen fix_column_shift_after_definitive,
+# fix_missing_open_column y fix_tablets_total_split. Una plantilla fija las
+# 18 columnas y el área de la tabla (leídas del encabezado de la primera
+# página) y se pasa como columns= / table_areas= a todas las páginas.
+
+# Páginas (desde la primera pedida) en las que se busca el encabezado
+LAYOUT_TEMPLATE_SEARCH_PAGES = 3
+
+
+def learn_layout_template(pdf_path: str, pages: str = 'all') -> Optional[Dict]:
+    """
+    Plantilla del documento a partir de la primera página con encabezado:
+    separadores x entre columnas, área de la tabla (del encabezado al pie de
+    página, en coordenadas PDF) y firma del formato (títulos, su posición y
+    tamaño de página). None si no hay encabezado reconocible.
+    """
+    for searched, (number, mediabox, lines) in enumerate(iter_page_text_lines(pdf_path, pages)):
+        if searched >= LAYOUT_TEMPLATE_SEARCH_PAGES:
+            break
+        for line in lines:
+            phrases = _header_phrases(line) if _is_header_line(line) else None
+            if phrases is None:
+                continue
+
+            size = min(word.size for text_line in lines for word in text_line)
+            margin = size * 0.5
+            left, bottom, right, _ = mediabox
+            titles = [' '.join(word.text for word in phrase) for phrase in phrases]
+            top = max(word.y + word.size for word in line) + margin
+            starts = [round(phrase[0].x0) for phrase in phrases]
+            signature = hashlib.sha1(
+                json.dumps([titles, starts, [round(v) for v in mediabox]]).encode('utf-8')
+            ).hexdigest()[:16]
+            return {
+                'signature': signature,
+                'titles': titles,
+                'columns': ','.join(f"{phrase[0].x0 - margin:.1f}" for phrase in phrases[1:]),
+                'table_area': f"{max(left, phrases[0][0].x0 - margin):.1f},{top:.1f},{right:.1f},{bottom:.1f}",
+                'page': number
+            }
+    return None
+
+
+class LayoutTemplateStore:
+    """
+    Plantillas guardadas por formato de reporte (firma de learn_layout_template)
+    en un JSON local. Editar columns / table_area a mano ajusta la extracción
+    de todos los PDFs con ese formato. Escrituras atómicas (os.replace).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(
+            'PDF_EXTRACTOR_TEMPLATES_PATH',
+            os.path.join(os.path.expanduser('~'), '.local', 'share', 'camelot_extractor_pro', 'plantillas.json')
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, templates: Dict):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(templates, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, signature: str) -> Optional[Dict]:
+        """Plantilla guardada (y cuenta el uso) o None"""
+        templates = self._read()
+        template = templates.get(signature)
+        if template is not None:
+            template['hits'] = template.get('hits', 0) + 1
+            template['last_used'] = datetime.now().isoformat(timespec='seconds')
+            self._write(templates)
+        return template
+
+    def put(self, template: Dict):
+        templates = self._read()
+        templates[template['signature']] = dict(template, hits=0,
+                                                created_at=datetime.now().isoformat(timespec='seconds'))
+        self._write(templates)
+
+
+# Resolución (dpi) de render de las pasadas lattice (la de camelot por
+# defecto) y del intento previo a baja resolución (ver read_lattice_pass).
+# Una página del borrador se acepta si tiene tablas y todas superan
+# LATTICE_DRAFT_MIN_ACCURACY.
+LATTICE_RESOLUTION = 300
+LATTICE_DRAFT_RESOLUTION = 150
+LATTICE_DRAFT_MIN_ACCURACY = 95.0
+
+
+# Tabla leída con plantilla: las columnas ya están en su sitio (ver process_page)
+TemplateTable = namedtuple('TemplateTable', ['df', 'accuracy', 'page'])
+
+
 # ============================================================================
 # CLASE PRINCIPAL: EXTRACTOR
 # ============================================================================
 
+# Extracción progresiva: páginas que camelot procesa de una vez. Solo las
+# tablas y layouts de esta ventana están en memoria a la vez.
+STREAM_PAGE_WINDOW = 10
+
+# Filas corregidas de una página (data es None si la página no tiene datos);
+# raw_bytes: memoria de las filas antes del esquema tipado (ver schema_memory)
+PageRows = namedtuple('PageRows', ['page', 'page_count', 'data', 'accuracy', 'raw_bytes'], defaults=[0])
+
+# Encabezado del reporte en la capa de texto (pre-escaneo)
+REPORT_HEADER_MARKER = 'outstanding count'
+
+
+def format_page_ranges(pages: List[int]) -> str:
+    """[1, 2, 3, 7, 9, 10] → '1-3,7,9-10' (formato pages de camelot)"""
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ','.join(f"{start}-{end}" if end > start else str(start) for start, end in ranges)
+
+
+@profiled('prescan')
+def prescan_data_pages(pdf_path: str) -> Dict:
+    """
+    Lee la capa de texto de cada página y se queda con las que tienen slips
+    (7290000NNNNN): portadas y resúmenes se omiten antes de pagar la
+    detección de tablas de camelot.
+
+    Si el documento no tiene el encabezado "Outstanding count" o ninguna
+    página tiene slips legibles (PDF escaneado, fuente sin texto), no se
+    omite nada: el pre-escaneo solo descarta cuando reconoce el formato.
+
+    'slips' son los slips distintos de la capa de texto: la referencia de
+    completitud de score_extraction, independiente de camelot.
+    """
+    start = time.perf_counter()
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+
+    slips = set()
+    slip_pages = []
+    unreadable = []
+    has_header = False
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ''
+        except Exception:
+            # Página ilegible: se conserva y que decida camelot
+            unreadable.append(number)
+            continue
+        has_header = has_header or REPORT_HEADER_MARKER in text.lower()
+        page_slips = SLIP_RE.findall(text)
+        if page_slips:
+            slip_pages.append(number)
+            slips.update(page_slips)
+
+    if has_header and slip_pages:
+        data_pages = sorted(slip_pages + unreadable)
+    else:
+        data_pages = list(range(1, page_count + 1))
+
+    skipped = page_count - len(data_pages)
+    return {
+        'pages': format_page_ranges(data_pages) if skipped else 'all',
+        'data_pages': data_pages,
+        'page_count': page_count,
+        'skipped': skipped,
+        'slips': frozenset(slips),
+        'seconds': time.perf_counter() - start
+    }
+
+
 class CamelotExtractorPro:
     """
     Extractor especializado - versión profesional con 8 correcciones universales
@@ -56,8 +943,55 @@ class CamelotExtractorPro:
     todas las tablillas están cerradas (último día de cierre de mes)
     """
 
-    def __init__(self):
+    # Parámetros camelot por método (method_hybrid hace dos pasadas).
+    # Forman parte de la clave de ExtractionCache: cambiarlos invalida la caché.
+    CAMELOT_PARAMS = {
+        'method_stream_standard': {'flavor': 'stream'},
+        'method_stream_balanced': {'flavor': 'stream', 'edge_tol': 350, 'row_tol': 12, 'column_tol': 5},
+        'method_lattice_standard': {'flavor': 'lattice', 'process_background': True, 'line_scale': 40},
+        'method_stream_aggressive': {'flavor': 'stream', 'edge_tol': 500, 'row_tol': 10, 'column_tol': 0,
+                                     'split_text': True, 'flag_size': True},
+        'method_lattice_detailed': {'flavor': 'lattice', 'process_background': True, 'line_scale': 40,
+                                    'iterations': 2},
+        'method_hybrid': [{'flavor': 'stream', 'edge_tol': 500}, {'flavor': 'lattice'}],
+    }
+    # method_stream_template: columns / table_areas salen de la plantilla del
+    # documento (ver camelot_params). Sin split_text: un texto que cruza un
+    # separador se queda entero en la columna donde empieza.
+    TEMPLATE_PARAMS = {'flavor': 'stream'}
+
+    def __init__(self, cache: Optional['ExtractionCache'] = None,
+                 shard_size: Optional[int] = None, max_workers: Optional[int] = None,
+                 correction_engine: str = 'rows', share_layout: bool = True,
+                 prescan: bool = True, template_store: Optional['LayoutTemplateStore'] = None,
+                 lattice_resolution: int = LATTICE_RESOLUTION,
+                 lattice_draft_resolution: Optional[int] = LATTICE_DRAFT_RESOLUTION,
+                 events: Optional[ProgressEvents] = None):
+        self.cache = cache
+        # Progreso y errores se publican aquí (sin suscriptores: silencioso)
+        self.events = events if events is not None else ProgressEvents()
+        # Reutiliza el layout pdfminer y las imágenes de página entre métodos
+        self.share_layout = share_layout
+        self.layout_stats = None
+        # Pre-escaneo de la capa de texto: los métodos solo leen páginas con slips
+        self.prescan = prescan
+        self.page_scans = {}
+        # Plantillas de layout por documento y, si hay almacén, por formato de reporte
+        self.template_store = template_store
+        self.layout_templates = {}
+        self.template_stats = {'hits': 0, 'misses': 0}
+        # Render de las pasadas lattice: resolución completa y del intento previo (None: sin él)
+        self.lattice_resolution = lattice_resolution
+        self.lattice_draft_resolution = lattice_draft_resolution
+        # 'rows': pipeline fila a fila original; 'vectorized': página completa
+        self.correction_engine = correction_engine
+        # Modo por bloques de páginas: cada método se ejecuta sobre rangos de
+        # shard_size páginas repartidos en max_workers procesos
+        self.shard_size = shard_size
+        self.max_workers = max_workers
         self.extraction_methods = [
+            self.method_native_words,          # Vía rápida: PDFs digitales, sin camelot
+            self.method_stream_template,       # Columnas fijas aprendidas del encabezado
             self.method_stream_standard,       # PRIORIDAD 1: Funciona mejor con tablillas cerradas
             self.method_stream_balanced,       # PRIORIDAD 2
             self.method_lattice_standard,      # PRIORIDAD 3
@@ -66,28 +1000,180 @@ class CamelotExtractorPro:
             self.method_hybrid
         ]
 
+    def run_method(self, pdf_path: str, method_name: str) -> Dict:
+        """Ejecuta un método de extracción y procesa sus tablas (con caché si existe)"""
+        with profile_stage(method_name):
+            return self._run_method(pdf_path, method_name)
+
+    def _run_method(self, pdf_path: str, method_name: str) -> Dict:
+        cache_key = None
+        if self.cache is not None:
+            try:
+                cache_key = self.cache.make_key(self.cache.hash_file(pdf_path), method_name,
+                                                self.camelot_params(pdf_path, method_name))
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    cached['cached'] = True
+                    return cached
+            except Exception:
+                cache_key = None
+
+        try:
+            with profile_stage('camelot_parse'):
+                if self.shard_size and method_name in self.CAMELOT_PARAMS:
+                    tables = self.read_tables_sharded(pdf_path, method_name)
+                else:
+                    method = getattr(self, method_name)
+                    pages = self.scan_pages(pdf_path)['pages']
+                    with self.layout_scope(pdf_path):
+                        tables = method(pdf_path, pages=pages)
+            if tables:
+                raw_df = self.process_tables(tables)
+                df = normalize_schema(raw_df)
+                result = {
+                    'success': True,
+                    'tables_found': len(tables),
+                    'rows': len(df) if df is not None else 0,
+                    'data': df,
+                    'accuracy': self.calculate_accuracy(tables)
+                }
+                if df is not None:
+                    result['memory'] = schema_memory(raw_df, df)
+            else:
+                result = {'success': False}
+        except Exception as e:
+            # Los errores pueden ser transitorios: no se guardan en caché
+            return {'success': False, 'error': str(e)}
+
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def worker_options(self) -> Dict:
+        """Configuración que heredan los extractores de los procesos worker"""
+        return {'cache': self.cache, 'correction_engine': self.correction_engine,
+                'share_layout': self.share_layout, 'prescan': self.prescan,
+                'template_store': self.template_store, 'lattice_resolution': self.lattice_resolution,
+                'lattice_draft_resolution': self.lattice_draft_resolution}
+
+    @contextmanager
+    def layout_scope(self, pdf_path: str):
+        """Comparte el parse de layout del documento entre las pasadas camelot"""
+        if not self.share_layout:
+            yield None
+            return
+        with shared_page_layout(pdf_path) as layout_cache:
+            yield layout_cache
+            self.layout_stats = dict(layout_cache.stats)
+
     def extract_with_all_methods(self, pdf_path: str) -> Dict:
         """Prueba todos los métodos y compara resultados"""
         results = {}
 
-        for method in self.extraction_methods:
-            method_name = method.__name__
-            try:
-                with st.spinner(f"Probando {method_name}..."):
-                    tables = method(pdf_path)
-                    if tables:
-                        df = self.process_tables(tables)
-                        results[method_name] = {
-                            'success': True,
-                            'tables_found': len(tables),
-                            'rows': len(df) if df is not None else 0,
-                            'data': df,
-                            'accuracy': self.calculate_accuracy(tables)
-                        }
-                    else:
-                        results[method_name] = {'success': False}
-            except Exception as e:
-                results[method_name] = {'success': False, 'error': str(e)}
+        with self.layout_scope(pdf_path):
+            for method in self.extraction_methods:
+                method_name = method.__name__
+                self.events.emit('method_started', f"Probando {method_name}...", method=method_name)
+                results[method_name] = self.run_method(pdf_path, method_name)
+                self.events.emit('method_finished', f"{method_name} terminado", method=method_name,
+                                 success=bool(results[method_name].get('success')))
+
+        return results
+
+    def extract_adaptive(self, pdf_path: str, min_completeness: float = 99.0,
+                         max_discrepancies: int = 0) -> Dict:
+        """
+        Modo adaptativo: ejecuta los métodos en orden de prioridad y se detiene
+        en el primero cuyo resultado supera el umbral de calidad.
+
+        Umbral: completitud de slips >= min_completeness (%) y como mucho
+        max_discrepancies discrepancias en validate_tablets_integrity. La
+        completitud se mide contra los slips de la capa de texto del PDF
+        (expected_slips): un método que pierde filas no supera el umbral.
+        Si ningún método lo supera, el resultado equivale al modo completo.
+        """
+        results = {}
+        pending = [method.__name__ for method in self.extraction_methods]
+
+        with self.layout_scope(pdf_path):
+            while pending:
+                method_name = pending.pop(0)
+                self.events.emit('method_started', f"Probando {method_name}...", method=method_name)
+                result = self.run_method(pdf_path, method_name)
+                self.events.emit('method_finished', f"{method_name} terminado", method=method_name,
+                                 success=bool(result.get('success')))
+
+                if result.get('success') and result.get('data') is not None and len(result['data']) > 0:
+                    quality = self.score_extraction(result['data'], self.expected_slips(pdf_path))
+                    result['quality'] = quality
+                    result['passed_quality'] = (quality['completeness'] >= min_completeness and
+                                                quality['discrepancies'] <= max_discrepancies)
+
+                results[method_name] = result
+
+                if result.get('passed_quality'):
+                    if pending:
+                        self.events.emit('quality_passed',
+                                         f"{method_name} cumple el umbral de calidad: "
+                                         f"se omiten {len(pending)} métodos",
+                                         method=method_name, skipped=len(pending))
+                    break
+
+        return results
+
+    def extract_with_all_methods_parallel(self, pdf_path: str, max_workers: Optional[int] = None) -> Dict:
+        """
+        Ejecuta los métodos en paralelo, uno por proceso worker.
+
+        Cada método es un parse completo de camelot (CPU-bound), así que la
+        latencia se acerca a la del método más lento en vez de a la suma.
+        Devuelve el mismo dict de resultados que extract_with_all_methods,
+        en el mismo orden de prioridad.
+        """
+        method_names = [method.__name__ for method in self.extraction_methods]
+        if max_workers is None:
+            max_workers = min(len(method_names), os.cpu_count() or 1)
+        max_workers = max(1, min(max_workers, len(method_names)))
+
+        completed = {}
+        self.events.emit('methods_progress',
+                         f"Ejecutando {len(method_names)} métodos en {max_workers} procesos...",
+                         completed=0, total=len(method_names))
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=_get_process_pool_context()) as executor:
+                profile = active_stage_profiler() is not None
+                page_scan = self.scan_pages(pdf_path)
+                template = self.layout_template(pdf_path)
+                futures = {executor.submit(_run_extraction_method, pdf_path, name,
+                                           self.worker_options(), profile, page_scan, template): name
+                           for name in method_names}
+
+                for future in as_completed(futures):
+                    method_name = futures[future]
+                    try:
+                        completed[method_name] = future.result()
+                    except Exception as e:
+                        completed[method_name] = {'success': False, 'error': str(e)}
+
+                    worker_stages = completed[method_name].pop('profile', None)
+                    if worker_stages and active_stage_profiler() is not None:
+                        active_stage_profiler().merge(worker_stages)
+
+                    self.events.emit('methods_progress',
+                                     f"{method_name} terminado ({len(completed)}/{len(method_names)})",
+                                     completed=len(completed), total=len(method_names))
+        except Exception as e:
+            self.events.emit('error', f"Error en ejecución paralela: {e}")
+
+        results = {}
+        for method_name in method_names:
+            result = completed.get(method_name, {'success': False, 'error': 'No ejecutado'})
+            if result.get('success') and result.get('data') is not None and not result.get('cached'):
+                # Los eventos de los workers no llegan al proceso principal: validar aquí
+                self.validate_simple(result['data'])
+            results[method_name] = result
 
         return results
 
@@ -101,77 +1187,81 @@ class CamelotExtractorPro:
         - Columna 12 (Tablets): números sin sufijos
         - Columna 14 (Open): números CON sufijos [MALT]
         """
+        return self._merge_continuation_rows(df, tokenize_table(df))[0]
+
+    @profiled('merge_continuation_rows')
+    def _merge_continuation_rows(self, df: pd.DataFrame,
+                                 tokens: TableTokens) -> Tuple[pd.DataFrame, List[int]]:
+        """
+        Implementación de merge_continuation_rows sobre los tokens de la tabla.
+        Devuelve también la posición original de cada fila resultante.
+        """
         try:
-            merged_rows = []
+            if df.empty:
+                return df, []
+
+            cells = df.to_numpy(dtype=object).copy()
+            n_rows, n_cols = cells.shape
+            kept_rows = []
             skip_next = False
 
-            for idx in range(len(df)):
+            for idx in range(n_rows):
                 if skip_next:
                     skip_next = False
                     continue
 
-                row = df.iloc[idx:idx+1].copy()
-                row_text = ' '.join(str(cell) for cell in row.iloc[0].values if pd.notna(cell))
-
-                if re.search(r'7290000\d{5}', row_text):
+                if tokens.has_slip[idx]:
                     continuation_found = False
+                    next_is_continuation = idx + 1 < n_rows and not tokens.has_slip[idx + 1]
 
                     # CASO 1: TABLETS (col 12)
-                    if len(row.columns) > 12:
-                        current_tablets = str(row.iloc[0, 12]).strip()
+                    if n_cols > 12:
+                        current_tablets = str(cells[idx, 12]).strip()
 
-                        if current_tablets.endswith(',') and idx + 1 < len(df):
-                            next_row = df.iloc[idx + 1]
-                            next_text = ' '.join(str(cell) for cell in next_row.values if pd.notna(cell))
+                        if current_tablets.endswith(',') and next_is_continuation:
+                            found_numbers = tokens.row_numbers(idx + 1)
 
-                            if not re.search(r'7290000\d{5}', next_text):
-                                found_numbers = re.findall(r'\b\d{2,4}\b', next_text)
-
-                                if found_numbers:
-                                    numbers_str = ', '.join(found_numbers)
-                                    row.iloc[0, 12] = current_tablets + ' ' + numbers_str
-                                    continuation_found = True
+                            if found_numbers:
+                                numbers_str = ', '.join(found_numbers)
+                                cells[idx, 12] = current_tablets + ' ' + numbers_str
+                                continuation_found = True
 
                     # CASO 2: OPEN (col 14)
-                    if len(row.columns) > 14:
-                        current_open = str(row.iloc[0, 14]).strip()
-
-                        if current_open.endswith(',') and idx + 1 < len(df):
-                            next_row = df.iloc[idx + 1]
-                            next_text = ' '.join(str(cell) for cell in next_row.values if pd.notna(cell))
+                    if n_cols > 14:
+                        current_open = str(cells[idx, 14]).strip()
 
-                            if not re.search(r'7290000\d{5}', next_text):
-                                found_codes = re.findall(r'\d{2,4}[MALT]', next_text)
+                        if current_open.endswith(',') and next_is_continuation:
+                            found_codes = tokens.row_open_codes(idx + 1)
 
-                                if found_codes:
-                                    codes_str = ', '.join(found_codes)
-                                    row.iloc[0, 14] = current_open + ' ' + codes_str
-                                    continuation_found = True
+                            if found_codes:
+                                codes_str = ', '.join(found_codes)
+                                cells[idx, 14] = current_open + ' ' + codes_str
+                                continuation_found = True
 
                     if continuation_found:
                         skip_next = True
 
                     # Limpiar comas finales
-                    if len(row.columns) > 12:
-                        tablets_value = str(row.iloc[0, 12]).strip()
+                    if n_cols > 12:
+                        tablets_value = str(cells[idx, 12]).strip()
                         if tablets_value.endswith(','):
-                            row.iloc[0, 12] = tablets_value.rstrip(',').strip()
+                            cells[idx, 12] = tablets_value.rstrip(',').strip()
 
-                    if len(row.columns) > 14:
-                        open_value = str(row.iloc[0, 14]).strip()
+                    if n_cols > 14:
+                        open_value = str(cells[idx, 14]).strip()
                         if open_value.endswith(','):
-                            row.iloc[0, 14] = open_value.rstrip(',').strip()
+                            cells[idx, 14] = open_value.rstrip(',').strip()
 
-                merged_rows.append(row)
+                kept_rows.append(idx)
 
-            if merged_rows:
-                return pd.concat(merged_rows, ignore_index=True)
-            return df
+            merged = pd.DataFrame(cells[kept_rows], columns=df.columns).astype(df.dtypes.to_dict())
+            return merged, kept_rows
 
         except Exception as e:
-            st.error(f"Error en merge_continuation_rows: {e}")
-            return df
+            self.events.emit('error', f"Error en merge_continuation_rows: {e}")
+            return df, list(range(len(df)))
 
+    @profiled()
     def fix_missing_open_column(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """
         CRÍTICO: Corrige desplazamiento cuando columna Open está completamente vacía.
@@ -236,6 +1326,7 @@ class CamelotExtractorPro:
         except Exception as e:
             return row_data
 
+    @profiled()
     def clean_open_tablets_when_closed(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Limpia Open_Tablets cuando el albarán está cerrado (función legacy, ahora manejada por fix_missing_open_column)"""
         try:
@@ -256,6 +1347,7 @@ class CamelotExtractorPro:
         except:
             return row_data
 
+    @profiled()
     def ensure_18_columns(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Asegura 18 columnas"""
         try:
@@ -267,6 +1359,7 @@ class CamelotExtractorPro:
         except:
             return row_data
 
+    @profiled()
     def fix_multiline_first_column(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """
         CRÍTICO: Detecta cuando col 0 tiene múltiples valores con saltos de línea
@@ -284,32 +1377,7 @@ class CamelotExtractorPro:
             
             # Detectar si tiene saltos de línea Y contiene slip number
             if '\n' in first_cell and re.search(r'7290000\d{5}', first_cell):
-                # Separar por saltos de línea
-                lines = [line.strip() for line in first_cell.split('\n') if line.strip()]
-                
-                # Extraer valores específicos
-                fl_value = 'FL'  # Default
-                wh_value = ''
-                slip_value = ''
-                
-                for line in lines:
-                    # 1. Buscar estado (FL, DL, TX, etc.)
-                    if line in ['FL', 'DL', 'TX', 'CA', 'NY', 'GA', 'NC', 'SC', 'VA']:
-                        fl_value = line
-                        continue
-                    
-                    # 2. Buscar slip number (SIEMPRE 12 dígitos)
-                    slip_match = re.match(r'^(7290000\d{5})$', line)
-                    if slip_match:
-                        slip_value = slip_match.group(1)
-                        continue
-                    
-                    # 3. Buscar warehouse (NO es slip Y tiene <= 10 caracteres)
-                    if len(line) <= 10:
-                        # Verificar que sea alfanumérico o tenga formato RO-XX
-                        if re.match(r'^(RO-[A-Z]{2}|[\dA-Za-z]+)$', line, re.IGNORECASE):
-                            wh_value = line.upper()
-                            continue
+                fl_value, wh_value, slip_value = self._parse_multiline_first_cell(first_cell)
                 
                 # Solo proceder si encontramos slip number
                 if slip_value:
@@ -332,12 +1400,45 @@ class CamelotExtractorPro:
             return row_data
         
         except Exception as e:
-            st.error(f"Error en fix_multiline_first_column: {e}")
             import traceback
-            st.error(traceback.format_exc())
+            self.events.emit('error', f"Error en fix_multiline_first_column: {e}",
+                             detail=traceback.format_exc())
             return row_data
     
     
+    @staticmethod
+    def _parse_multiline_first_cell(first_cell: str) -> Tuple[str, str, str]:
+        """Separa una celda "FL\\n612d\\n729000018873" en (estado, warehouse, slip)"""
+        # Separar por saltos de línea
+        lines = [line.strip() for line in first_cell.split('\n') if line.strip()]
+        
+        # Extraer valores específicos
+        fl_value = 'FL'  # Default
+        wh_value = ''
+        slip_value = ''
+        
+        for line in lines:
+            # 1. Buscar estado (FL, DL, TX, etc.)
+            if line in ['FL', 'DL', 'TX', 'CA', 'NY', 'GA', 'NC', 'SC', 'VA']:
+                fl_value = line
+                continue
+            
+            # 2. Buscar slip number (SIEMPRE 12 dígitos)
+            slip_match = re.match(r'^(7290000\d{5})$', line)
+            if slip_match:
+                slip_value = slip_match.group(1)
+                continue
+            
+            # 3. Buscar warehouse (NO es slip Y tiene <= 10 caracteres)
+            if len(line) <= 10:
+                # Verificar que sea alfanumérico o tenga formato RO-XX
+                if re.match(r'^(RO-[A-Z]{2}|[\dA-Za-z]+)$', line, re.IGNORECASE):
+                    wh_value = line.upper()
+                    continue
+        
+        return fl_value, wh_value, slip_value
+
+    @profiled()
     def clean_warehouse_slip_column(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Separa warehouse code y slip number"""
         try:
@@ -382,6 +1483,7 @@ class CamelotExtractorPro:
         except:
             return row_data
 
+    @profiled()
     def fix_customer_definitive_split(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Separa customer name de definitive"""
         try:
@@ -430,6 +1532,7 @@ class CamelotExtractorPro:
         except:
             return row_data
 
+    @profiled()
     def fix_column_shift_after_definitive(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Corrige desplazamiento cuando Definitive=No"""
         try:
@@ -458,6 +1561,7 @@ class CamelotExtractorPro:
         except:
             return row_data
 
+    @profiled()
     def fix_tablets_total_split(self, row_data: pd.DataFrame) -> pd.DataFrame:
         """Separa Total de Open"""
         try:
@@ -489,101 +1593,564 @@ class CamelotExtractorPro:
             return row_data
 
     # ========================================================================
-    # MÉTODOS DE EXTRACCIÓN
+    # MOTOR VECTORIZADO DE CORRECCIONES
     # ========================================================================
+    # Mismas 8 correcciones que el pipeline fila a fila, aplicadas a todas las
+    # filas de una página con máscaras booleanas, str.extract/str.contains y
+    # desplazamientos de bloques de columnas sobre una matriz numpy.
+    # La salida debe ser idéntica a la de process_tables(engine='rows').
 
-    def method_lattice_standard(self, pdf_path: str):
-        try:
-            return camelot.read_pdf(pdf_path, pages='all', flavor='lattice',
-                                   process_background=True, line_scale=40)
-        except:
-            return None
+    DEFINITIVE_YES = ['Yes', 'Ye', 'yes', 'ye', 'YES', 'YE']
 
-    def method_stream_balanced(self, pdf_path: str):
-        try:
-            return camelot.read_pdf(pdf_path, pages='all', flavor='stream',
-                                   edge_tol=350, row_tol=12, column_tol=5)
-        except:
-            return None
+    def apply_corrections_vectorized(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Aplica las 8 correcciones a un DataFrame de página completo"""
+        if df.empty:
+            return df
 
-    def method_stream_standard(self, pdf_path: str):
-        try:
-            return camelot.read_pdf(pdf_path, pages='all', flavor='stream')
-        except:
-            return None
+        df = self.ensure_18_columns(df.copy())
+        cells = df.to_numpy(dtype=object).copy()
 
-    def method_stream_aggressive(self, pdf_path: str):
-        try:
-            return camelot.read_pdf(pdf_path, pages='all', flavor='stream',
-                                   edge_tol=500, row_tol=10, column_tol=0,
-                                   split_text=True, flag_size=True)
-        except:
-            return None
+        self._vec_fix_multiline_first_column(cells)
+        self._vec_clean_warehouse_slip_column(cells)
+        self._vec_fix_customer_definitive_split(cells)
+        self._vec_fix_column_shift_after_definitive(cells)
+        self._vec_fix_tablets_total_split(cells)
+        self._vec_fix_missing_open_column(cells)
+        self._vec_clean_open_tablets_when_closed(cells)
 
-    def method_lattice_detailed(self, pdf_path: str):
-        try:
-            return camelot.read_pdf(pdf_path, pages='all', flavor='lattice',
-                                   process_background=True, line_scale=40, iterations=2)
+        return pd.DataFrame(cells, index=df.index, columns=df.columns).astype(df.dtypes.to_dict())
+
+    @staticmethod
+    def _vec_col(cells: np.ndarray, col_idx: int, strip: bool = True) -> pd.Series:
+        col = pd.Series(cells[:, col_idx], dtype=object)
+        return col.str.strip() if strip else col
+
+    @staticmethod
+    def _vec_set(cells: np.ndarray, mask, col_idx: int, values):
+        rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+        if len(rows) == 0:
+            return
+        if isinstance(values, pd.Series):
+            values = values.to_numpy(dtype=object)[rows]
+        cells[rows, col_idx] = values
+
+    @staticmethod
+    def _vec_shift_right(cells: np.ndarray, mask, src_start: int, dst_start: int):
+        """Equivale a guardar cols src_start..17 y reescribirlas desde dst_start"""
+        rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+        n_cols = cells.shape[1]
+        saved = cells[np.ix_(rows, np.arange(src_start, min(18, n_cols)))]
+        width = min(saved.shape[1], n_cols - dst_start)
+        if len(rows) and width > 0:
+            cells[np.ix_(rows, np.arange(dst_start, dst_start + width))] = saved[:, :width]
+
+    @staticmethod
+    def _is_small_number(value: str) -> bool:
+        try:
+            return value.isdigit() and int(value) <= 5
+        except ValueError:
+            return False
+
+    @profiled('fix_multiline_first_column')
+    def _vec_fix_multiline_first_column(self, cells: np.ndarray):
+        first = self._vec_col(cells, 0)
+        candidates = first.str.contains('\n', regex=False) & first.str.contains(r'7290000\d{5}')
+
+        parsed = {idx: self._parse_multiline_first_cell(first[idx])
+                  for idx in np.flatnonzero(candidates)}
+        rows = [idx for idx, (_, _, slip_value) in parsed.items() if slip_value]
+        if not rows:
+            return
+
+        mask = np.zeros(len(cells), dtype=bool)
+        mask[rows] = True
+        self._vec_shift_right(cells, mask, 1, 3)
+        for idx in rows:
+            fl_value, wh_value, slip_value = parsed[idx]
+            cells[idx, 0] = fl_value
+            cells[idx, 1] = wh_value if wh_value else '612D'
+            cells[idx, 2] = slip_value
+
+    @profiled('clean_warehouse_slip_column')
+    def _vec_clean_warehouse_slip_column(self, cells: np.ndarray):
+        pattern = r'^(RO-[A-Z]{2}|\d+[A-Za-z]*)\s+(7290000\d{5})'
+        empty_1 = self._vec_col(cells, 1).isin(['', 'nan']).to_numpy()
+        empty_2 = self._vec_col(cells, 2).isin(['', 'nan']).to_numpy()
+        handled = np.zeros(len(cells), dtype=bool)
+
+        for col_idx in [1, 2, 3]:
+            match = self._vec_col(cells, col_idx).str.extract(pattern)
+            hit = match[0].notna().to_numpy() & ~handled
+            warehouse_code = match[0].str.upper()
+            slip_number = match[1]
+
+            if col_idx == 1:
+                self._vec_set(cells, hit, 1, warehouse_code)
+                self._vec_set(cells, hit, 2, slip_number)
+            elif col_idx == 2:
+                self._vec_set(cells, hit & empty_1, 1, warehouse_code)
+                self._vec_set(cells, hit, 2, slip_number)
+            else:
+                self._vec_set(cells, hit & empty_1, 1, warehouse_code)
+                self._vec_set(cells, hit & empty_2, 2, slip_number)
+            handled |= hit
+
+        for col_idx in [1, 2]:
+            cell_value = self._vec_col(cells, col_idx, strip=False)
+            hit = cell_value.str.contains(r'(?:RO-[A-Za-z]{2}|\d+[A-Za-z]+)', flags=re.IGNORECASE).to_numpy()
+            self._vec_set(cells, hit & ~handled, col_idx, cell_value.str.upper())
+
+    @profiled('fix_customer_definitive_split')
+    def _vec_fix_customer_definitive_split(self, cells: np.ndarray):
+        double_pattern = r'^(.+?)\s+(No|Yes|Ye)\s+(No|Yes|Ye)\s*$'
+        single_pattern = r'^(.+?)\s+(No|Yes|Ye)\s*$'
+        original = {col_idx: self._vec_col(cells, col_idx) for col_idx in [8, 9, 10]}
+        definitive_empty = original[10].isin(['', 'nan']).to_numpy()
+        handled = np.zeros(len(cells), dtype=bool)
+
+        for col_idx in [8, 9, 10]:
+            match = original[col_idx].str.extract(double_pattern)
+            hit = match[0].notna().to_numpy() & ~handled
+            self._vec_set(cells, hit, col_idx, match[0].str.strip() + " " + match[1])
+            if col_idx != 10:
+                self._vec_set(cells, hit & definitive_empty, 10, match[2])
+            handled |= hit
+
+            if col_idx in [8, 9]:
+                match = original[col_idx].str.extract(single_pattern)
+                hit = match[0].notna().to_numpy() & definitive_empty & ~handled
+                self._vec_set(cells, hit, col_idx, match[0].str.strip())
+                self._vec_set(cells, hit, 10, match[1])
+                handled |= hit
+
+    @profiled('fix_column_shift_after_definitive')
+    def _vec_fix_column_shift_after_definitive(self, cells: np.ndarray):
+        definitive = self._vec_col(cells, 10)
+        counted_date = self._vec_col(cells, 11)
+        hit = (definitive.isin(['No', 'no', 'NO']) &
+               ~counted_date.str.match(r'^\d{1,2}/\d{1,2}/\d{4}$') &
+               ~counted_date.isin(['', 'nan'])).to_numpy()
+
+        self._vec_shift_right(cells, hit, 11, 12)
+        self._vec_set(cells, hit, 11, '')
+
+    @profiled('fix_tablets_total_split')
+    def _vec_fix_tablets_total_split(self, cells: np.ndarray):
+        match = self._vec_col(cells, 13).str.extract(r'^(\d+)\s+([\d\s,]+[MALT].*)$')
+        hit = match[0].notna().to_numpy()
+
+        self._vec_shift_right(cells, hit, 14, 15)
+        self._vec_set(cells, hit, 13, match[0])
+        self._vec_set(cells, hit, 14, match[1].str.strip())
+
+    @profiled('fix_missing_open_column')
+    def _vec_fix_missing_open_column(self, cells: np.ndarray):
+        definitive = self._vec_col(cells, 10)
+        counted_date = self._vec_col(cells, 11)
+        col_14 = self._vec_col(cells, 14)
+
+        is_closed = (definitive.isin(self.DEFINITIVE_YES) &
+                     ~counted_date.isin(['', 'nan', 'None'])).to_numpy()
+        has_malt_codes = col_14.str.contains(r'\d+[MALT]').to_numpy()
+        is_simple_number = (col_14.str.isdigit() & (col_14.str.len() <= 3)).to_numpy()
+
+        shift = is_closed & ~has_malt_codes & is_simple_number
+        small = (is_closed & ~shift & ~has_malt_codes & (col_14 != '').to_numpy() &
+                 col_14.map(self._is_small_number).to_numpy(dtype=bool))
+
+        self._vec_shift_right(cells, shift, 14, 15)
+        self._vec_set(cells, shift | small, 14, '')
+
+    @profiled('clean_open_tablets_when_closed')
+    def _vec_clean_open_tablets_when_closed(self, cells: np.ndarray):
+        definitive = self._vec_col(cells, 10)
+        counted_date = self._vec_col(cells, 11)
+        open_tablets = self._vec_col(cells, 14)
+
+        hit = (definitive.isin(self.DEFINITIVE_YES) &
+               ~counted_date.isin(['', 'nan']) &
+               (open_tablets != '') &
+               ~open_tablets.str.contains(r'[MALT]') &
+               open_tablets.map(self._is_small_number).astype(bool)).to_numpy()
+
+        self._vec_set(cells, hit, 14, '')
+
+    # ========================================================================
+    # CORRECCIONES CON PLANTILLA
+    # ========================================================================
+    # Con las columnas de la plantilla no hay desplazamientos que deshacer:
+    # fix_column_shift_after_definitive, fix_tablets_total_split y
+    # fix_missing_open_column no aplican. Lo que stream desplazaba llega en su
+    # columna pero repartido en filas, y se pliega antes de unir continuaciones.
+
+    @profiled()
+    def fold_template_cells(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Pliega en su fila los valores que la plantilla deja partidos:
+        - Estado / warehouse / slip apilados: una línea por fila en col 0
+        - Total y Open juntos ("8 1082A, ..."): empiezan en la columna Total
+        """
+        if df.empty or df.shape[1] < 18:
+            return df
+
+        cells = df.to_numpy(dtype=object).copy()
+        n_rows = len(cells)
+        for idx in range(n_rows):
+            first = str(cells[idx, 0]).strip()
+            if first and not str(cells[idx, 1]).strip() and not str(cells[idx, 2]).strip():
+                stacked = [idx]
+                while (len(stacked) < 3 and stacked[-1] + 1 < n_rows
+                       and not SLIP_RE.fullmatch(str(cells[stacked[-1], 0]).strip())
+                       and str(cells[stacked[-1] + 1, 0]).strip()):
+                    stacked.append(stacked[-1] + 1)
+
+                lines = '\n'.join(str(cells[row, 0]).strip() for row in stacked)
+                fl_value, wh_value, slip_value = self._parse_multiline_first_cell(lines)
+                if slip_value:
+                    cells[idx, 0], cells[idx, 1], cells[idx, 2] = fl_value, wh_value, slip_value
+                    for row in stacked[1:]:
+                        cells[row, 0] = ''
+
+            match = re.match(r'^(\d+)\s+([\d\s,]+[MALT].*)$', str(cells[idx, 13]).strip())
+            if match and not str(cells[idx, 14]).strip():
+                cells[idx, 13] = match.group(1)
+                cells[idx, 14] = match.group(2).strip()
+
+        return pd.DataFrame(cells, index=df.index, columns=df.columns)
+
+    def apply_template_corrections(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Correcciones de contenido (sin desplazar columnas) de las filas de una tabla con plantilla"""
+        df = self.ensure_18_columns(df.copy())
+
+        if self.correction_engine == 'vectorized':
+            cells = df.to_numpy(dtype=object).copy()
+            self._vec_clean_warehouse_slip_column(cells)
+            self._vec_fix_customer_definitive_split(cells)
+            return pd.DataFrame(cells, index=df.index, columns=df.columns).astype(df.dtypes.to_dict())
+
+        page_data = []
+        for idx in range(len(df)):
+            row_data = df.iloc[idx:idx+1].copy()
+            row_data = self.clean_warehouse_slip_column(row_data)
+            row_data = self.fix_customer_definitive_split(row_data)
+            page_data.append(row_data)
+        return pd.concat(page_data)
+
+    # ========================================================================
+    # MÉTODOS DE EXTRACCIÓN
+    # ========================================================================
+
+    def method_lattice_standard(self, pdf_path: str, pages: str = 'all'):
+        try:
+            return read_camelot_pass(pdf_path, pages, self.camelot_params(pdf_path, 'method_lattice_standard')) or None
+        except:
+            return None
+
+    def method_stream_balanced(self, pdf_path: str, pages: str = 'all'):
+        try:
+            return read_camelot_pass(pdf_path, pages, self.camelot_params(pdf_path, 'method_stream_balanced')) or None
+        except:
+            return None
+
+    def method_stream_standard(self, pdf_path: str, pages: str = 'all'):
+        try:
+            return read_camelot_pass(pdf_path, pages, self.camelot_params(pdf_path, 'method_stream_standard')) or None
+        except:
+            return None
+
+    def method_stream_aggressive(self, pdf_path: str, pages: str = 'all'):
+        try:
+            return read_camelot_pass(pdf_path, pages, self.camelot_params(pdf_path, 'method_stream_aggressive')) or None
+        except:
+            return None
+
+    def method_lattice_detailed(self, pdf_path: str, pages: str = 'all'):
+        try:
+            return read_camelot_pass(pdf_path, pages, self.camelot_params(pdf_path, 'method_lattice_detailed')) or None
         except:
             return None
 
-    def method_hybrid(self, pdf_path: str):
+    def method_hybrid(self, pdf_path: str, pages: str = 'all'):
         all_tables = []
+        for params in self.camelot_params(pdf_path, 'method_hybrid'):
+            try:
+                tables = read_camelot_pass(pdf_path, pages, params)
+                if tables:
+                    all_tables.extend(tables)
+            except:
+                pass
+        return all_tables if all_tables else None
+
+    def method_stream_template(self, pdf_path: str, pages: str = 'all'):
+        """camelot stream con las columnas y el área de la plantilla del documento"""
+        params = self.camelot_params(pdf_path, 'method_stream_template')
+        if params is None:
+            return None
         try:
-            stream_tables = camelot.read_pdf(pdf_path, pages='all', flavor='stream', edge_tol=500)
-            if stream_tables:
-                all_tables.extend(stream_tables)
+            tables = camelot.read_pdf(pdf_path, pages=pages, **params)
+            return [TemplateTable(t.df, getattr(t, 'accuracy', 0), getattr(t, 'page', None))
+                    for t in tables] or None
         except:
-            pass
+            return None
+
+    def method_native_words(self, pdf_path: str, pages: str = 'all'):
+        """Motor nativo por coordenadas de palabras (sin camelot), ver read_word_tables"""
         try:
-            lattice_tables = camelot.read_pdf(pdf_path, pages='all', flavor='lattice')
-            if lattice_tables:
-                all_tables.extend(lattice_tables)
+            return read_word_tables(pdf_path, pages=pages) or None
         except:
-            pass
+            return None
+
+    def get_page_count(self, pdf_path: str) -> int:
+        """Número de páginas del PDF"""
+        return len(PdfReader(pdf_path).pages)
+
+    def scan_pages(self, pdf_path: str) -> Dict:
+        """
+        Páginas que leen los métodos: las que prescan_data_pages marca con
+        datos (o todas si prescan está desactivado). Se calcula una vez por
+        documento y se publica como evento 'pages_scanned'.
+        """
+        if pdf_path in self.page_scans:
+            return self.page_scans[pdf_path]
+
+        if self.prescan:
+            scan = prescan_data_pages(pdf_path)
+        else:
+            page_count = self.get_page_count(pdf_path)
+            scan = {'pages': 'all', 'data_pages': list(range(1, page_count + 1)),
+                    'page_count': page_count, 'skipped': 0, 'seconds': 0.0}
+        self.page_scans[pdf_path] = scan
+
+        if self.prescan:
+            self.events.emit('pages_scanned',
+                             f"Pre-escaneo: {len(scan['data_pages'])} de {scan['page_count']} páginas con "
+                             f"albaranes, {scan['skipped']} omitidas ({scan['seconds']:.2f}s)",
+                             page_count=scan['page_count'], skipped=scan['skipped'],
+                             seconds=scan['seconds'])
+        return scan
+
+    def expected_slips(self, pdf_path: str) -> frozenset:
+        """Slips distintos de la capa de texto (los del pre-escaneo; se leen aquí si prescan está desactivado)"""
+        scan = self.scan_pages(pdf_path)
+        if 'slips' not in scan:
+            scan['slips'] = prescan_data_pages(pdf_path)['slips']
+        return scan['slips']
+
+    def layout_template(self, pdf_path: str) -> Optional[Dict]:
+        """
+        Plantilla de layout del documento: la guardada para su formato de
+        reporte (acierto) o la aprendida de la primera página de datos
+        (fallo, y se guarda). Se resuelve una vez por documento y se publica
+        como evento 'layout_template'.
+        """
+        if pdf_path in self.layout_templates:
+            return self.layout_templates[pdf_path]
+
+        learned = learn_layout_template(pdf_path, pages=self.scan_pages(pdf_path)['pages'])
+        template = learned
+        if learned is None:
+            logger.info(f"Plantilla de layout: sin encabezado reconocible en {os.path.basename(pdf_path)}")
+        else:
+            stored = self.template_store.get(learned['signature']) if self.template_store else None
+            hit = stored is not None
+            if hit:
+                template = stored
+                self.template_stats['hits'] += 1
+            else:
+                self.template_stats['misses'] += 1
+                if self.template_store is not None:
+                    self.template_store.put(learned)
+
+            message = (f"Plantilla de layout {template['signature']}: "
+                       + ("reutilizada del almacén" if hit else f"aprendida de la página {template['page']}"))
+            logger.info(message)
+            self.events.emit('layout_template', message, signature=template['signature'], hit=hit)
+
+        self.layout_templates[pdf_path] = template
+        return template
+
+    def camelot_params(self, pdf_path: str, method_name: str):
+        """
+        Parámetros camelot del método para este documento: los de la plantilla
+        en method_stream_template y la resolución de render en las pasadas lattice
+        """
+        if method_name == 'method_stream_template':
+            template = self.layout_template(pdf_path)
+            if template is None:
+                return None
+            return dict(self.TEMPLATE_PARAMS, columns=[template['columns']], table_areas=[template['table_area']])
+
+        params = self.CAMELOT_PARAMS.get(method_name)
+        if isinstance(params, list):
+            return [self._lattice_render_params(p) for p in params]
+        return self._lattice_render_params(params) if params is not None else None
+
+    def _lattice_render_params(self, params: Dict) -> Dict:
+        if params.get('flavor') != 'lattice':
+            return params
+        return dict(params, resolution=self.lattice_resolution, draft_resolution=self.lattice_draft_resolution)
+
+    def read_tables_sharded(self, pdf_path: str, method_name: str) -> Optional[List]:
+        """
+        Ejecuta un método sobre bloques de páginas en un pool de procesos.
+
+        Cada pasada camelot del método (method_hybrid tiene dos) se divide en
+        rangos de shard_size páginas. Las tablas se reensamblan por pasada y
+        por orden de página, igual que en la llamada única con pages='all'.
+        Si un bloque falla, se descarta su pasada completa (como en serie).
+        """
+        params = self.camelot_params(pdf_path, method_name)
+        passes = params if isinstance(params, list) else [params]
+
+        data_pages = self.scan_pages(pdf_path)['data_pages']
+        shards = [format_page_ranges(data_pages[start:start + self.shard_size])
+                  for start in range(0, len(data_pages), self.shard_size)]
+
+        tasks = [(pass_idx, shard_idx) for pass_idx in range(len(passes))
+                 for shard_idx in range(len(shards))]
+        max_workers = self.max_workers or os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, len(tasks)))
+
+        shard_tables = {}
+        failed_passes = set()
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=_get_process_pool_context()) as executor:
+            futures = {executor.submit(_read_pdf_shard, pdf_path, shards[shard_idx], passes[pass_idx]):
+                       (pass_idx, shard_idx) for pass_idx, shard_idx in tasks}
+
+            for future in as_completed(futures):
+                pass_idx, shard_idx = futures[future]
+                try:
+                    shard_tables[(pass_idx, shard_idx)] = future.result()
+                except Exception:
+                    failed_passes.add(pass_idx)
+
+        all_tables = []
+        for pass_idx in range(len(passes)):
+            if pass_idx in failed_passes:
+                continue
+            for shard_idx in range(len(shards)):
+                all_tables.extend(shard_tables[(pass_idx, shard_idx)])
+
         return all_tables if all_tables else None
 
+    def iter_page_rows(self, pdf_path: str, method_name: str = 'method_stream_standard',
+                       page_window: int = STREAM_PAGE_WINDOW) -> Iterator[PageRows]:
+        """
+        Extracción progresiva: ejecuta el método sobre ventanas de page_window
+        páginas y devuelve, página a página, sus filas corregidas con el
+        esquema tipado.
+
+        Las correcciones son locales a cada página: en los métodos de una
+        pasada, el resultado concatenado tiene las mismas filas que
+        process_tables sobre el documento completo. method_hybrid intercala
+        sus dos pasadas por ventana, así que sus filas salen en otro orden.
+        """
+        page_count = self.get_page_count(pdf_path)
+        self.events.emit('pages_detected', f"PDF detectado con {page_count} páginas", pages=page_count)
+        method = getattr(self, method_name)
+        data_pages = self.scan_pages(pdf_path)['data_pages']
+
+        for start in range(0, len(data_pages), page_window):
+            window = data_pages[start:start + page_window]
+            with profile_stage('camelot_parse'):
+                tables = method(pdf_path, pages=format_page_ranges(window))
+
+            for offset, table in enumerate(tables or []):
+                page = int(getattr(table, 'page', None) or window[min(offset, len(window) - 1)])
+                try:
+                    with profile_stage('process_tables'):
+                        rows = self.process_page(table, page)
+                except Exception as e:
+                    self.events.emit('error', f"Error procesando página {page}: {e}")
+                    rows = None
+                if rows is None:
+                    yield PageRows(page, page_count, None, getattr(table, 'accuracy', 0))
+                else:
+                    yield PageRows(page, page_count, normalize_schema(rows), getattr(table, 'accuracy', 0),
+                                   int(rows.memory_usage(deep=True).sum()))
+            # La ventana se libera antes de leer la siguiente
+            del tables
+
+    def extract_streaming(self, pdf_path: str, method_name: str = 'method_stream_standard',
+                          page_window: int = STREAM_PAGE_WINDOW) -> Dict:
+        """
+        Consume iter_page_rows publicando cada página como evento 'page_rows'
+        y devuelve un dict de resultado como el de run_method (con caché).
+
+        La entrada de caché es propia del modo progresivo y de page_window:
+        el orden de filas de method_hybrid depende de las ventanas, y una
+        entrada compartida serviría ese orden a run_method.
+        """
+        cache_key = None
+        if self.cache is not None:
+            try:
+                cache_key = self.cache.make_key(self.cache.hash_file(pdf_path), method_name,
+                                                {'params': self.camelot_params(pdf_path, method_name),
+                                                 'stream_page_window': page_window})
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    cached['cached'] = True
+                    return cached
+            except Exception:
+                cache_key = None
+
+        chunks = []
+        accuracies = []
+        slip_count = 0
+        raw_bytes = 0
+        try:
+            with profile_stage(method_name):
+                for page_rows in self.iter_page_rows(pdf_path, method_name, page_window):
+                    accuracies.append(page_rows.accuracy)
+                    if page_rows.data is not None:
+                        chunks.append(page_rows.data)
+                        raw_bytes += page_rows.raw_bytes
+                        slip_count += int(page_rows.data['Return_Slip'].notna().sum())
+                    self.events.emit('page_rows', f"Página {page_rows.page}/{page_rows.page_count}",
+                                     page=page_rows.page, page_count=page_rows.page_count,
+                                     data=page_rows.data, slip_count=slip_count)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+        if not chunks:
+            return {'success': False}
+
+        # Las categorías de cada página se unifican al concatenar
+        df = normalize_schema(pd.concat(chunks, ignore_index=True))
+        self.validate_simple(df)
+        result = {
+            'success': True,
+            'tables_found': len(accuracies),
+            'rows': len(df),
+            'data': df,
+            'accuracy': sum(accuracies) / len(accuracies)
+        }
+        result['memory'] = schema_memory_bytes(raw_bytes, int(df.memory_usage(deep=True).sum()))
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
+
     # ========================================================================
     # PROCESAMIENTO PRINCIPAL
     # ========================================================================
 
+    @profiled()
     def process_tables(self, tables) -> pd.DataFrame:
         """Procesa las tablas con todas las correcciones"""
         if not tables:
             return None
 
         all_data = []
-        st.info(f"📄 PDF detectado con {len(tables)} páginas")
+        self.events.emit('pages_detected', f"PDF detectado con {len(tables)} páginas", pages=len(tables))
 
         for i, table in enumerate(tables):
             try:
-                df = table.df
-                st.write(f"📋 Procesando página {i + 1}: {df.shape}")
-
-                df = self.merge_continuation_rows(df)
-
-                for idx in df.index:
-                    try:
-                        row_text = ' '.join(str(cell) for cell in df.iloc[idx].values if pd.notna(cell))
-
-                        if re.search(r'7290000\d{5}', row_text) and re.search(r'\b[A-Z]{2}\b', row_text):
-                            if not any(skip in row_text for skip in ['Outstanding count', 'Page',
-                                     'Return packing', 'Customer name', 'Alsina Forms']):
-                                row_data = df.iloc[idx:idx+1].copy()
-
-                                row_data = self.ensure_18_columns(row_data)
-                                row_data = self.fix_multiline_first_column(row_data)              
-                                row_data = self.clean_warehouse_slip_column(row_data)
-                                row_data = self.fix_customer_definitive_split(row_data)
-                                row_data = self.fix_column_shift_after_definitive(row_data)
-                                row_data = self.fix_tablets_total_split(row_data)
-                                row_data = self.fix_missing_open_column(row_data)  # NUEVA: Corrige desplazamiento cuando Open vacía
-                                row_data = self.clean_open_tablets_when_closed(row_data)
-                                all_data.append(row_data)
-                    except:
-                        continue
+                page_rows = self.process_page(table, i + 1)
+                if page_rows is not None:
+                    all_data.append(page_rows)
             except Exception as e:
-                st.error(f"Error procesando página {i + 1}: {e}")
+                self.events.emit('error', f"Error procesando página {i + 1}: {e}")
                 continue
 
         if all_data:
@@ -592,40 +2159,79 @@ class CamelotExtractorPro:
                 self.validate_simple(result)
                 return result
             except Exception as e:
-                st.error(f"Error combinando datos: {e}")
+                self.events.emit('error', f"Error combinando datos: {e}")
                 return None
         return None
 
-    def validate_simple(self, df: pd.DataFrame):
-        """Validación simple"""
+    def process_page(self, table, page: int) -> Optional[pd.DataFrame]:
+        """Filas de datos corregidas de una tabla (una página); None si no tiene"""
+        df = table.df
+        self.events.emit('page_processing', f"Procesando página {page}: {df.shape}",
+                         page=page, shape=df.shape)
+
+        if isinstance(table, WordTable):
+            # El motor nativo arma cada albarán completo y alineado: no hay nada que corregir
+            return df if not df.empty else None
+
+        fixed_columns = isinstance(table, TemplateTable)
+        if fixed_columns:
+            df = self.fold_template_cells(df)
+
+        tokens = tokenize_table(df)
+        df, source_rows = self._merge_continuation_rows(df, tokens)
+        # Unir continuaciones no cambia el filtro: se reutilizan los tokens
+        is_data_row = tokens.is_data_row[source_rows]
+
+        if fixed_columns:
+            data_rows = df[is_data_row]
+            return self.apply_template_corrections(data_rows) if not data_rows.empty else None
+
+        if self.correction_engine == 'vectorized':
+            data_rows = df[is_data_row]
+            return self.apply_corrections_vectorized(data_rows) if not data_rows.empty else None
+
+        page_data = []
+        for idx in df.index:
+            try:
+                if is_data_row[idx]:
+                    row_data = df.iloc[idx:idx+1].copy()
+
+                    row_data = self.ensure_18_columns(row_data)
+                    row_data = self.fix_multiline_first_column(row_data)
+                    row_data = self.clean_warehouse_slip_column(row_data)
+                    row_data = self.fix_customer_definitive_split(row_data)
+                    row_data = self.fix_column_shift_after_definitive(row_data)
+                    row_data = self.fix_tablets_total_split(row_data)
+                    row_data = self.fix_missing_open_column(row_data)  # NUEVA: Corrige desplazamiento cuando Open vacía
+                    row_data = self.clean_open_tablets_when_closed(row_data)
+                    page_data.append(row_data)
+            except:
+                continue
+
+        return pd.concat(page_data) if page_data else None
+
+    def select_data_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Filas de datos de una página (slip + estado, sin encabezados ni pies)"""
+        return df[tokenize_table(df).is_data_row]
+
+    @profiled()
+    def validate_simple(self, df: pd.DataFrame) -> Optional[Dict]:
+        """Validación simple: filas, slips válidos y completitud (publicada como evento 'validation')"""
         if df is None or df.empty:
-            st.error("❌ DataFrame vacío")
-            return
+            self.events.emit('error', "DataFrame vacío")
+            return None
 
         try:
-            st.header("🔍 Validación del Sistema")
             total_rows = len(df)
-            slip_count = sum(1 for idx in df.index
-                           if re.search(r'7290000\d{5}',
-                              ' '.join(str(c) for c in df.iloc[idx].values if pd.notna(c))))
-
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("📊 Filas Totales", total_rows)
-            with col2:
-                st.metric("📊 Slips Válidos", slip_count)
-            with col3:
-                completeness = (slip_count / total_rows * 100) if total_rows > 0 else 0
-                st.metric("📊 Completitud", f"{completeness:.1f}%")
+            slip_count = int(tokenize_table(df).has_slip.sum())
+            completeness = (slip_count / total_rows * 100) if total_rows > 0 else 0
 
-            if completeness >= 95:
-                st.success("🎉 **EXTRACCIÓN EXCELENTE**")
-            elif completeness >= 80:
-                st.info("📊 **EXTRACCIÓN BUENA**")
-            else:
-                st.warning("⚠️ **EXTRACCIÓN PARCIAL**")
+            self.events.emit('validation', f"{slip_count}/{total_rows} slips válidos ({completeness:.1f}%)",
+                             total_rows=total_rows, slip_count=slip_count, completeness=completeness)
+            return {'total_rows': total_rows, 'slip_count': slip_count, 'completeness': completeness}
         except Exception as e:
-            st.error(f"Error en validación: {e}")
+            self.events.emit('error', f"Error en validación: {e}")
+            return None
 
     def calculate_accuracy(self, tables) -> float:
         try:
@@ -635,6 +2241,38 @@ class CamelotExtractorPro:
         except:
             return 0.0
 
+    @profiled()
+    def score_extraction(self, df: pd.DataFrame, expected_slips: Optional[frozenset] = None) -> Dict:
+        """
+        Calidad de una extracción: completitud de slips y discrepancias de tablillas.
+
+        process_page ya descarta las filas sin slip, así que la completitud no
+        puede medirse contra las filas extraídas: es la fracción de
+        expected_slips (los de la capa de texto) presentes en df. Sin
+        referencia (PDF sin texto legible) se usa la proporción de filas con slip.
+        """
+        expected = len(expected_slips) if expected_slips else 0
+        total_rows = len(df) if df is not None else 0
+        if total_rows == 0:
+            return {'total_rows': 0, 'slip_count': 0, 'expected_slips': expected, 'completeness': 0.0,
+                    'discrepancies': 0}
+
+        tokens = tokenize_table(df)
+        found = {slip for slip in tokens.slips[tokens.has_slip].ravel() if slip}
+        if expected:
+            completeness = len(found & expected_slips) / expected * 100
+        else:
+            completeness = int(tokens.has_slip.sum()) / total_rows * 100
+
+        return {
+            'total_rows': total_rows,
+            'slip_count': len(found),
+            'expected_slips': expected,
+            'completeness': completeness,
+            'discrepancies': len(validate_tablets_integrity(df))
+        }
+
+    @profiled()
     def validate_extraction(self, df: pd.DataFrame) -> Dict:
         """Validación básica"""
         validation = {
@@ -648,16 +2286,13 @@ class CamelotExtractorPro:
             if df is None or df.empty:
                 return validation
 
-            if len(df.columns) > 0:
-                first_col = df.iloc[:, 0].astype(str)
-                validation['has_fl_column'] = any('FL' in val for val in first_col)
+            validation['has_fl_column'] = bool(
+                ensure_schema(df)['Wh'].astype('string').str.contains('FL', regex=False).fillna(False).any()
+            )
 
             if len(df.columns) > 2:
-                for col_idx in range(min(5, len(df.columns))):
-                    col_data = df.iloc[:, col_idx].astype(str)
-                    if any(re.search(r'7290000\d{5}', val) for val in col_data):
-                        validation['has_slip_numbers'] = True
-                        break
+                tokens = tokenize_table(df)
+                validation['has_slip_numbers'] = bool(tokens.slip_cells[:, :5].any())
 
             if validation['has_fl_column'] and validation['has_slip_numbers']:
                 validation['data_quality'] = 'good'
@@ -670,86 +2305,874 @@ class CamelotExtractorPro:
 
         return validation
 
+    def select_best_method(self, results: Dict) -> Optional[str]:
+        """Elige el mejor método: filas + bonus por columna FL y slips; en modo adaptativo gana el que superó el umbral"""
+        passing = [name for name, result in results.items() if result.get('passed_quality')]
+        if passing:
+            return passing[0]
+
+        best_method = None
+        best_score = 0
+        for method_name, result in results.items():
+            if not result.get('success') or result.get('data') is None or len(result['data']) == 0:
+                continue
+
+            validation = self.validate_extraction(result['data'])
+            score = validation['total_rows']
+            if validation['has_fl_column']:
+                score += 10
+            if validation['has_slip_numbers']:
+                score += 10
+
+            if score > best_score:
+                best_score = score
+                best_method = method_name
+
+        return best_method
+
+
+# ============================================================================
+# EJECUCIÓN EN PROCESOS WORKER
+# ============================================================================
+
+def _get_process_pool_context():
+    """
+    Contexto multiprocessing para los pools de extracción.
+
+    Se prefiere 'fork': Streamlit ejecuta app.py como un módulo __main__
+    sintético que un proceso 'spawn' no puede volver a importar.
+    """
+    if 'fork' in mp.get_all_start_methods():
+        return mp.get_context('fork')
+    return mp.get_context()
+
+
+def _run_extraction_method(pdf_path: str, method_name: str, options: Dict, profile: bool = False,
+                           page_scan: Optional[Dict] = None, layout_template: Optional[Dict] = None) -> Dict:
+    """Worker: ejecuta un único método de extracción en un proceso aparte"""
+    # Con 'fork' el worker hereda el perfilador del hilo que lo creó: descartarlo
+    _profile_local.profiler = None
+    extractor = CamelotExtractorPro(**options)
+    if page_scan is not None:
+        # El proceso principal ya pre-escaneó el PDF: no se repite por método
+        extractor.page_scans[pdf_path] = page_scan
+    if layout_template is not None:
+        # Ídem con la plantilla: un solo acierto/fallo por documento en el almacén
+        extractor.layout_templates[pdf_path] = layout_template
+    if not profile:
+        return extractor.run_method(pdf_path, method_name)
+
+    # Las etapas medidas aquí viajan con el resultado al proceso principal
+    with stage_profiler() as profiler:
+        result = extractor.run_method(pdf_path, method_name)
+    result['profile'] = {path: dict(record) for path, record in profiler.stages.items()}
+    return result
+
+
+# Tabla extraída de un bloque de páginas: solo lo que usan process_tables y
+# calculate_accuracy (los objetos camelot no viajan bien entre procesos)
+ShardTable = namedtuple('ShardTable', ['df', 'accuracy', 'page'])
+
+
+def _read_pdf_shard(pdf_path: str, pages: str, params: Dict) -> List[ShardTable]:
+    """Worker: una pasada camelot sobre un rango de páginas"""
+    tables = read_camelot_pass(pdf_path, pages, params)
+    return [ShardTable(t.df, getattr(t, 'accuracy', 0), getattr(t, 'page', None)) for t in tables]
+
+
+# ============================================================================
+# PASADAS CAMELOT Y RESOLUCIÓN LATTICE
+# ============================================================================
+
+def read_camelot_pass(pdf_path: str, pages: str, params: Dict) -> List:
+    """Una pasada camelot.read_pdf; las lattice con draft_resolution van por read_lattice_pass"""
+    params = dict(params)
+    draft_resolution = params.pop('draft_resolution', None)
+    if params.get('flavor') == 'lattice':
+        # Sin los hooks, camelot renderiza siempre a 300 dpi
+        PageLayoutCache.install_hooks()
+        if draft_resolution:
+            return read_lattice_pass(pdf_path, pages, params, draft_resolution)
+    return list(camelot.read_pdf(pdf_path, pages=pages, **params))
+
+
+def _draft_page_accepted(tables: List) -> bool:
+    return bool(tables) and all(getattr(t, 'accuracy', 0) >= LATTICE_DRAFT_MIN_ACCURACY for t in tables)
+
+
+def read_lattice_pass(pdf_path: str, pages: str, params: Dict, draft_resolution: int) -> List:
+    """
+    Pasada lattice con intento a baja resolución. La primera página se lee a
+    draft_resolution: si pasa el umbral, el resto también, y solo las páginas
+    que no lo pasan se releen a la resolución de params. Si la primera no lo
+    pasa, todo se lee a resolución completa. Las dos lecturas comparten el
+    layout de texto (shared_page_layout).
+    """
+    resolution = params.get('resolution', LATTICE_RESOLUTION)
+    if draft_resolution >= resolution:
+        return list(camelot.read_pdf(pdf_path, pages=pages, **params))
+
+    page_list = parse_page_ranges(pages, len(PdfReader(pdf_path).pages))
+    if not page_list:
+        return []
+
+    def read(page_numbers: List[int], read_params: Dict) -> Dict[int, List]:
+        found = {page: [] for page in page_numbers}
+        for table in camelot.read_pdf(pdf_path, pages=format_page_ranges(page_numbers), **read_params):
+            found.setdefault(int(table.page), []).append(table)
+        return found
+
+    draft_params = dict(params, resolution=draft_resolution)
+    with shared_page_layout(pdf_path):
+        with profile_stage('lattice_draft'):
+            by_page = read(page_list[:1], draft_params)
+            if _draft_page_accepted(by_page[page_list[0]]) and len(page_list) > 1:
+                by_page.update(read(page_list[1:], draft_params))
+
+        retry = [page for page in page_list if not _draft_page_accepted(by_page.get(page))]
+        if retry:
+            with profile_stage('lattice_full'):
+                by_page.update(read(retry, params))
+
+    logger.info(f"Lattice: {len(page_list) - len(retry)}/{len(page_list)} páginas a {draft_resolution} dpi, "
+                f"{len(retry)} a {resolution} dpi")
+    return [table for page in page_list for table in by_page.get(page, [])]
+
+
+# ============================================================================
+# LAYOUT COMPARTIDO ENTRE MÉTODOS CAMELOT
+# ============================================================================
+
+_layout_local = threading.local()
+
+
+class PageLayoutCache:
+    """
+    Caché por documento del layout de texto (pdfminer) y de las imágenes de
+    página que camelot genera en cada read_pdf.
+
+    Los métodos camelot parsean el mismo PDF: sin caché, pdfminer analiza cada
+    página seis veces y los métodos lattice la rasterizan tres veces. Mientras
+    la caché está activa (ver shared_page_layout), las funciones internas de
+    camelot get_page_layout e ImageConversionBackend.to_array/convert se
+    resuelven desde aquí. Las imágenes se guardan comprimidas en PNG.
+
+    En las pasadas lattice se guarda la imagen umbralizada de cada página (por
+    resolución y parámetros de umbral) y la máscara de líneas antes del cierre
+    de huecos (por line_scale), compartidas entre method_lattice_standard,
+    method_lattice_detailed y la pasada lattice de method_hybrid. Son binarias:
+    se guardan a un bit por píxel. Una página ya vista no se vuelve a
+    rasterizar salvo que falte su umbral.
+    """
+
+    _hooks_installed = False
+    _hooks_lock = threading.Lock()
+    # Umbral y líneas de lattice cacheables (solo con la API interna esperada de camelot)
+    _lattice_hooks = False
+
+    def __init__(self, pdf_path: str, max_layouts: int = 500, max_image_bytes: int = 256 * 1024 * 1024):
+        self.pdf_path = pdf_path
+        self.max_layouts = max_layouts
+        self.max_image_bytes = max_image_bytes
+        self.layouts = OrderedDict()
+        self.images = OrderedDict()
+        self.image_bytes = 0
+        self.stats = {'layout_hits': 0, 'layout_misses': 0, 'image_hits': 0, 'image_misses': 0,
+                      'lines_hits': 0, 'lines_misses': 0}
+        self._file_digests = {}
+        # Lattice: forma de cada página rasterizada y la página / umbral en curso
+        self.page_shapes = {}
+        self.mask_shapes = {}
+        self.current_page = None
+        self.current_threshold = None
+
+    # --- claves -------------------------------------------------------------
+
+    def _file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._file_digests:
+            with open(path, 'rb') as f:
+                self._file_digests[memo_key] = hashlib.sha1(f.read()).hexdigest()
+        return self._file_digests[memo_key]
+
+    def layout_key(self, source, kwargs: Dict):
+        """Clave del layout: página del PDF abierto (camelot 1.x+) o PDF de una página (0.x)"""
+        params = tuple(sorted(kwargs.items()))
+        if isinstance(source, (str, os.PathLike)):
+            return ('file', self._file_digest(source), params)
+        page_idx = getattr(source, 'page_idx', None)
+        if page_idx is None:
+            return None
+        return ('page', page_idx, repr(getattr(source, 'ctm', None)), params)
+
+    # --- almacenamiento -----------------------------------------------------
+
+    def get_layout(self, key, compute):
+        if key in self.layouts:
+            self.layouts.move_to_end(key)
+            self.stats['layout_hits'] += 1
+            return self.layouts[key]
+
+        self.stats['layout_misses'] += 1
+        value = compute()
+        self.layouts[key] = value
+        while len(self.layouts) > self.max_layouts:
+            self.layouts.popitem(last=False)
+        return value
+
+    def get_image(self, key) -> Optional[bytes]:
+        if key in self.images:
+            self.images.move_to_end(key)
+            self.stats['image_hits'] += 1
+            return self.images[key]
+        self.stats['image_misses'] += 1
+        return None
+
+    def put_image(self, key, png_bytes: bytes):
+        if key in self.images:
+            self.image_bytes -= len(self.images.pop(key))
+        self.images[key] = png_bytes
+        self.image_bytes += len(png_bytes)
+        while self.image_bytes > self.max_image_bytes and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.image_bytes -= len(evicted)
+
+    def get_mask(self, key, stat: str) -> Optional[np.ndarray]:
+        """Imagen binaria 0/255 (umbral o máscara de líneas) guardada, o None"""
+        if key not in self.images or key not in self.mask_shapes:
+            self.stats[f'{stat}_misses'] += 1
+            return None
+        self.images.move_to_end(key)
+        self.stats[f'{stat}_hits'] += 1
+        shape = self.mask_shapes[key]
+        bits = np.frombuffer(zlib.decompress(self.images[key]), dtype=np.uint8)
+        return np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape) * np.uint8(255)
+
+    def put_mask(self, key, mask: np.ndarray):
+        # Un bit por píxel + zlib rápido: ~8x más rápido que PNG y casi todo es fondo
+        self.mask_shapes[key] = mask.shape
+        self.put_image(key, zlib.compress(np.packbits(mask > 0).tobytes(), 1))
+
+    # --- hooks en camelot ---------------------------------------------------
+
+    @classmethod
+    def install_hooks(cls):
+        """Envuelve (una sola vez por proceso) las funciones internas de camelot"""
+        with cls._hooks_lock:
+            if cls._hooks_installed:
+                return
+            cls._hooks_installed = True
+
+            for module_name in ('camelot.utils', 'camelot.handlers', 'camelot.parsers.base'):
+                try:
+                    module = importlib.import_module(module_name)
+                except ImportError:
+                    continue
+                original = getattr(module, 'get_page_layout', None)
+                if original is not None and not getattr(original, '_layout_cache_hook', False):
+                    setattr(module, 'get_page_layout', cls._wrap_get_page_layout(original))
+
+            try:
+                lattice_module = importlib.import_module('camelot.parsers.lattice')
+                image_processing = importlib.import_module('camelot.image_processing')
+            except ImportError:
+                lattice_module = None
+            lattice_helpers = ('create_structuring_element', 'apply_region_mask', 'extract_lines_from_contours')
+            if (lattice_module is not None
+                    and all(hasattr(lattice_module, name) for name in ('adaptive_threshold', 'find_lines'))
+                    and all(hasattr(image_processing, name) for name in lattice_helpers)):
+                parser_cls = lattice_module.Lattice
+                parser_cls._generate_table_bbox = cls._wrap_generate_table_bbox(parser_cls._generate_table_bbox)
+                lattice_module.adaptive_threshold = cls._wrap_adaptive_threshold(lattice_module.adaptive_threshold)
+                lattice_module.find_lines = cls._wrap_find_lines(image_processing)
+                cls._lattice_hooks = True
+
+            try:
+                backend_cls = importlib.import_module('camelot.backends.image_conversion').ImageConversionBackend
+            except (ImportError, AttributeError):
+                return
+            if hasattr(backend_cls, 'to_array'):
+                backend_cls.to_array = cls._wrap_to_array(backend_cls.to_array)
+            if hasattr(backend_cls, 'convert'):
+                backend_cls.convert = cls._wrap_convert(backend_cls.convert)
+
+    @staticmethod
+    def _wrap_get_page_layout(original):
+        def get_page_layout(source, **kwargs):
+            cache = active_page_layout_cache()
+            key = cache.layout_key(source, kwargs) if cache is not None else None
+            if key is None:
+                return original(source, **kwargs)
+            return cache.get_layout(key, lambda: original(source, **kwargs))
+
+        get_page_layout._layout_cache_hook = True
+        return get_page_layout
+
+    @staticmethod
+    def _wrap_to_array(original):
+        def render(backend, pdf_path, page, resolution):
+            """Render a la resolución de la pasada lattice (to_array de camelot la ignora)"""
+            converter = getattr(backend, 'backend', None)
+            if resolution is not None:
+                try:
+                    if hasattr(converter, 'to_array'):
+                        return converter.to_array(pdf_path, resolution=resolution, page=page)
+                    import cv2
+                    with tempfile.TemporaryDirectory() as tmp_dir:
+                        png_path = os.path.join(tmp_dir, 'page.png')
+                        converter.convert(pdf_path, png_path, resolution=resolution, page=page)
+                        return cv2.imread(png_path)
+                except Exception:
+                    pass
+            return original(backend, pdf_path, page)
+
+        def to_array(backend, pdf_path, page=1):
+            resolution = active_render_resolution()
+            cache = active_page_layout_cache()
+            if cache is None:
+                return render(backend, pdf_path, page, resolution)
+
+            key = ('array', cache._file_digest(pdf_path), page, resolution)
+            if PageLayoutCache._lattice_hooks and getattr(_layout_local, 'lattice_pass', False):
+                # Página ya vista: array vacío de la misma forma; solo se
+                # rasteriza si adaptive_threshold no tiene su umbral
+                if key in cache.page_shapes:
+                    image = np.broadcast_to(np.zeros(1, dtype=np.uint8), cache.page_shapes[key])
+                else:
+                    image = render(backend, pdf_path, page, resolution)
+                    cache.page_shapes[key] = image.shape
+                cache.current_page = (image, key, lambda: render(backend, pdf_path, page, resolution))
+                return image
+
+            import cv2
+            cached = cache.get_image(key)
+            if cached is not None:
+                return cv2.imdecode(np.frombuffer(cached, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+            image = render(backend, pdf_path, page, resolution)
+            ok, encoded = cv2.imencode('.png', image)
+            if ok:
+                cache.put_image(key, encoded.tobytes())
+            return image
+
+        return to_array
+
+    @staticmethod
+    def _wrap_generate_table_bbox(original):
+        def _generate_table_bbox(parser, *args, **kwargs):
+            # La resolución del parser llega al render de to_array
+            previous = active_render_resolution()
+            _layout_local.resolution = getattr(parser, 'resolution', None)
+            _layout_local.lattice_pass = True
+            try:
+                return original(parser, *args, **kwargs)
+            finally:
+                _layout_local.resolution = previous
+                _layout_local.lattice_pass = False
+                cache = active_page_layout_cache()
+                if cache is not None:
+                    # No retener la imagen de la última página
+                    cache.current_page = cache.current_threshold = None
+
+        return _generate_table_bbox
+
+    @staticmethod
+    def _wrap_adaptive_threshold(original):
+        def adaptive_threshold(imagename, process_background=False, blocksize=15, c=-2, rotation=''):
+            cache = active_page_layout_cache()
+            current = cache.current_page if cache is not None else None
+            if current is None or imagename is not current[0]:
+                return original(imagename, process_background, blocksize, c, rotation)
+
+            image, page_key, render = current
+            key = ('threshold', page_key, process_background, blocksize, c, rotation)
+            threshold = cache.get_mask(key, 'image')
+            if threshold is not None:
+                shape = threshold.shape + image.shape[2:]
+                image = np.broadcast_to(np.zeros(1, dtype=np.uint8), shape)
+            else:
+                if image.strides[0] == 0:
+                    image = render()
+                image, threshold = original(image, process_background, blocksize, c, rotation)
+                cache.put_mask(key, threshold)
+            cache.current_threshold = (threshold, key)
+            return image, threshold
+
+        return adaptive_threshold
+
+    @staticmethod
+    def _wrap_find_lines(image_processing):
+        def find_lines(threshold, regions=None, direction='horizontal', line_scale=40, iterations=0,
+                       erode_iterations=0):
+            """
+            find_lines de camelot con la apertura morfológica (los segmentos de
+            línea antes de cerrar huecos) cacheada por umbral, dirección y
+            line_scale: lattice_standard y lattice_detailed solo difieren en
+            las dilataciones posteriores (iterations).
+            """
+            import cv2
+            if direction not in ('vertical', 'horizontal'):
+                raise ValueError("Specify direction as either 'vertical' or 'horizontal'")
+
+            element, _ = image_processing.create_structuring_element(threshold, direction, line_scale)
+            cache = active_page_layout_cache()
+            current = cache.current_threshold if cache is not None else None
+            key = None
+            if current is not None and threshold is current[0]:
+                key = ('lines', current[1], direction, line_scale, repr(regions))
+
+            opened = cache.get_mask(key, 'lines') if key is not None else None
+            if opened is None:
+                masked = image_processing.apply_region_mask(threshold, regions)
+                opened = cv2.dilate(cv2.erode(masked, element), element)
+                if key is not None:
+                    cache.put_mask(key, opened)
+
+            mask = cv2.dilate(opened, element, iterations=iterations)
+            if erode_iterations:
+                mask = cv2.erode(mask, element, iterations=erode_iterations)
+            contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            return mask, image_processing.extract_lines_from_contours(contours, direction)
+
+        return find_lines
+
+    @staticmethod
+    def _wrap_convert(original):
+        def convert(backend, pdf_path, png_path, *args, **kwargs):
+            cache = active_page_layout_cache()
+            if cache is None:
+                return original(backend, pdf_path, png_path, *args, **kwargs)
+
+            key = ('png', cache._file_digest(pdf_path), args, tuple(sorted(kwargs.items())))
+            cached = cache.get_image(key)
+            if cached is not None:
+                with open(png_path, 'wb') as f:
+                    f.write(cached)
+                return None
+
+            result = original(backend, pdf_path, png_path, *args, **kwargs)
+            with open(png_path, 'rb') as f:
+                cache.put_image(key, f.read())
+            return result
+
+        return convert
+
+
+def active_page_layout_cache() -> Optional[PageLayoutCache]:
+    """Caché de layout activa en este hilo (None fuera de shared_page_layout)"""
+    return getattr(_layout_local, 'cache', None)
+
+
+def active_render_resolution() -> Optional[int]:
+    """Resolución (dpi) de la pasada lattice en curso en este hilo"""
+    return getattr(_layout_local, 'resolution', None)
+
+
+@contextmanager
+def shared_page_layout(pdf_path: str):
+    """
+    Activa una PageLayoutCache para pdf_path en este hilo. Es reentrante:
+    si ya hay una activa para el mismo documento se reutiliza.
+    """
+    active = active_page_layout_cache()
+    if active is not None and active.pdf_path == pdf_path:
+        yield active
+        return
+
+    PageLayoutCache.install_hooks()
+    cache = PageLayoutCache(pdf_path)
+    _layout_local.cache = cache
+    try:
+        yield cache
+    finally:
+        _layout_local.cache = active
+
+
+# ============================================================================
+# CACHÉ PERSISTENTE DE EXTRACCIÓN
+# ============================================================================
+
+# Versión del pipeline de correcciones. Incrementar al modificar cualquier
+# corrección, process_tables o normalize_schema para invalidar los resultados cacheados.
+CORRECTIONS_VERSION = '3.2'
+
+
+class ExtractionCache:
+    """
+    Caché en disco de resultados de extracción, direccionada por contenido.
+
+    Clave: SHA-256 del PDF + nombre del método + parámetros camelot + versión
+    de las correcciones. Cada entrada es un pickle independiente con el
+    DataFrame procesado y la precisión; las escrituras son atómicas
+    (os.replace), así que varios procesos pueden compartir el directorio.
+    La expulsión es LRU por mtime, acotada a max_bytes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 500 * 1024 * 1024):
+        self.cache_dir = cache_dir or os.environ.get(
+            'PDF_EXTRACTOR_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'camelot_extractor_pro')
+        )
+        self.max_bytes = max_bytes
+        self._hash_memo = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def hash_file(self, path: str) -> str:
+        """SHA-256 del contenido del archivo (memorizado por ruta, tamaño y mtime)"""
+        stat = os.stat(path)
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._hash_memo:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            self._hash_memo[memo_key] = digest.hexdigest()
+        return self._hash_memo[memo_key]
+
+    @staticmethod
+    def make_key(pdf_hash: str, method_name: str, params) -> str:
+        """Clave de entrada: PDF + método + parámetros + versión de correcciones"""
+        payload = json.dumps({
+            'pdf': pdf_hash,
+            'method': method_name,
+            'params': params,
+            'version': CORRECTIONS_VERSION
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Devuelve el resultado cacheado o None"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Entrada corrupta o de otra versión de pandas
+            self._remove(path)
+            return None
+
+        if entry.get('version') != CORRECTIONS_VERSION:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path, None)  # marca de uso para LRU
+        except OSError:
+            pass
+        return entry['result']
+
+    def put(self, key: str, result: Dict):
+        """Guarda un resultado de forma atómica y aplica la expulsión LRU"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': CORRECTIONS_VERSION, 'result': result}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._entry_path(key))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        """Elimina las entradas menos usadas hasta quedar bajo max_bytes"""
+        try:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pkl'):
+                    path = os.path.join(self.cache_dir, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        except OSError:
+            pass
+
+    def clear(self):
+        """Vacía la caché"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# ============================================================================
+# ALMACÉN HISTÓRICO DE EXTRACCIONES
+# ============================================================================
+
+# Fecha de reporte en el nombre de archivo (convención de las exportaciones: _YYYYMMDD)
+FILENAME_DATE_PATTERN = re.compile(r'(\d{8})')
+# Fecha y hora de emisión en la cabecera del reporte ("10/14/2025 07:00")
+HEADER_DATE_PATTERN = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})\s+\d{1,2}:\d{2}')
+
+
+def date_from_filename(filename: Optional[str]) -> Optional[datetime]:
+    """Fecha YYYYMMDD del nombre de archivo; None si no hay 8 dígitos que formen una fecha válida"""
+    for match in FILENAME_DATE_PATTERN.finditer(filename or ''):
+        try:
+            return datetime.strptime(match.group(1), '%Y%m%d')
+        except ValueError:
+            continue
+    return None
+
+
+def detect_report_date(pdf, filename: Optional[str] = None) -> Optional[datetime]:
+    """
+    Fecha del reporte: la del nombre de archivo (YYYYMMDD) o, si no la tiene,
+    la de emisión en la cabecera de la primera página. None si no hay
+    ninguna: es la clave del histórico y no se inventa (con la de hoy, un
+    reporte sin fecha reemplazaría la instantánea real del día).
+    pdf puede ser una ruta o un objeto tipo archivo.
+    """
+    file_date = date_from_filename(filename)
+    if file_date is not None:
+        return file_date
+
+    try:
+        text = PdfReader(pdf).pages[0].extract_text() or ''
+        match = HEADER_DATE_PATTERN.search(text)
+        if match:
+            return datetime.strptime(match.group(1), '%m/%d/%Y')
+    except Exception as e:
+        logger.warning(f"No se pudo leer la fecha de cabecera: {e}")
+
+    return None
+
+
+class SnapshotStore:
+    """
+    Almacén SQLite local con el resultado de cada extracción, una instantánea
+    por fecha de reporte (guardar otra extracción de la misma fecha la reemplaza).
+
+    snapshots guarda el origen, el método y la huella del DataFrame; las filas
+    van en snapshot_rows con las 18 columnas de REPORT_COLUMNS (fechas ISO,
+    conteos INTEGER, resto TEXT), agrupadas por fecha (clave primaria
+    report_date, position) para que un rango de fechas se lea de forma
+    contigua. El dashboard histórico consulta aquí en lugar de volver a leer
+    los Excel exportados.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(
+            'PDF_EXTRACTOR_STORE_PATH',
+            os.path.join(os.path.expanduser('~'), '.local', 'share', 'camelot_extractor_pro', 'historico.sqlite')
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    report_date TEXT PRIMARY KEY,
+                    source TEXT,
+                    method TEXT,
+                    fingerprint TEXT,
+                    rows INTEGER,
+                    saved_at TEXT
+                )""")
+            columns = ', '.join(f'"{name}" {"INTEGER" if name in SCHEMA_INT_COLUMNS else "TEXT"}'
+                                for name in REPORT_COLUMNS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS snapshot_rows (
+                    report_date TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    {columns},
+                    PRIMARY KEY (report_date, position)
+                ) WITHOUT ROWID""")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Varios workers del CLI por lotes pueden escribir a la vez
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _date_key(report_date) -> str:
+        return pd.Timestamp(report_date).strftime('%Y-%m-%d')
+
+    def save(self, report_date, df: pd.DataFrame, source: str = '', method: str = '') -> bool:
+        """
+        Guarda (o reemplaza) la instantánea de una fecha. Devuelve False sin
+        escribir si esa fecha ya tiene exactamente estos datos.
+        """
+        date_key = self._date_key(report_date)
+        fingerprint = frame_fingerprint(df)
+
+        with closing(self._connect()) as conn, conn:
+            stored = conn.execute("SELECT fingerprint FROM snapshots WHERE report_date = ?",
+                                  (date_key,)).fetchone()
+            if stored is not None and stored[0] == fingerprint:
+                return False
+
+            data = ensure_schema(df)
+            columns = []
+            for name in REPORT_COLUMNS:
+                column = data[name]
+                if name in SCHEMA_DATE_COLUMNS:
+                    column = column.dt.strftime('%Y-%m-%d')
+                columns.append(column.astype(object).to_numpy(dtype=object, na_value=None))
+            rows = ((date_key, position) + tuple(values)
+                    for position, values in enumerate(zip(*columns)))
+
+            placeholders = ', '.join('?' * (len(REPORT_COLUMNS) + 2))
+            conn.execute("DELETE FROM snapshot_rows WHERE report_date = ?", (date_key,))
+            conn.executemany(f"INSERT INTO snapshot_rows VALUES ({placeholders})", rows)
+            conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                         (date_key, source, method, fingerprint, len(df),
+                          datetime.now().isoformat(timespec='seconds')))
+        return True
+
+    def snapshots(self) -> pd.DataFrame:
+        """Una fila por fecha guardada (report_date, source, method, rows, saved_at)"""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT report_date, source, method, rows, saved_at FROM snapshots ORDER BY report_date",
+                conn, parse_dates=['report_date'])
+
+    def load(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Filas de las instantáneas entre start y end (incluidas), con el mismo
+        formato que el histórico leído de Excel: esquema tipado de
+        REPORT_COLUMNS más fecha_archivo y nombre_archivo.
+        """
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("r.report_date >= ?")
+            params.append(self._date_key(start))
+        if end is not None:
+            conditions.append("r.report_date <= ?")
+            params.append(self._date_key(end))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        columns = ', '.join(f'r."{name}"' for name in REPORT_COLUMNS)
+        query = f"""
+            SELECT {columns}, r.report_date AS fecha_archivo, s.source AS nombre_archivo
+            FROM snapshot_rows r JOIN snapshots s ON s.report_date = r.report_date
+            {where}
+            ORDER BY r.report_date, r.position"""
+
+        with closing(self._connect()) as conn:
+            rows = pd.read_sql_query(query, conn, params=params, parse_dates=['fecha_archivo'])
+        return normalize_schema(rows)
+
+    def delete(self, report_date):
+        """Elimina la instantánea de una fecha"""
+        date_key = self._date_key(report_date)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM snapshot_rows WHERE report_date = ?", (date_key,))
+            conn.execute("DELETE FROM snapshots WHERE report_date = ?", (date_key,))
+
 
 # ============================================================================
 # ANALIZADOR DE NEGOCIO
 # ============================================================================
 
+@lru_cache(maxsize=32)
+def us_holiday_calendar(first_year: int, last_year: int) -> np.ndarray:
+    """Feriados de EE. UU. (incluye los días observados) como datetime64[D] ordenado"""
+    calendar = holidays.US(years=range(first_year, last_year + 1))
+    return np.array(sorted(calendar.keys()), dtype='datetime64[D]')
+
+
 class BusinessAnalyzer:
     """Analizador de métricas de negocio"""
 
-    def __init__(self):
-        self.us_holidays = holidays.US(years=range(2024, 2027))
+    def calculate_business_days(self, start_date_str: str, end_date_str: str) -> int:
+        """Calcula días hábiles"""
+        return int(self.business_days_between([start_date_str], [end_date_str])[0])
+
+    def business_days_between(self, start_dates, end_dates) -> np.ndarray:
+        """
+        Días hábiles (lunes a viernes sin feriados, ambos extremos incluidos)
+        entre columnas de fechas (datetime64 o texto M/D/YYYY), en una sola
+        pasada con np.busday_count.
+
+        El calendario de feriados cubre los años presentes en los datos.
+        Fechas vacías o inválidas, o fin anterior al inicio, cuentan 0.
+        """
+        start = self._as_days(start_dates)
+        end = self._as_days(end_dates)
+
+        valid = ~(np.isnat(start) | np.isnat(end))
+        counts = np.zeros(len(start), dtype=np.int64)
+        if not valid.any():
+            return counts
+
+        start, end = start[valid], end[valid]
+        years = np.concatenate([start, end]).astype('datetime64[Y]').astype(int) + 1970
+        calendar = us_holiday_calendar(int(years.min()), int(years.max()))
+
+        # busday_count cuenta [inicio, fin): +1 día para incluir la fecha final
+        counts[valid] = np.maximum(np.busday_count(start, end + np.timedelta64(1, 'D'),
+                                                   holidays=calendar), 0)
+        return counts
+
+    @staticmethod
+    def _as_days(dates) -> np.ndarray:
+        dates = pd.Series(dates)
+        if not pd.api.types.is_datetime64_any_dtype(dates.dtype):
+            dates = pd.to_datetime(dates.astype(object).astype(str).str.strip(),
+                                   format='%m/%d/%Y', errors='coerce')
+        return dates.to_numpy(dtype='datetime64[D]')
+
+    @profiled()
+    def parse_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Procesa DataFrame para análisis (por columnas, sin bucle por fila).
 
-    def calculate_business_days(self, start_date_str: str, end_date_str: str) -> int:
-        """Calcula días hábiles"""
+        Sobre el esquema tipado (normalize_schema) añade slip_number (str),
+        is_closed (bool), warehouse (category), customer_name (str) y
+        business_days_to_close (Int64, <NA> si abierto).
+        """
         try:
-            if not start_date_str or not end_date_str:
-                return 0
+            analysis_df = normalize_schema(df)
 
-            start_date = datetime.strptime(start_date_str, '%m/%d/%Y')
-            end_date = datetime.strptime(end_date_str, '%m/%d/%Y')
+            slip_text = analysis_df['Return_Slip'].fillna('')
+            prefix_text = analysis_df['Return_Prefix'].astype('string').fillna('')
+            open_text = analysis_df['Open'].fillna('')
+            customer_text = analysis_df['Customer'].astype('string').fillna('')
 
-            business_days = 0
-            current_date = start_date
+            analysis_df['slip_number'] = slip_text.str.extract(
+                f'({SLIP_RE.pattern})', expand=False).fillna('').astype(object)
 
-            while current_date <= end_date:
-                if current_date.weekday() < 5:
-                    if current_date.date() not in self.us_holidays:
-                        business_days += 1
-                current_date += timedelta(days=1)
+            is_closed = open_text.isin(['', 'nan', '0']) & analysis_df['Counted_Date'].notna()
+            analysis_df['is_closed'] = is_closed.to_numpy(dtype=bool)
 
-            return business_days
-        except:
-            return 0
+            warehouse = prefix_text.str.extract(f'({WAREHOUSE_RE.pattern})', flags=re.IGNORECASE, expand=False)
+            analysis_df['warehouse'] = warehouse.str.upper().fillna('UNKNOWN').astype('category')
 
-    def parse_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Procesa DataFrame para análisis"""
-        try:
-            analysis_df = df.copy()
-
-            if len(analysis_df.columns) >= 18:
-                base_df = analysis_df.iloc[:, :18].copy()
-                base_df.columns = [
-                    'Wh', 'Return_Prefix', 'Return_Slip', 'Return_Date',
-                    'Jobsite', 'Cost_Center', 'Invoice_Date1', 'Invoice_Date2',
-                    'Customer', 'Job_Name', 'Definitive', 'Counted_Date',
-                    'Tablets', 'Total', 'Open', 'Tablets_Total',
-                    'Counting_Delay', 'Validation_Delay'
-                ]
-                analysis_df = base_df
-
-            for idx in analysis_df.index:
-                slip_text = str(analysis_df.loc[idx, 'Return_Slip'])
-                slip_match = re.search(r'(7290000\d{5})', slip_text)
-                analysis_df.at[idx, 'slip_number'] = slip_match.group(1) if slip_match else ''
-
-                open_tablets = str(analysis_df.loc[idx, 'Open'])
-                counted_date = str(analysis_df.loc[idx, 'Counted_Date'])
-
-                is_closed = (not open_tablets or open_tablets in ['', 'nan', '0']) and \
-                           counted_date and counted_date not in ['', 'nan']
-                analysis_df.at[idx, 'is_closed'] = is_closed
-
-                wh_text = str(analysis_df.loc[idx, 'Return_Prefix'])
-                wh_match = re.search(r'(RO-[A-Z]{2}|\d+[A-Za-z]*)', wh_text, re.IGNORECASE)
-                analysis_df.at[idx, 'warehouse'] = wh_match.group(1).upper() if wh_match else 'UNKNOWN'
-
-                customer_text = str(analysis_df.loc[idx, 'Customer'])
-                analysis_df.at[idx, 'customer_name'] = customer_text[:50] if \
-                                                       customer_text not in ['', 'nan'] else 'Unknown'
-
-                return_date = str(analysis_df.loc[idx, 'Return_Date'])
-
-                if is_closed and return_date and counted_date:
-                    business_days = self.calculate_business_days(return_date, counted_date)
-                    analysis_df.at[idx, 'business_days_to_close'] = business_days
-                else:
-                    analysis_df.at[idx, 'business_days_to_close'] = None
+            analysis_df['customer_name'] = customer_text.str[:50].where(
+                ~customer_text.isin(['', 'nan']), 'Unknown').astype(object)
+
+            # Días hábiles de todas las filas en una pasada; solo cuentan las cerradas
+            business_days = pd.Series(
+                self.business_days_between(analysis_df['Return_Date'], analysis_df['Counted_Date']),
+                index=analysis_df.index, dtype='Int64')
+            analysis_df['business_days_to_close'] = business_days.where(analysis_df['is_closed'], pd.NA)
 
             return analysis_df
         except Exception as e:
-            st.error(f"Error procesando DataFrame: {e}")
+            logger.error(f"Error procesando DataFrame: {e}")
             return df
 
 
@@ -757,32 +3180,114 @@ class BusinessAnalyzer:
 # FUNCIONES DE ANÁLISIS DE TABLILLAS
 # ============================================================================
 
+MISSING_TEXT = ['', 'nan', 'None']
+
+
+class TabletTable:
+    """
+    Tablillas de una tabla extraída, parseadas una sola vez en formato largo.
+
+    items: una fila por tablilla con row, slip, warehouse, customer, code,
+    suffix, listed (aparece en Tablets), is_open (aparece en Open) y
+    open_matches (códigos [MALT] del elemento de Open). Las tablillas de
+    Open se emparejan con las de Tablets por código; un código de Open sin
+    pareja queda como fila con listed=False.
+
+    rows: una fila por albarán con Total (Int64) y el texto de Open que
+    necesita la validación de integridad.
+
+    Métricas, breakdowns y discrepancias son groupby sobre estas tablas.
+    """
+
+    ITEM_COLUMNS = ['row', 'slip', 'warehouse', 'customer', 'code', 'suffix',
+                    'listed', 'is_open', 'open_matches']
+
+    def __init__(self, df: pd.DataFrame):
+        if len(df) == 0:
+            self.rows = pd.DataFrame(columns=['slip', 'warehouse', 'customer', 'total', 'open_text'])
+            self.items = pd.DataFrame(columns=self.ITEM_COLUMNS)
+            return
+        df = ensure_schema(df)
+
+        def text(name):
+            # Celdas vacías como '' (MISSING_TEXT)
+            return pd.Series(df[name].astype('string').fillna('').to_numpy(dtype=object), dtype=object)
+
+        tablets_text = text('Tablets')
+        open_text = text('Open')
+        self.rows = pd.DataFrame({
+            'slip': text('Return_Slip'),
+            'warehouse': text('Return_Prefix'),
+            'customer': text('Customer').str[:50],
+            'total': df['Total'].to_numpy(dtype='float64', na_value=np.nan),
+            'open_text': open_text,
+        })
+
+        listed = self._explode(tablets_text.where(~tablets_text.isin(MISSING_TEXT), ''))
+        listed = listed[listed != '0']
+        listed_df = pd.DataFrame({'row': listed.index.to_numpy(), 'code': listed.to_numpy(dtype=object)})
+
+        opened = self._explode(open_text.where(~open_text.isin(MISSING_TEXT + ['0']), ''))
+        parts = opened.str.extract(r'^(.*?)([MALT]?)$')
+        open_df = pd.DataFrame({
+            'row': opened.index.to_numpy(),
+            'code': parts[0].to_numpy(dtype=object),
+            'suffix': parts[1].to_numpy(dtype=object),
+            'open_matches': opened.str.count(OPEN_CODE_RE.pattern).to_numpy(dtype=np.int64),
+        })
+
+        # Emparejar por (fila, código, n-ésima aparición) respeta códigos repetidos
+        listed_df['occurrence'] = listed_df.groupby(['row', 'code']).cumcount()
+        open_df['occurrence'] = open_df.groupby(['row', 'code']).cumcount()
+        items = listed_df.merge(open_df, on=['row', 'code', 'occurrence'], how='outer', indicator=True)
+        items = items.sort_values('row', kind='stable').reset_index(drop=True)
+
+        items['listed'] = (items['_merge'] != 'right_only').to_numpy()
+        items['is_open'] = (items['_merge'] != 'left_only').to_numpy()
+        items['suffix'] = items['suffix'].fillna('')
+        items['open_matches'] = items['open_matches'].fillna(0).astype(np.int64)
+        for column in ['slip', 'warehouse', 'customer']:
+            items[column] = self.rows[column].to_numpy(dtype=object)[items['row'].to_numpy(dtype=np.int64)]
+        self.items = items[self.ITEM_COLUMNS]
+
+    @staticmethod
+    def _explode(text: pd.Series) -> pd.Series:
+        """Elementos no vacíos de listas separadas por comas, indexados por fila"""
+        items = text.str.split(',').explode().str.strip()
+        return items[items.notna() & (items != '')]
+
+    def counted_items(self) -> pd.DataFrame:
+        """Tablillas de los albaranes que cuentan en las métricas (al menos una en Tablets)"""
+        items = self.items
+        listed_rows = items.loc[items['listed'], 'row'].unique()
+        return items[items['row'].isin(listed_rows)]
+
+    @staticmethod
+    def summarize(items: pd.DataFrame, key: str) -> pd.DataFrame:
+        """Total / abiertas / cerradas por clave, en orden de primera aparición"""
+        grouped = items.groupby(key, sort=False)[['listed', 'is_open']].sum().astype(np.int64)
+        grouped.columns = ['total', 'abiertas']
+        grouped['cerradas'] = grouped['total'] - grouped['abiertas']
+        return grouped.reset_index()
+
+
+_TABLET_CACHE = {}
+
+
+@profiled()
+def build_tablet_table(df: pd.DataFrame) -> TabletTable:
+    """Parsea Tablets/Open una vez y reutiliza el resultado mientras el DataFrame siga vivo"""
+    return memo_by_frame(_TABLET_CACHE, df, TabletTable)
+
+
+@profiled()
 def calculate_tablets_metrics(df: pd.DataFrame) -> Dict:
     """Calcula métricas globales de tablillas"""
     try:
-        total_tablillas = 0
-        tablillas_cerradas = 0
-        tablillas_abiertas = 0
-
-        for i in range(len(df)):
-            tablets_str = str(df.iloc[i, 12])
-            open_tablets_str = str(df.iloc[i, 14])
-
-            if tablets_str not in ['', 'nan', 'None']:
-                tablets_list = [x.strip() for x in tablets_str.split(',')
-                               if x.strip() and x.strip() != '0']
-                total = len(tablets_list)
-
-                if total > 0:
-                    total_tablillas += total
-
-                    if open_tablets_str not in ['', 'nan', 'None', '0']:
-                        open_list = [x.strip() for x in open_tablets_str.split(',') if x.strip()]
-                        abiertas = len(open_list)
-                        tablillas_abiertas += abiertas
-                        tablillas_cerradas += (total - abiertas)
-                    else:
-                        tablillas_cerradas += total
+        items = build_tablet_table(df).counted_items()
+        total_tablillas = int(items['listed'].sum())
+        tablillas_abiertas = int(items['is_open'].sum())
+        tablillas_cerradas = total_tablillas - tablillas_abiertas
 
         return {
             'total': total_tablillas,
@@ -791,145 +3296,203 @@ def calculate_tablets_metrics(df: pd.DataFrame) -> Dict:
             'tasa_cierre': (tablillas_cerradas / total_tablillas * 100) if total_tablillas > 0 else 0
         }
     except Exception as e:
-        st.error(f"Error en calculate_tablets_metrics: {e}")
+        logger.error(f"Error en calculate_tablets_metrics: {e}")
         return {'total': 0, 'cerradas': 0, 'abiertas': 0, 'tasa_cierre': 0}
 
 
+@profiled()
 def create_tablets_breakdown_by_warehouse(df: pd.DataFrame) -> pd.DataFrame:
     """Breakdown de tablillas por warehouse"""
     try:
-        warehouse_data = {}
-
-        for i in range(len(df)):
-            try:
-                wh = str(df.iloc[i, 1])
-                tablets_str = str(df.iloc[i, 12])
-                open_tablets_str = str(df.iloc[i, 14])
-
-                if tablets_str not in ['', 'nan', 'None']:
-                    tablets_list = [x.strip() for x in tablets_str.split(',')
-                                   if x.strip() and x.strip() != '0']
-                    total = len(tablets_list)
-
-                    if total > 0:
-                        if wh not in warehouse_data:
-                            warehouse_data[wh] = {'total': 0, 'cerradas': 0, 'abiertas': 0}
-
-                        warehouse_data[wh]['total'] += total
-
-                        if open_tablets_str not in ['', 'nan', 'None', '0']:
-                            open_list = [x.strip() for x in open_tablets_str.split(',') if x.strip()]
-                            abiertas = len(open_list)
-                            warehouse_data[wh]['abiertas'] += abiertas
-                            warehouse_data[wh]['cerradas'] += (total - abiertas)
-                        else:
-                            warehouse_data[wh]['cerradas'] += total
-            except:
-                continue
-
-        result = []
-        for wh, data in warehouse_data.items():
-            result.append({
-                'Warehouse': wh,
-                'Total_Tablillas': data['total'],
-                'Cerradas': data['cerradas'],
-                'Abiertas': data['abiertas'],
-                'Tasa_Cierre_%': round((data['cerradas']/data['total']*100), 2)
-            })
-
-        if result:
-            return pd.DataFrame(result).sort_values('Total_Tablillas', ascending=False)
-        return pd.DataFrame()
+        summary = TabletTable.summarize(build_tablet_table(df).counted_items(), 'warehouse')
+        if summary.empty:
+            return pd.DataFrame()
+
+        result = pd.DataFrame({
+            'Warehouse': summary['warehouse'],
+            'Total_Tablillas': summary['total'],
+            'Cerradas': summary['cerradas'],
+            'Abiertas': summary['abiertas'],
+            'Tasa_Cierre_%': [round(c / t * 100, 2) for c, t in zip(summary['cerradas'], summary['total'])]
+        })
+        return result.sort_values('Total_Tablillas', ascending=False)
     except Exception as e:
-        st.error(f"Error en create_tablets_breakdown_by_warehouse: {e}")
+        logger.error(f"Error en create_tablets_breakdown_by_warehouse: {e}")
         return pd.DataFrame()
 
 
+@profiled()
 def create_tablets_by_customer(df: pd.DataFrame) -> pd.DataFrame:
     """Análisis de tablillas por cliente"""
     try:
-        customer_data = {}
-
-        for i in range(len(df)):
-            try:
-                customer = str(df.iloc[i, 8])[:50]
-                tablets_str = str(df.iloc[i, 12])
-                open_tablets_str = str(df.iloc[i, 14])
-
-                if tablets_str not in ['', 'nan', 'None'] and customer not in ['', 'nan']:
-                    tablets_list = [x.strip() for x in tablets_str.split(',')
-                                   if x.strip() and x.strip() != '0']
-                    total = len(tablets_list)
-
-                    if total > 0:
-                        if customer not in customer_data:
-                            customer_data[customer] = {'total': 0, 'cerradas': 0, 'abiertas': 0}
-
-                        customer_data[customer]['total'] += total
-
-                        if open_tablets_str not in ['', 'nan', 'None', '0']:
-                            open_list = [x.strip() for x in open_tablets_str.split(',') if x.strip()]
-                            abiertas = len(open_list)
-                            customer_data[customer]['abiertas'] += abiertas
-                            customer_data[customer]['cerradas'] += (total - abiertas)
-                        else:
-                            customer_data[customer]['cerradas'] += total
-            except:
-                continue
-
-        result = []
-        for customer, data in customer_data.items():
-            result.append({
-                'Cliente': customer,
-                'Total': data['total'],
-                'Abiertas': data['abiertas'],
-                'Cerradas': data['cerradas'],
-                'Tasa_Cierre_%': round((data['cerradas']/data['total']*100), 2)
-            })
-
-        if result:
-            return pd.DataFrame(result).sort_values('Abiertas', ascending=False).head(10)
-        return pd.DataFrame()
+        items = build_tablet_table(df).counted_items()
+        items = items[~items['customer'].isin(['', 'nan'])]
+        summary = TabletTable.summarize(items, 'customer')
+        if summary.empty:
+            return pd.DataFrame()
+
+        result = pd.DataFrame({
+            'Cliente': summary['customer'],
+            'Total': summary['total'],
+            'Abiertas': summary['abiertas'],
+            'Cerradas': summary['cerradas'],
+            'Tasa_Cierre_%': [round(c / t * 100, 2) for c, t in zip(summary['cerradas'], summary['total'])]
+        })
+        return result.sort_values('Abiertas', ascending=False).head(10)
     except Exception as e:
-        st.error(f"Error en create_tablets_by_customer: {e}")
+        logger.error(f"Error en create_tablets_by_customer: {e}")
         return pd.DataFrame()
 
 
+@profiled()
 def validate_tablets_integrity(df: pd.DataFrame) -> List[Dict]:
     """Valida integridad: Total vs Open count"""
     try:
-        discrepancies = []
-
-        for i in range(len(df)):
-            try:
-                slip = str(df.iloc[i, 2])
-                total_str = str(df.iloc[i, 13])
-                open_str = str(df.iloc[i, 14])
-
-                if total_str.isdigit() and open_str not in ['', 'nan', 'None']:
-                    expected = int(total_str)
-                    actual = len(re.findall(r'\d{2,4}[MALT]', open_str))
-
-                    if expected != actual:
-                        discrepancies.append({
-                            'Slip': slip,
-                            'Esperado': expected,
-                            'Encontrado': actual,
-                            'Diferencia': abs(expected - actual)
-                        })
-            except:
-                continue
-
-        return discrepancies
+        table = build_tablet_table(df)
+        rows = table.rows
+        if rows.empty:
+            return []
+
+        found = table.items.groupby('row')['open_matches'].sum().reindex(
+            range(len(rows)), fill_value=0).to_numpy()
+        expected = rows['total'].to_numpy()
+        checked = ~np.isnan(expected) & ~rows['open_text'].isin(MISSING_TEXT).to_numpy()
+        mismatch = checked & (expected != found)
+
+        return [
+            {'Slip': slip, 'Esperado': int(exp), 'Encontrado': int(act), 'Diferencia': abs(int(exp) - int(act))}
+            for slip, exp, act in zip(rows['slip'][mismatch], expected[mismatch], found[mismatch])
+        ]
     except:
         return []
 
 
+@profiled()
+def summarize_tablets_by_date(df: pd.DataFrame, date_column: str = 'fecha_archivo') -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Evolución de tablillas de un histórico consolidado en una sola pasada:
+    - daily: Fecha, Total, Cerradas, Abiertas, Tasa_Cierre (una fila por fecha)
+    - by_warehouse: Fecha, Warehouse, Total, Abiertas, Cerradas (por fecha,
+      warehouses de más a menos tablillas)
+
+    Equivale a calcular calculate_tablets_metrics y
+    create_tablets_breakdown_by_warehouse fecha a fecha: el parseo de tablillas
+    es por fila, así que basta con agrupar la TabletTable del conjunto.
+    """
+    dates = pd.to_datetime(df[date_column])
+    days = pd.DatetimeIndex(np.sort(dates.unique()))
+
+    # TabletTable solo lee las columnas del reporte; fecha_archivo y nombre_archivo se ignoran
+    items = build_tablet_table(df).counted_items()
+    items = items.assign(fecha=dates.to_numpy()[items['row'].to_numpy(dtype=np.int64)])
+
+    totals = items.groupby('fecha')[['listed', 'is_open']].sum().astype(np.int64).reindex(days, fill_value=0)
+    total = totals['listed'].to_numpy()
+    closed = total - totals['is_open'].to_numpy()
+    daily = pd.DataFrame({
+        'Fecha': days.strftime('%Y-%m-%d'),
+        'Total': total,
+        'Cerradas': closed,
+        'Abiertas': totals['is_open'].to_numpy(),
+        'Tasa_Cierre': np.divide(closed * 100, total, out=np.zeros(len(total)), where=total > 0),
+    })
+
+    by_warehouse = items.groupby(['fecha', 'warehouse'], sort=False)[['listed', 'is_open']].sum().astype(np.int64)
+    by_warehouse = by_warehouse.reset_index().sort_values(['fecha', 'listed'], ascending=[True, False],
+                                                          kind='stable')
+    by_warehouse = pd.DataFrame({
+        'Fecha': by_warehouse['fecha'].dt.strftime('%Y-%m-%d').to_numpy(),
+        'Warehouse': by_warehouse['warehouse'].to_numpy(),
+        'Total': by_warehouse['listed'].to_numpy(),
+        'Abiertas': by_warehouse['is_open'].to_numpy(),
+        'Cerradas': (by_warehouse['listed'] - by_warehouse['is_open']).to_numpy(),
+    })
+
+    return daily, by_warehouse
+
+
 # ============================================================================
 # EXPORTACIÓN EXCEL PROFESIONAL CON MÚLTIPLES HOJAS
 # ============================================================================
 
-def export_to_professional_excel(df: pd.DataFrame) -> io.BytesIO:
+# Filas convertidas por bloque al escribir una hoja en streaming
+EXCEL_CHUNK_ROWS = 5000
+
+# Formato de fecha que usa pandas.to_excel para columnas datetime
+EXCEL_DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+
+
+def _excel_column_values(sheet, column: pd.Series) -> List:
+    """Valores Python de una columna para openpyxl (celdas vacías para NaN/None/NaT/NA)"""
+    values = column.to_numpy(dtype=object, na_value=None).tolist()
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.number_format = EXCEL_DATETIME_FORMAT
+            cells.append(cell)
+        return cells
+    return values
+
+
+def write_excel_sheets(sheets: List[Tuple[str, pd.DataFrame, Optional[List]]]) -> io.BytesIO:
+    """
+    Escribe (nombre, DataFrame, cabecera) en un libro openpyxl write_only.
+
+    Las filas se convierten por bloques de EXCEL_CHUNK_ROWS y openpyxl las
+    serializa a disco al añadirlas: la memoria no crece con el número de
+    filas ni se copia el DataFrame (la cabecera sustituye a renombrar columnas).
+    """
+    workbook = Workbook(write_only=True)
+
+    for sheet_name, df, header in sheets:
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(list(header) if header is not None else list(df.columns))
+
+        for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+            columns = [_excel_column_values(sheet, chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+            for row in zip(*columns):
+                sheet.append(row)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+@contextmanager
+def export_meter(label: str, rows: int, stats: Optional[Dict] = None, trace_memory: bool = False):
+    """
+    Mide una exportación: tiempo siempre (al log); stats recibe rows, seconds
+    y peak_mb. La memoria pico (tracemalloc) solo con trace_memory: multiplica
+    el tiempo de exportación y es global al proceso, así que es para
+    benchmark.py (un proceso por medición) y no para la interfaz, donde
+    varias sesiones exportan a la vez.
+    """
+    trace = trace_memory and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if trace_memory else None
+        if trace:
+            tracemalloc.stop()
+        if stats is not None:
+            stats.update(rows=rows, seconds=seconds, peak_mb=peak_mb)
+        logger.info(f"{label}: {rows} filas en {seconds:.2f}s"
+                    + (f", pico {peak_mb:.1f} MB" if peak_mb is not None else ""))
+
+
+@profiled()
+def export_to_professional_excel(df: pd.DataFrame, stats: Optional[Dict] = None,
+                                 trace_memory: bool = False) -> io.BytesIO:
     """
     Crea Excel profesional con múltiples hojas:
     - Metadata
@@ -938,12 +3501,12 @@ def export_to_professional_excel(df: pd.DataFrame) -> io.BytesIO:
     - Tablillas por warehouse
     - Top clientes
     - Discrepancias
+
+    stats (opcional) recibe filas, segundos y, con trace_memory, memoria pico
+    de la exportación (ver export_meter).
     """
     try:
-        buffer = io.BytesIO()
-
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-
+        with export_meter("Excel profesional", len(df), stats, trace_memory):
             # HOJA 1: METADATA
             metadata = pd.DataFrame([{
                 'Sistema': 'Camelot PDF Extractor Pro',
@@ -952,19 +3515,10 @@ def export_to_professional_excel(df: pd.DataFrame) -> io.BytesIO:
                 'Total_Albaranes': len(df),
                 'Empresa': 'Alsina Forms Co., Inc.'
             }])
-            metadata.to_excel(writer, sheet_name='Metadata', index=False)
-
-            # HOJA 2: DATOS PRINCIPALES (con nombres de columnas)
-            export_df = df.copy()
-            if len(export_df.columns) >= 18:
-                export_df.columns = [
-                    'Wh', 'Return_Prefix', 'Return_Slip', 'Return_Date',
-                    'Jobsite', 'Cost_Center', 'Invoice_Date1', 'Invoice_Date2',
-                    'Customer', 'Job_Name', 'Definitive', 'Counted_Date',
-                    'Tablets', 'Total', 'Open', 'Tablets_Total',
-                    'Counting_Delay', 'Validation_Delay'
-                ] + list(export_df.columns[18:])
-            export_df.to_excel(writer, sheet_name='Datos_Principales', index=False)
+            sheets = [('Metadata', metadata, None)]
+
+            # HOJA 2: DATOS PRINCIPALES (esquema tipado: fechas y conteos como celdas numéricas)
+            sheets.append(('Datos_Principales', ensure_schema(df), None))
 
             # HOJA 3: RESUMEN EJECUTIVO TABLILLAS
             metrics = calculate_tablets_metrics(df)
@@ -975,43 +3529,212 @@ def export_to_professional_excel(df: pd.DataFrame) -> io.BytesIO:
                 'Tasa_Cierre_%': round(metrics['tasa_cierre'], 2),
                 'Estado': 'EXCELENTE' if metrics['tasa_cierre'] >= 80 else 'BUENO' if metrics['tasa_cierre'] >= 70 else 'REQUIERE_ATENCION'
             }])
-            summary_df.to_excel(writer, sheet_name='Resumen_Ejecutivo', index=False)
+            sheets.append(('Resumen_Ejecutivo', summary_df, None))
 
             # HOJA 4: TABLILLAS POR WAREHOUSE
             warehouse_df = create_tablets_breakdown_by_warehouse(df)
             if not warehouse_df.empty:
-                warehouse_df.to_excel(writer, sheet_name='Tablillas_Por_Warehouse', index=False)
+                sheets.append(('Tablillas_Por_Warehouse', warehouse_df, None))
 
             # HOJA 5: TOP CLIENTES
             customer_df = create_tablets_by_customer(df)
             if not customer_df.empty:
-                customer_df.to_excel(writer, sheet_name='Top_Clientes_Tablillas', index=False)
+                sheets.append(('Top_Clientes_Tablillas', customer_df, None))
 
             # HOJA 6: DISCREPANCIAS (si existen)
             discrepancies = validate_tablets_integrity(df)
             if discrepancies:
-                disc_df = pd.DataFrame(discrepancies)
-                disc_df.to_excel(writer, sheet_name='Discrepancias', index=False)
+                sheets.append(('Discrepancias', pd.DataFrame(discrepancies), None))
 
-        buffer.seek(0)
-        return buffer
+            return write_excel_sheets(sheets)
 
     except Exception as e:
-        st.error(f"Error creando Excel profesional: {e}")
+        logger.error(f"Error creando Excel profesional: {e}")
         return None
 
 
+@profiled()
+def export_historical_excel(combined_df: pd.DataFrame, tablets_df: pd.DataFrame,
+                            stats: Optional[Dict] = None, trace_memory: bool = False) -> io.BytesIO:
+    """
+    Excel del análisis histórico:
+    - Datos consolidados (todas las filas de todos los archivos)
+    - Evolución de tablillas
+    - Por warehouse del último período
+    """
+    with export_meter("Excel histórico", len(combined_df), stats, trace_memory):
+        sheets = [
+            ('Datos_Consolidados', combined_df, None),
+            ('Evolucion_Tablillas', tablets_df, None),
+        ]
+
+        if not combined_df.empty:
+            last_date = combined_df['fecha_archivo'].max()
+            last_df = combined_df[combined_df['fecha_archivo'] == last_date]
+            last_warehouse = create_tablets_breakdown_by_warehouse(last_df)
+            if not last_warehouse.empty:
+                sheets.append(('Ultimo_Por_Warehouse', last_warehouse, None))
+
+        return write_excel_sheets(sheets)
+
+
 # ============================================================================
 # DASHBOARD INTELIGENTE DE TABLILLAS
 # ============================================================================
 
+@profiled()
+def build_tablets_dashboard(df: pd.DataFrame) -> Dict:
+    """Métricas, agregados, discrepancias, figuras y alertas del dashboard de tablillas"""
+    metrics = calculate_tablets_metrics(df)
+
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=['Cerradas', 'Abiertas'],
+        values=[metrics['cerradas'], metrics['abiertas']],
+        hole=0.4,
+        marker=dict(colors=['#28a745', '#dc3545']),
+        textinfo='label+percent',
+        textposition='auto'
+    )])
+    fig_pie.update_layout(
+        title="Estado de Tablillas",
+        annotations=[dict(
+            text=f"{metrics['total']:,}<br>Total",
+            x=0.5, y=0.5,
+            font_size=20,
+            showarrow=False
+        )],
+        showlegend=True
+    )
+
+    fig_gauge = go.Figure(go.Indicator(
+        mode="gauge+number+delta",
+        value=metrics['tasa_cierre'],
+        title={'text': "Tasa de Cierre (%)"},
+        delta={'reference': 80, 'increasing': {'color': "green"}},
+        gauge={
+            'axis': {'range': [None, 100]},
+            'bar': {'color': "#1f77b4"},
+            'steps': [
+                {'range': [0, 70], 'color': "#ffcccc"},
+                {'range': [70, 80], 'color': "#fff4cc"},
+                {'range': [80, 100], 'color': "#ccffcc"}
+            ],
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': 80
+            }
+        }
+    ))
+
+    warehouse_df = create_tablets_breakdown_by_warehouse(df)
+    fig_bar = None
+    if not warehouse_df.empty:
+        fig_bar = go.Figure()
+        fig_bar.add_trace(go.Bar(
+            name='Cerradas',
+            x=warehouse_df['Warehouse'],
+            y=warehouse_df['Cerradas'],
+            marker_color='#28a745',
+            text=warehouse_df['Cerradas'],
+            textposition='inside'
+        ))
+        fig_bar.add_trace(go.Bar(
+            name='Abiertas',
+            x=warehouse_df['Warehouse'],
+            y=warehouse_df['Abiertas'],
+            marker_color='#dc3545',
+            text=warehouse_df['Abiertas'],
+            textposition='inside'
+        ))
+        fig_bar.update_layout(
+            title="Distribución por Warehouse",
+            barmode='stack',
+            xaxis_title="Warehouse",
+            yaxis_title="Cantidad de Tablillas",
+            showlegend=True,
+            hovermode='x unified'
+        )
+
+    customer_df = create_tablets_by_customer(df)
+    fig_customers = None
+    if not customer_df.empty:
+        fig_customers = px.bar(
+            customer_df,
+            x='Abiertas',
+            y='Cliente',
+            orientation='h',
+            title="Top 10 Clientes - Tablillas Pendientes",
+            color='Abiertas',
+            color_continuous_scale='Reds',
+            text='Abiertas'
+        )
+        fig_customers.update_traces(textposition='outside')
+        fig_customers.update_layout(
+            yaxis={'categoryorder': 'total ascending'},
+            showlegend=False,
+            height=400
+        )
+
+    discrepancies = validate_tablets_integrity(df)
+
+    alerts = []
+
+    if metrics['tasa_cierre'] < 70:
+        alerts.append({
+            'tipo': '🔴 CRÍTICO',
+            'mensaje': f"Tasa de cierre global muy baja: {metrics['tasa_cierre']:.1f}%",
+            'acción': "Revisar procesos de cierre de tablillas"
+        })
+    elif metrics['tasa_cierre'] < 80:
+        alerts.append({
+            'tipo': '🟡 ADVERTENCIA',
+            'mensaje': f"Tasa de cierre por debajo del objetivo: {metrics['tasa_cierre']:.1f}%",
+            'acción': "Objetivo recomendado: >80%"
+        })
+
+    if not warehouse_df.empty:
+        for _, row in warehouse_df.iterrows():
+            tasa = float(row['Tasa_Cierre_%'])
+            if tasa < 70:
+                alerts.append({
+                    'tipo': '🔴 WAREHOUSE',
+                    'mensaje': f"{row['Warehouse']}: Tasa de cierre {tasa:.1f}%",
+                    'acción': f"Revisar {row['Abiertas']} tablillas abiertas"
+                })
+
+    if not customer_df.empty:
+        top_cliente = customer_df.iloc[0]
+        if top_cliente['Abiertas'] > 10:
+            alerts.append({
+                'tipo': '🟡 CLIENTE',
+                'mensaje': f"{top_cliente['Cliente']}: {top_cliente['Abiertas']} tablillas abiertas",
+                'acción': "Contactar para coordinación de cierre"
+            })
+
+    return {
+        'metrics': metrics,
+        'fig_pie': fig_pie,
+        'fig_gauge': fig_gauge,
+        'warehouse_df': warehouse_df,
+        'fig_bar': fig_bar,
+        'customer_df': customer_df,
+        'fig_customers': fig_customers,
+        'discrepancies': pd.DataFrame(discrepancies),
+        'alerts': alerts,
+    }
+
+
+@profiled()
 def create_tablets_dashboard(df: pd.DataFrame):
     """Dashboard completo e inteligente de tablillas"""
     st.header("📦 Dashboard Inteligente de Tablillas")
     st.markdown("**Análisis completo del inventario de tablillas**")
 
     try:
-        metrics = calculate_tablets_metrics(df)
+        dashboard = session_artifacts().get_or_compute(
+            (frame_fingerprint(df), 'tablets_dashboard'), lambda: build_tablets_dashboard(df))
+        metrics = dashboard['metrics']
 
         st.subheader("🎯 Métricas Globales")
         col1, col2, col3, col4 = st.columns(4)
@@ -1044,119 +3767,38 @@ def create_tablets_dashboard(df: pd.DataFrame):
         col1, col2 = st.columns(2)
 
         with col1:
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=['Cerradas', 'Abiertas'],
-                values=[metrics['cerradas'], metrics['abiertas']],
-                hole=0.4,
-                marker=dict(colors=['#28a745', '#dc3545']),
-                textinfo='label+percent',
-                textposition='auto'
-            )])
-            fig_pie.update_layout(
-                title="Estado de Tablillas",
-                annotations=[dict(
-                    text=f"{metrics['total']:,}<br>Total",
-                    x=0.5, y=0.5,
-                    font_size=20,
-                    showarrow=False
-                )],
-                showlegend=True
-            )
-            st.plotly_chart(fig_pie, use_container_width=True)
+            st.plotly_chart(dashboard['fig_pie'], use_container_width=True)
 
         with col2:
-            fig_gauge = go.Figure(go.Indicator(
-                mode="gauge+number+delta",
-                value=metrics['tasa_cierre'],
-                title={'text': "Tasa de Cierre (%)"},
-                delta={'reference': 80, 'increasing': {'color': "green"}},
-                gauge={
-                    'axis': {'range': [None, 100]},
-                    'bar': {'color': "#1f77b4"},
-                    'steps': [
-                        {'range': [0, 70], 'color': "#ffcccc"},
-                        {'range': [70, 80], 'color': "#fff4cc"},
-                        {'range': [80, 100], 'color': "#ccffcc"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 4},
-                        'thickness': 0.75,
-                        'value': 80
-                    }
-                }
-            ))
-            st.plotly_chart(fig_gauge, use_container_width=True)
+            st.plotly_chart(dashboard['fig_gauge'], use_container_width=True)
 
         st.subheader("🏭 Análisis por Warehouse")
-        warehouse_df = create_tablets_breakdown_by_warehouse(df)
+        warehouse_df = dashboard['warehouse_df']
 
         if not warehouse_df.empty:
             col1, col2 = st.columns([2, 1])
 
             with col1:
-                fig_bar = go.Figure()
-                fig_bar.add_trace(go.Bar(
-                    name='Cerradas',
-                    x=warehouse_df['Warehouse'],
-                    y=warehouse_df['Cerradas'],
-                    marker_color='#28a745',
-                    text=warehouse_df['Cerradas'],
-                    textposition='inside'
-                ))
-                fig_bar.add_trace(go.Bar(
-                    name='Abiertas',
-                    x=warehouse_df['Warehouse'],
-                    y=warehouse_df['Abiertas'],
-                    marker_color='#dc3545',
-                    text=warehouse_df['Abiertas'],
-                    textposition='inside'
-                ))
-                fig_bar.update_layout(
-                    title="Distribución por Warehouse",
-                    barmode='stack',
-                    xaxis_title="Warehouse",
-                    yaxis_title="Cantidad de Tablillas",
-                    showlegend=True,
-                    hovermode='x unified'
-                )
-                st.plotly_chart(fig_bar, use_container_width=True)
+                st.plotly_chart(dashboard['fig_bar'], use_container_width=True)
 
             with col2:
                 st.markdown("**📋 Detalle por Warehouse**")
                 st.dataframe(warehouse_df, use_container_width=True, height=300)
 
         st.subheader("🏢 Top Clientes con Tablillas Abiertas")
-        customer_df = create_tablets_by_customer(df)
+        customer_df = dashboard['customer_df']
 
         if not customer_df.empty:
-            fig_customers = px.bar(
-                customer_df,
-                x='Abiertas',
-                y='Cliente',
-                orientation='h',
-                title="Top 10 Clientes - Tablillas Pendientes",
-                color='Abiertas',
-                color_continuous_scale='Reds',
-                text='Abiertas'
-            )
-            fig_customers.update_traces(textposition='outside')
-            fig_customers.update_layout(
-                yaxis={'categoryorder': 'total ascending'},
-                showlegend=False,
-                height=400
-            )
-            st.plotly_chart(fig_customers, use_container_width=True)
+            st.plotly_chart(dashboard['fig_customers'], use_container_width=True)
 
             with st.expander("📊 Ver tabla detallada"):
                 st.dataframe(customer_df, use_container_width=True)
 
         st.subheader("🔍 Validación de Integridad")
-        discrepancies = validate_tablets_integrity(df)
-
-        if discrepancies:
-            st.warning(f"⚠️ Se encontraron **{len(discrepancies)}** discrepancias entre Total y Open")
+        disc_df = dashboard['discrepancies']
 
-            disc_df = pd.DataFrame(discrepancies)
+        if not disc_df.empty:
+            st.warning(f"⚠️ Se encontraron **{len(disc_df)}** discrepancias entre Total y Open")
 
             col1, col2 = st.columns([2, 1])
             with col1:
@@ -1178,40 +3820,7 @@ def create_tablets_dashboard(df: pd.DataFrame):
 
         st.subheader("⚠️ Alertas Inteligentes")
 
-        alerts = []
-
-        if metrics['tasa_cierre'] < 70:
-            alerts.append({
-                'tipo': '🔴 CRÍTICO',
-                'mensaje': f"Tasa de cierre global muy baja: {metrics['tasa_cierre']:.1f}%",
-                'acción': "Revisar procesos de cierre de tablillas"
-            })
-        elif metrics['tasa_cierre'] < 80:
-            alerts.append({
-                'tipo': '🟡 ADVERTENCIA',
-                'mensaje': f"Tasa de cierre por debajo del objetivo: {metrics['tasa_cierre']:.1f}%",
-                'acción': "Objetivo recomendado: >80%"
-            })
-
-        if not warehouse_df.empty:
-            for _, row in warehouse_df.iterrows():
-                tasa = float(row['Tasa_Cierre_%'])
-                if tasa < 70:
-                    alerts.append({
-                        'tipo': '🔴 WAREHOUSE',
-                        'mensaje': f"{row['Warehouse']}: Tasa de cierre {tasa:.1f}%",
-                        'acción': f"Revisar {row['Abiertas']} tablillas abiertas"
-                    })
-
-        if not customer_df.empty:
-            top_cliente = customer_df.iloc[0]
-            if top_cliente['Abiertas'] > 10:
-                alerts.append({
-                    'tipo': '🟡 CLIENTE',
-                    'mensaje': f"{top_cliente['Cliente']}: {top_cliente['Abiertas']} tablillas abiertas",
-                    'acción': "Contactar para coordinación de cierre"
-                })
-
+        alerts = dashboard['alerts']
         if alerts:
             for alert in alerts:
                 st.warning(f"**{alert['tipo']}**: {alert['mensaje']}  \n💡 *{alert['acción']}*")
@@ -1228,18 +3837,85 @@ def create_tablets_dashboard(df: pd.DataFrame):
 # DASHBOARD DE ALBARANES
 # ============================================================================
 
+@profiled()
+def build_analysis_dashboard(df: pd.DataFrame) -> Dict:
+    """Frame de análisis, KPIs, estadísticas por warehouse y figuras del dashboard de albaranes"""
+    analysis_df = BusinessAnalyzer().parse_dataframe(df)
+
+    total_albaranes = len(analysis_df)
+    closed_albaranes = len(analysis_df[analysis_df['is_closed'] == True])
+
+    warehouse_stats = []
+    for wh in analysis_df['warehouse'].unique():
+        if wh != 'UNKNOWN':
+            wh_data = analysis_df[analysis_df['warehouse'] == wh]
+            wh_total = len(wh_data)
+            wh_closed = len(wh_data[wh_data['is_closed'] == True])
+            wh_rate = (wh_closed / wh_total * 100) if wh_total > 0 else 0
+
+            closed_data = wh_data[wh_data['is_closed'] == True]
+            avg_days = closed_data['business_days_to_close'].mean() if len(closed_data) > 0 else 0
+
+            warehouse_stats.append({
+                'Warehouse': wh,
+                'Total': wh_total,
+                'Cerrados': wh_closed,
+                'Pendientes': wh_total - wh_closed,
+                'Tasa Cierre': f"{wh_rate:.1f}%",
+                'Días Promedio': f"{avg_days:.1f}" if avg_days > 0 else "N/A"
+            })
+
+    warehouse_df = pd.DataFrame(warehouse_stats)
+    fig_warehouse = None
+    if warehouse_stats:
+        fig_warehouse = px.bar(
+            warehouse_df,
+            x='Warehouse',
+            y=['Cerrados', 'Pendientes'],
+            title="Distribución de Albaranes por Warehouse",
+            color_discrete_map={'Cerrados': '#28a745', 'Pendientes': '#dc3545'}
+        )
+
+    closing_days = None
+    fig_days = None
+    valid_days = analysis_df[analysis_df['is_closed'] == True].dropna(subset=['business_days_to_close'])
+    if len(valid_days) > 0:
+        closing_days = {
+            'avg': valid_days['business_days_to_close'].mean(),
+            'median': valid_days['business_days_to_close'].median(),
+            'max': valid_days['business_days_to_close'].max(),
+        }
+        fig_days = px.histogram(
+            valid_days,
+            x='business_days_to_close',
+            nbins=15,
+            title="Distribución de Días Hábiles para Cierre",
+            labels={'business_days_to_close': 'Días Hábiles', 'count': 'Cantidad'}
+        )
+
+    return {
+        'analysis_df': analysis_df,
+        'total': total_albaranes,
+        'closed': closed_albaranes,
+        'warehouse_df': warehouse_df,
+        'fig_warehouse': fig_warehouse,
+        'closing_days': closing_days,
+        'fig_days': fig_days,
+    }
+
+
+@profiled()
 def create_analysis_dashboard(df: pd.DataFrame):
     """Dashboard de análisis de albaranes"""
     st.header("📊 Dashboard Ejecutivo - Análisis de Albaranes")
 
     try:
-        analyzer = BusinessAnalyzer()
-
         with st.spinner("Procesando datos para análisis..."):
-            analysis_df = analyzer.parse_dataframe(df)
+            dashboard = session_artifacts().get_or_compute(
+                (frame_fingerprint(df), 'analysis_dashboard'), lambda: build_analysis_dashboard(df))
 
-        total_albaranes = len(analysis_df)
-        closed_albaranes = len(analysis_df[analysis_df['is_closed'] == True])
+        total_albaranes = dashboard['total']
+        closed_albaranes = dashboard['closed']
         pending_albaranes = total_albaranes - closed_albaranes
         closure_rate = (closed_albaranes / total_albaranes * 100) if total_albaranes > 0 else 0
 
@@ -1257,66 +3933,23 @@ def create_analysis_dashboard(df: pd.DataFrame):
 
         st.subheader("🏭 Performance por Warehouse")
 
-        warehouse_stats = []
-        for wh in analysis_df['warehouse'].unique():
-            if wh != 'UNKNOWN':
-                wh_data = analysis_df[analysis_df['warehouse'] == wh]
-                wh_total = len(wh_data)
-                wh_closed = len(wh_data[wh_data['is_closed'] == True])
-                wh_rate = (wh_closed / wh_total * 100) if wh_total > 0 else 0
-
-                closed_data = wh_data[wh_data['is_closed'] == True]
-                avg_days = closed_data['business_days_to_close'].mean() if len(closed_data) > 0 else 0
-
-                warehouse_stats.append({
-                    'Warehouse': wh,
-                    'Total': wh_total,
-                    'Cerrados': wh_closed,
-                    'Pendientes': wh_total - wh_closed,
-                    'Tasa Cierre': f"{wh_rate:.1f}%",
-                    'Días Promedio': f"{avg_days:.1f}" if avg_days > 0 else "N/A"
-                })
-
-        if warehouse_stats:
-            warehouse_df = pd.DataFrame(warehouse_stats)
-            st.dataframe(warehouse_df, use_container_width=True)
-
-            fig = px.bar(
-                warehouse_df,
-                x='Warehouse',
-                y=['Cerrados', 'Pendientes'],
-                title="Distribución de Albaranes por Warehouse",
-                color_discrete_map={'Cerrados': '#28a745', 'Pendientes': '#dc3545'}
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        if dashboard['fig_warehouse'] is not None:
+            st.dataframe(dashboard['warehouse_df'], use_container_width=True)
+            st.plotly_chart(dashboard['fig_warehouse'], use_container_width=True)
 
         st.subheader("⏱️ Análisis de Tiempos de Cierre")
 
-        closed_data = analysis_df[analysis_df['is_closed'] == True]
-        if len(closed_data) > 0:
-            valid_days = closed_data.dropna(subset=['business_days_to_close'])
-
-            if len(valid_days) > 0:
-                avg_days = valid_days['business_days_to_close'].mean()
-                median_days = valid_days['business_days_to_close'].median()
-                max_days = valid_days['business_days_to_close'].max()
-
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Días Promedio", f"{avg_days:.1f}")
-                with col2:
-                    st.metric("Días Mediana", f"{median_days:.1f}")
-                with col3:
-                    st.metric("Máximo Días", f"{max_days:.0f}")
-
-                fig = px.histogram(
-                    valid_days,
-                    x='business_days_to_close',
-                    nbins=15,
-                    title="Distribución de Días Hábiles para Cierre",
-                    labels={'business_days_to_close': 'Días Hábiles', 'count': 'Cantidad'}
-                )
-                st.plotly_chart(fig, use_container_width=True)
+        closing_days = dashboard['closing_days']
+        if closing_days is not None:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Días Promedio", f"{closing_days['avg']:.1f}")
+            with col2:
+                st.metric("Días Mediana", f"{closing_days['median']:.1f}")
+            with col3:
+                st.metric("Máximo Días", f"{closing_days['max']:.0f}")
+
+            st.plotly_chart(dashboard['fig_days'], use_container_width=True)
 
     except Exception as e:
         st.error(f"Error creando dashboard: {e}")
@@ -1326,9 +3959,94 @@ def create_analysis_dashboard(df: pd.DataFrame):
 # DASHBOARD HISTÓRICO MEJORADO
 # ============================================================================
 
+@profiled()
 def create_historical_dashboard():
     """Dashboard de análisis histórico MEJORADO con tablillas"""
     st.header("📈 Dashboard Histórico - Análisis Comparativo")
+
+    source = st.radio(
+        "Origen de datos",
+        ["🗄️ Almacén local", "📁 Archivos Excel"],
+        horizontal=True,
+        help="El almacén local guarda cada extracción por fecha de reporte"
+    )
+
+    if source == "🗄️ Almacén local":
+        combined_df = load_historical_from_store()
+    else:
+        combined_df = load_historical_from_excel()
+
+    if combined_df is not None and not combined_df.empty:
+        render_historical_analysis(combined_df)
+
+
+def load_historical_from_store() -> Optional[pd.DataFrame]:
+    """Histórico desde SnapshotStore, filtrado por rango de fechas"""
+    store = SnapshotStore()
+    snapshots = store.snapshots()
+
+    if snapshots.empty:
+        st.warning("🗄️ El almacén está vacío: extrae un PDF con 'Guardar en histórico' activado "
+                   "o usa archivos Excel")
+        return None
+
+    first_date = snapshots['report_date'].min().date()
+    last_date = snapshots['report_date'].max().date()
+    date_range = st.date_input(
+        "Rango de fechas",
+        value=(max(first_date, last_date - timedelta(days=90)), last_date),
+        min_value=first_date,
+        max_value=last_date
+    )
+    if len(date_range) != 2:
+        st.info("Selecciona la fecha final del rango")
+        return None
+
+    start = time.perf_counter()
+    combined_df = store.load(*date_range)
+    elapsed = time.perf_counter() - start
+    st.success(f"✅ {combined_df['fecha_archivo'].nunique()} fechas · {len(combined_df):,} filas "
+               f"cargadas del almacén en {elapsed:.2f}s")
+
+    with st.expander(f"🗄️ Instantáneas guardadas ({len(snapshots)})"):
+        st.dataframe(snapshots, use_container_width=True, hide_index=True)
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            delete_date = st.selectbox("Eliminar fecha", snapshots['report_date'].dt.strftime('%Y-%m-%d'),
+                                       index=None)
+        with col2:
+            if st.button("🗑️ Eliminar", disabled=delete_date is None):
+                store.delete(delete_date)
+                st.rerun()
+
+    return combined_df
+
+
+HISTORICAL_SHEET = 'Datos_Principales'
+
+
+def read_historical_workbook(data: bytes) -> Tuple[pd.DataFrame, float]:
+    """
+    Lee de un Excel exportado solo la hoja Datos_Principales y sus 18 columnas
+    de reporte, ya con el esquema tipado. Devuelve el DataFrame y los segundos
+    de lectura. Se ejecuta en un proceso worker.
+    """
+    start = time.perf_counter()
+    df = pd.read_excel(io.BytesIO(data), sheet_name=HISTORICAL_SHEET, engine='openpyxl',
+                       usecols=range(len(REPORT_COLUMNS)))
+    # Excel antiguos con cabeceras Columna_N: las columnas se nombran por posición
+    df.columns = REPORT_COLUMNS[:df.shape[1]]
+    return normalize_schema(df), time.perf_counter() - start
+
+
+def load_historical_from_excel() -> Optional[pd.DataFrame]:
+    """
+    Histórico desde archivos Excel exportados por la app (hoja Datos_Principales).
+
+    Cada hoja leída se guarda en la memo de sesión por SHA-256 del archivo:
+    añadir un día nuevo a la selección solo lee ese archivo. Los archivos
+    pendientes se leen en paralelo en un pool de procesos.
+    """
     st.info("📁 Carga múltiples archivos Excel para análisis de tendencias")
 
     uploaded_files = st.file_uploader(
@@ -1338,218 +4056,372 @@ def create_historical_dashboard():
         help="Archivos Excel generados por la app"
     )
 
-    if uploaded_files:
-        st.success(f"✅ {len(uploaded_files)} archivos cargados")
-
-        all_data = []
-        file_info = []
+    if not uploaded_files:
+        st.warning("👆 Sube archivos Excel para comenzar")
+        return None
 
-        for uploaded_file in uploaded_files:
+    memo = session_artifacts()
+    files = []
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        files.append((uploaded_file.name, (hashlib.sha256(data).hexdigest(), 'historical_sheet'), data))
+
+    sheets = {key: memo.get(key) for _, key, _ in files}
+    timings = {}
+    errors = {}
+    pending = {key: data for _, key, data in files if sheets[key] is None}
+
+    start = time.perf_counter()
+    if len(pending) > 1:
+        workers = min(len(pending), os.cpu_count() or 1)
+        with st.spinner(f"Leyendo {len(pending)} archivos en {workers} procesos..."):
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_get_process_pool_context()) as executor:
+                futures = {executor.submit(read_historical_workbook, data): key for key, data in pending.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        sheets[key], timings[key] = future.result()
+                    except Exception as e:
+                        errors[key] = e
+    else:
+        for key, data in pending.items():
             try:
-                df = pd.read_excel(uploaded_file, sheet_name='Datos_Principales')
-                filename = uploaded_file.name
-                date_match = re.search(r'(\d{8})', filename)
+                sheets[key], timings[key] = read_historical_workbook(data)
+            except Exception as e:
+                errors[key] = e
+    elapsed = time.perf_counter() - start
+
+    all_data = []
+    file_info = []
+
+    for filename, key, _ in files:
+        if key in errors:
+            st.error(f"Error leyendo {filename}: {errors[key]}")
+            continue
+        if key in timings:
+            memo.put(key, sheets[key])
+
+        # "export_12345678.xlsx" no es una fecha: se trata como un nombre sin fecha
+        file_date = date_from_filename(filename) or datetime.now()
+
+        df = sheets[key].assign(fecha_archivo=file_date, nombre_archivo=filename)
+        all_data.append(df)
+
+        file_info.append({
+            'Archivo': filename,
+            'Fecha': file_date.strftime('%Y-%m-%d'),
+            'Filas': len(df),
+            'Segundos': timings.get(key),
+            'Origen': 'leído' if key in timings else 'caché'
+        })
+
+    st.success(f"✅ {len(all_data)} archivos cargados · {len(pending)} leídos en {elapsed:.2f}s · "
+               f"{len(files) - len(pending)} desde caché")
+    with st.expander("⏱️ Tiempos de carga por archivo"):
+        st.dataframe(pd.DataFrame(file_info), use_container_width=True, hide_index=True,
+                     column_config={'Segundos': st.column_config.NumberColumn(format="%.2f")})
+
+    if not all_data:
+        return None
+    # Las categorías difieren entre archivos: se vuelven a unificar tras concatenar
+    return normalize_schema(pd.concat(all_data, ignore_index=True))
+
+
+def render_historical_analysis(combined_df: pd.DataFrame):
+    """Evolución de tablillas, por warehouse, resumen y exportación de un histórico consolidado"""
+    # ============================================================
+    # ANÁLISIS DE TABLILLAS HISTÓRICO
+    # ============================================================
+
+    st.subheader("📦 Evolución de Tablillas en el Tiempo")
+
+    tablets_df, warehouse_daily = summarize_tablets_by_date(combined_df)
+
+    # Gráfico de evolución de tablillas
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=tablets_df['Fecha'],
+        y=tablets_df['Total'],
+        mode='lines+markers',
+        name='Total',
+        line=dict(color='#1f77b4', width=3),
+        marker=dict(size=8)
+    ))
+    fig.add_trace(go.Scatter(
+        x=tablets_df['Fecha'],
+        y=tablets_df['Cerradas'],
+        mode='lines+markers',
+        name='Cerradas',
+        line=dict(color='#28a745', width=3),
+        marker=dict(size=8),
+        fill='tonexty'
+    ))
+    fig.add_trace(go.Scatter(
+        x=tablets_df['Fecha'],
+        y=tablets_df['Abiertas'],
+        mode='lines+markers',
+        name='Abiertas',
+        line=dict(color='#dc3545', width=3),
+        marker=dict(size=8)
+    ))
+    fig.update_layout(
+        title="Evolución de Tablillas - Total, Cerradas y Abiertas",
+        xaxis_title="Fecha",
+        yaxis_title="Cantidad de Tablillas",
+        hovermode='x unified',
+        height=500
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Gráfico de tasa de cierre
+    fig_tasa = go.Figure()
+    fig_tasa.add_trace(go.Scatter(
+        x=tablets_df['Fecha'],
+        y=tablets_df['Tasa_Cierre'],
+        mode='lines+markers',
+        name='Tasa de Cierre',
+        line=dict(color='#ff7f0e', width=3),
+        marker=dict(size=8),
+        fill='tozeroy'
+    ))
+    fig_tasa.add_hline(
+        y=80,
+        line_dash="dash",
+        line_color="green",
+        annotation_text="Objetivo: 80%",
+        annotation_position="right"
+    )
+    fig_tasa.update_layout(
+        title="Tasa de Cierre de Tablillas Histórica (%)",
+        xaxis_title="Fecha",
+        yaxis_title="Tasa de Cierre (%)",
+        hovermode='x unified',
+        height=400
+    )
+    st.plotly_chart(fig_tasa, use_container_width=True)
 
-                if date_match:
-                    file_date = datetime.strptime(date_match.group(1), '%Y%m%d')
-                else:
-                    file_date = datetime.now()
+    # ============================================================
+    # ANÁLISIS POR WAREHOUSE HISTÓRICO
+    # ============================================================
 
-                df['fecha_archivo'] = file_date
-                df['nombre_archivo'] = filename
-                all_data.append(df)
+    st.subheader("🏭 Evolución por Warehouse")
 
-                file_info.append({
-                    'Archivo': filename,
-                    'Fecha': file_date.strftime('%Y-%m-%d'),
-                    'Filas': len(df)
-                })
-            except Exception as e:
-                st.error(f"Error leyendo {uploaded_file.name}: {e}")
+    # Crear gráfico por warehouse
+    if not warehouse_daily.empty:
+        fig_wh = go.Figure()
 
-        if all_data:
-            combined_df = pd.concat(all_data, ignore_index=True)
+        for wh, wh_df in warehouse_daily.groupby('Warehouse', sort=False):
+            fig_wh.add_trace(go.Scatter(
+                x=wh_df['Fecha'],
+                y=wh_df['Abiertas'],
+                mode='lines+markers',
+                name=wh,
+                line=dict(width=2),
+                marker=dict(size=6)
+            ))
 
-            # ============================================================
-            # ANÁLISIS DE TABLILLAS HISTÓRICO
-            # ============================================================
+        fig_wh.update_layout(
+            title="Evolución de Tablillas Abiertas por Warehouse",
+            xaxis_title="Fecha",
+            yaxis_title="Tablillas Abiertas",
+            hovermode='x unified',
+            height=500
+        )
+        st.plotly_chart(fig_wh, use_container_width=True)
+
+    # ============================================================
+    # TABLA RESUMEN
+    # ============================================================
+
+    st.subheader("📋 Resumen Histórico")
+    st.dataframe(tablets_df, use_container_width=True)
+
+    # ============================================================
+    # EXPORTACIÓN
+    # ============================================================
+
+    st.subheader("💾 Exportar Consolidado")
+
+    # El libro se genera solo al pulsar el botón (Streamlit llama a data en ese momento)
+    memo = session_artifacts()
+    st.download_button(
+        "📊 Descargar Análisis Histórico Consolidado",
+        lambda: memo.get_or_compute(
+            (frame_fingerprint(combined_df), 'historical_excel'),
+            lambda: export_historical_excel(combined_df, tablets_df).getvalue()),
+        f"historico_consolidado_{datetime.now().strftime('%Y%m%d')}.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
 
-            st.subheader("📦 Evolución de Tablillas en el Tiempo")
 
-            tablets_daily = []
-            for fecha in sorted(combined_df['fecha_archivo'].unique()):
-                df_fecha = combined_df[combined_df['fecha_archivo'] == fecha]
+# ============================================================================
+# VISTA DE PROGRESO (STREAMLIT)
+# ============================================================================
 
-                # Asegurar que usamos solo las primeras 18 columnas
-                df_fecha_original = df_fecha.iloc[:, :18].copy()
-                tablets_metrics = calculate_tablets_metrics(df_fecha_original)
+class StreamlitProgressView:
+    """Suscriptor de ProgressEvents que muestra el progreso de extracción en la página"""
+
+    # Extracción progresiva: filas finales que muestra la tabla en vivo
+    LIVE_PREVIEW_ROWS = 200
+
+    def __init__(self, live: bool = False):
+        self.status = st.empty()
+        self.progress = None
+        # live: tabla y contador de slips que crecen con cada evento page_rows
+        self.live = live
+        self.live_metrics = st.empty() if live else None
+        self.live_table = st.empty() if live else None
+        self.live_rows = None
+        self.live_row_count = 0
+
+    def __call__(self, event: ExtractionEvent):
+        handler = getattr(self, f"on_{event.kind}", None)
+        if handler is not None:
+            handler(event)
+
+    def on_method_started(self, event: ExtractionEvent):
+        self.status.info(f"⏳ {event.message}")
+
+    def on_method_finished(self, event: ExtractionEvent):
+        self.status.empty()
+
+    def on_methods_progress(self, event: ExtractionEvent):
+        fraction = event.data['completed'] / event.data['total']
+        if self.progress is None:
+            self.progress = st.progress(fraction, text=event.message)
+        else:
+            self.progress.progress(fraction, text=f"✅ {event.message}")
 
-                tablets_daily.append({
-                    'Fecha': fecha.strftime('%Y-%m-%d'),
-                    'Total': tablets_metrics['total'],
-                    'Cerradas': tablets_metrics['cerradas'],
-                    'Abiertas': tablets_metrics['abiertas'],
-                    'Tasa_Cierre': tablets_metrics['tasa_cierre']
-                })
+    def on_quality_passed(self, event: ExtractionEvent):
+        st.success(f"⚡ {event.message}")
 
-            tablets_df = pd.DataFrame(tablets_daily)
+    def on_pages_detected(self, event: ExtractionEvent):
+        st.info(f"📄 {event.message}")
 
-            # Gráfico de evolución de tablillas
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=tablets_df['Fecha'],
-                y=tablets_df['Total'],
-                mode='lines+markers',
-                name='Total',
-                line=dict(color='#1f77b4', width=3),
-                marker=dict(size=8)
-            ))
-            fig.add_trace(go.Scatter(
-                x=tablets_df['Fecha'],
-                y=tablets_df['Cerradas'],
-                mode='lines+markers',
-                name='Cerradas',
-                line=dict(color='#28a745', width=3),
-                marker=dict(size=8),
-                fill='tonexty'
-            ))
-            fig.add_trace(go.Scatter(
-                x=tablets_df['Fecha'],
-                y=tablets_df['Abiertas'],
-                mode='lines+markers',
-                name='Abiertas',
-                line=dict(color='#dc3545', width=3),
-                marker=dict(size=8)
-            ))
-            fig.update_layout(
-                title="Evolución de Tablillas - Total, Cerradas y Abiertas",
-                xaxis_title="Fecha",
-                yaxis_title="Cantidad de Tablillas",
-                hovermode='x unified',
-                height=500
-            )
-            st.plotly_chart(fig, use_container_width=True)
+    def on_pages_scanned(self, event: ExtractionEvent):
+        st.caption(f"🔎 {event.message}")
 
-            # Gráfico de tasa de cierre
-            fig_tasa = go.Figure()
-            fig_tasa.add_trace(go.Scatter(
-                x=tablets_df['Fecha'],
-                y=tablets_df['Tasa_Cierre'],
-                mode='lines+markers',
-                name='Tasa de Cierre',
-                line=dict(color='#ff7f0e', width=3),
-                marker=dict(size=8),
-                fill='tozeroy'
-            ))
-            fig_tasa.add_hline(
-                y=80,
-                line_dash="dash",
-                line_color="green",
-                annotation_text="Objetivo: 80%",
-                annotation_position="right"
-            )
-            fig_tasa.update_layout(
-                title="Tasa de Cierre de Tablillas Histórica (%)",
-                xaxis_title="Fecha",
-                yaxis_title="Tasa de Cierre (%)",
-                hovermode='x unified',
-                height=400
-            )
-            st.plotly_chart(fig_tasa, use_container_width=True)
-
-            # ============================================================
-            # ANÁLISIS POR WAREHOUSE HISTÓRICO
-            # ============================================================
-
-            st.subheader("🏭 Evolución por Warehouse")
-
-            warehouse_daily = {}
-            for fecha in sorted(combined_df['fecha_archivo'].unique()):
-                df_fecha = combined_df[combined_df['fecha_archivo'] == fecha]
-                df_fecha_original = df_fecha.iloc[:, :18].copy()
-
-                warehouse_breakdown = create_tablets_breakdown_by_warehouse(df_fecha_original)
-
-                for _, row in warehouse_breakdown.iterrows():
-                    wh = row['Warehouse']
-                    if wh not in warehouse_daily:
-                        warehouse_daily[wh] = []
-
-                    warehouse_daily[wh].append({
-                        'Fecha': fecha.strftime('%Y-%m-%d'),
-                        'Total': row['Total_Tablillas'],
-                        'Abiertas': row['Abiertas'],
-                        'Cerradas': row['Cerradas']
-                    })
-
-            # Crear gráfico por warehouse
-            if warehouse_daily:
-                fig_wh = go.Figure()
-
-                for wh, data in warehouse_daily.items():
-                    wh_df = pd.DataFrame(data)
-                    fig_wh.add_trace(go.Scatter(
-                        x=wh_df['Fecha'],
-                        y=wh_df['Abiertas'],
-                        mode='lines+markers',
-                        name=wh,
-                        line=dict(width=2),
-                        marker=dict(size=6)
-                    ))
-
-                fig_wh.update_layout(
-                    title="Evolución de Tablillas Abiertas por Warehouse",
-                    xaxis_title="Fecha",
-                    yaxis_title="Tablillas Abiertas",
-                    hovermode='x unified',
-                    height=500
-                )
-                st.plotly_chart(fig_wh, use_container_width=True)
-
-            # ============================================================
-            # TABLA RESUMEN
-            # ============================================================
-
-            st.subheader("📋 Resumen Histórico")
-            st.dataframe(tablets_df, use_container_width=True)
-
-            # ============================================================
-            # EXPORTACIÓN
-            # ============================================================
-
-            st.subheader("💾 Exportar Consolidado")
-
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                # Hoja 1: Datos consolidados
-                combined_df.to_excel(writer, sheet_name='Datos_Consolidados', index=False)
-
-                # Hoja 2: Evolución tablillas
-                tablets_df.to_excel(writer, sheet_name='Evolucion_Tablillas', index=False)
-
-                # Hoja 3: Por warehouse (último período)
-                if not combined_df.empty:
-                    last_date = combined_df['fecha_archivo'].max()
-                    last_df = combined_df[combined_df['fecha_archivo'] == last_date].iloc[:, :18]
-                    last_warehouse = create_tablets_breakdown_by_warehouse(last_df)
-                    if not last_warehouse.empty:
-                        last_warehouse.to_excel(writer, sheet_name='Ultimo_Por_Warehouse', index=False)
-
-            st.download_button(
-                "📊 Descargar Análisis Histórico Consolidado",
-                buffer.getvalue(),
-                f"historico_consolidado_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-    else:
-        st.warning("👆 Sube archivos Excel para comenzar")
+    def on_layout_template(self, event: ExtractionEvent):
+        st.caption(f"📐 {event.message}")
+
+    def on_page_processing(self, event: ExtractionEvent):
+        if not self.live:
+            st.write(f"📋 {event.message}")
+
+    def on_page_rows(self, event: ExtractionEvent):
+        page, page_count = event.data['page'], event.data['page_count']
+        if self.progress is None:
+            self.progress = st.progress(0.0)
+        self.progress.progress(min(page / page_count, 1.0), text=f"📄 {event.message}")
+
+        data = event.data['data']
+        if data is not None:
+            self.live_row_count += len(data)
+            # Solo la cola de la tabla: el coste por página no crece con el documento
+            tail = data if self.live_rows is None else pd.concat([self.live_rows, data])
+            self.live_rows = tail.tail(self.LIVE_PREVIEW_ROWS)
+            self.live_table.dataframe(self.live_rows, use_container_width=True, height=300)
+
+        with self.live_metrics.container():
+            col1, col2, col3 = st.columns(3)
+            col1.metric("📄 Páginas", f"{page}/{page_count}")
+            col2.metric("📊 Filas", self.live_row_count)
+            col3.metric("🧾 Slips", event.data['slip_count'])
+
+    def on_validation(self, event: ExtractionEvent):
+        completeness = event.data['completeness']
+
+        st.header("🔍 Validación del Sistema")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("📊 Filas Totales", event.data['total_rows'])
+        with col2:
+            st.metric("📊 Slips Válidos", event.data['slip_count'])
+        with col3:
+            st.metric("📊 Completitud", f"{completeness:.1f}%")
+
+        if completeness >= 95:
+            st.success("🎉 **EXTRACCIÓN EXCELENTE**")
+        elif completeness >= 80:
+            st.info("📊 **EXTRACCIÓN BUENA**")
+        else:
+            st.warning("⚠️ **EXTRACCIÓN PARCIAL**")
+
+    def on_error(self, event: ExtractionEvent):
+        st.error(f"❌ {event.message}")
+        if event.data.get('detail'):
+            st.error(event.data['detail'])
+
+    def finish(self):
+        """Retira los indicadores transitorios (estado y barra de progreso)"""
+        self.status.empty()
+        if self.progress is not None:
+            self.progress.empty()
+            self.progress = None
+        if self.live:
+            self.live_metrics.empty()
+            self.live_table.empty()
+            self.live_rows = None
 
 
 # ============================================================================
 # APLICACIÓN PRINCIPAL
 # ============================================================================
 
+def session_artifacts() -> ArtifactMemo:
+    """ArtifactMemo de la sesión: evita recalcular extracción, dashboards y exportaciones en cada rerun"""
+    if '_artifact_memo' not in st.session_state:
+        st.session_state['_artifact_memo'] = ArtifactMemo()
+    return st.session_state['_artifact_memo']
+
+
+def render_stage_profile(profiler: StageProfiler):
+    """Modo Debug: tabla tipo flame graph con el tiempo de cada etapa de esta ejecución"""
+    st.divider()
+    st.header("⏱️ Perfil por Etapas")
+    memo = session_artifacts()
+    st.caption(f"♻️ Artefactos de sesión: {len(memo.entries)} en memoria "
+               f"({memo.total_bytes / 1024 / 1024:.1f} de {memo.max_bytes / 1024 / 1024:.0f} MB) · "
+               f"{memo.stats['hits']} aciertos · {memo.stats['misses']} cálculos · "
+               f"{memo.stats['evictions']} descartes")
+    table = profiler.flame_table()
+    if table.empty:
+        st.info("No se ejecutó ninguna etapa medida en esta ejecución")
+        return
+
+    st.dataframe(
+        table,
+        use_container_width=True,
+        hide_index=True,
+        height=min(35 * (len(table) + 1) + 3, 700),
+        column_config={
+            'Segundos': st.column_config.NumberColumn(format="%.3f"),
+            '% padre': st.column_config.NumberColumn(format="%.1f%%"),
+            '% total': st.column_config.ProgressColumn(format="%.1f%%", min_value=0, max_value=100),
+        }
+    )
+    st.caption("Segundos acumulados por etapa (tiempo de pared). En ejecución paralela "
+               "las etapas de los workers se suman, por eso pueden superar el total.")
+
+
 def main():
+    st.set_page_config(
+        page_title="Camelot PDF Extractor Pro v3.0",
+        page_icon="📄",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    # El checkbox "Modo Debug" (key='show_debug') activa el perfilado por etapas
+    if st.session_state.get('show_debug'):
+        with stage_profiler() as profiler:
+            render_app()
+        render_stage_profile(profiler)
+    else:
+        render_app()
+
+
+def render_app():
     render_header()
 
     main_tabs = st.tabs([
@@ -1578,7 +4450,67 @@ def main():
             st.divider()
 
             st.markdown("**🔧 Opciones**")
-            show_debug = st.checkbox("Modo Debug", value=False)
+            st.checkbox("Modo Debug", value=False, key='show_debug',
+                        help="Muestra el tiempo y las llamadas de cada etapa al final de la página")
+            extraction_mode = st.radio(
+                "Modo de extracción",
+                ["Completo", "Adaptativo", "Progresivo"],
+                help="Completo: compara los 8 métodos. Adaptativo: se detiene en el "
+                     "primer método que cumple el umbral de calidad. Progresivo: "
+                     "method_stream_standard página a página, con resultados en vivo"
+            )
+            adaptive_mode = extraction_mode == "Adaptativo"
+            streaming_mode = extraction_mode == "Progresivo"
+            min_completeness = st.slider(
+                "Completitud mínima (%)", 80.0, 100.0, 99.0, 0.5, disabled=not adaptive_mode
+            )
+            max_discrepancies = st.number_input(
+                "Discrepancias máximas", min_value=0, value=0, disabled=not adaptive_mode
+            )
+            parallel_mode = st.checkbox(
+                "Ejecución paralela", value=False, disabled=adaptive_mode or streaming_mode,
+                help="Ejecuta cada método de extracción en su propio proceso"
+            )
+            shard_mode = st.checkbox(
+                "Dividir por páginas", value=False, disabled=parallel_mode or streaming_mode,
+                help="Ejecuta cada método sobre bloques de páginas en paralelo (PDFs grandes)"
+            )
+            shard_size = st.number_input(
+                "Páginas por bloque", min_value=1, value=25, disabled=not shard_mode
+            )
+            max_workers = st.number_input(
+                "Procesos", min_value=1, max_value=os.cpu_count() or 1,
+                value=min(6, os.cpu_count() or 1), disabled=not (parallel_mode or shard_mode)
+            )
+            vectorized_engine = st.checkbox(
+                "Correcciones vectorizadas", value=False,
+                help="Aplica las 8 correcciones a cada página completa (mismo resultado, más rápido)"
+            )
+            prescan = st.checkbox(
+                "Pre-escaneo de texto", value=True,
+                help="Lee la capa de texto y omite las páginas sin albaranes (portadas, resúmenes)"
+            )
+            lattice_resolution = st.number_input(
+                "Resolución lattice (dpi)", min_value=72, max_value=600, value=LATTICE_RESOLUTION, step=25,
+                help="Resolución a la que los métodos lattice rasterizan cada página"
+            )
+            lattice_draft = st.checkbox(
+                f"Borrador lattice a {LATTICE_DRAFT_RESOLUTION} dpi", value=True,
+                help="Intenta primero a baja resolución y relee a la completa solo las páginas "
+                     "cuyas tablas no alcanzan la precisión mínima"
+            )
+            use_cache = st.checkbox(
+                "Usar caché", value=True,
+                help="Reutiliza resultados de PDFs ya procesados (mismo contenido)"
+            )
+            save_snapshot = st.checkbox(
+                "Guardar en histórico", value=True,
+                help="Guarda cada extracción en el almacén local por fecha de reporte"
+            )
+            if st.button("🗑️ Limpiar caché"):
+                ExtractionCache().clear()
+                session_artifacts().clear()
+                st.success("Caché vaciada")
 
         uploaded_file = st.file_uploader(
             "📂 Selecciona el PDF",
@@ -1587,27 +4519,84 @@ def main():
         )
 
         if uploaded_file:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_path = tmp_file.name
+            pdf_bytes = uploaded_file.getvalue()
+
+            extractor = CamelotExtractorPro(
+                cache=ExtractionCache() if use_cache else None,
+                shard_size=int(shard_size) if shard_mode and not parallel_mode else None,
+                max_workers=int(max_workers),
+                correction_engine='vectorized' if vectorized_engine else 'rows',
+                prescan=prescan,
+                template_store=LayoutTemplateStore(),
+                lattice_resolution=int(lattice_resolution),
+                lattice_draft_resolution=LATTICE_DRAFT_RESOLUTION if lattice_draft else None
+            )
 
-            extractor = CamelotExtractorPro()
+            def run_extraction():
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+                    tmp_file.write(pdf_bytes)
+                    tmp_path = tmp_file.name
+
+                try:
+                    progress_view = extractor.events.subscribe(StreamlitProgressView(live=streaming_mode))
+                    if streaming_mode:
+                        results = {'method_stream_standard': extractor.extract_streaming(tmp_path)}
+                    elif adaptive_mode:
+                        results = extractor.extract_adaptive(tmp_path, min_completeness=min_completeness,
+                                                             max_discrepancies=int(max_discrepancies))
+                    elif parallel_mode:
+                        results = extractor.extract_with_all_methods_parallel(tmp_path,
+                                                                              max_workers=int(max_workers))
+                    else:
+                        results = extractor.extract_with_all_methods(tmp_path)
+                    progress_view.finish()
+                    return results
+                finally:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+
+            # Los reruns de Streamlit (cambiar de pestaña, tocar un widget) reutilizan
+            # la extracción mientras no cambien el PDF ni las opciones que afectan al resultado
+            extraction_key = (hashlib.sha256(pdf_bytes).hexdigest(), 'extraction', extraction_mode,
+                              min_completeness, int(max_discrepancies), parallel_mode, shard_mode,
+                              int(shard_size), vectorized_engine, prescan, int(lattice_resolution), lattice_draft)
             st.header("📄 Ejecutando Extracción")
-            results = extractor.extract_with_all_methods(tmp_path)
+            memo = session_artifacts()
+            misses = memo.stats['misses']
+            results = memo.get_or_compute(extraction_key, run_extraction)
+            if memo.stats['misses'] == misses:
+                st.caption("♻️ Extracción reutilizada de esta sesión")
 
             st.header("📊 Resultados de Extracción")
+            if extractor.layout_stats and (extractor.layout_stats['layout_hits'] or
+                                           extractor.layout_stats['image_hits']):
+                st.caption(f"♻️ Layout compartido: {extractor.layout_stats['layout_hits']} parses de página, "
+                           f"{extractor.layout_stats['image_hits']} renderizados y "
+                           f"{extractor.layout_stats['lines_hits']} detecciones de líneas reutilizados")
             method_names = list(results.keys())
 
             if method_names:
                 tabs = st.tabs(method_names)
-                best_method = None
-                best_score = 0
 
                 for tab, method_name in zip(tabs, method_names):
                     with tab:
                         result = results[method_name]
 
                         if result['success']:
+                            if result.get('cached'):
+                                st.caption("⚡ Resultado recuperado de la caché")
+                            if 'quality' in result:
+                                quality = result['quality']
+                                st.caption(f"{'✅' if result.get('passed_quality') else '❌'} "
+                                           f"Completitud {quality['completeness']:.1f}% · "
+                                           f"Discrepancias {quality['discrepancies']}")
+                            if 'memory' in result:
+                                memory = result['memory']
+                                st.caption(f"🧮 Memoria: {memory['raw_bytes'] / 1024 / 1024:.2f} MB → "
+                                           f"{memory['typed_bytes'] / 1024 / 1024:.2f} MB "
+                                           f"(−{memory['saved_pct']:.0f}%) con el esquema tipado")
                             col1, col2, col3 = st.columns(3)
                             with col1:
                                 st.metric("Tablas", result.get('tables_found', 0))
@@ -1618,20 +4607,10 @@ def main():
                                 st.metric("Precisión", f"{acc:.1f}%")
 
                             if result.get('data') is not None and len(result['data']) > 0:
-                                validation = extractor.validate_extraction(result['data'])
-
-                                score = validation['total_rows']
-                                if validation['has_fl_column']:
-                                    score += 10
-                                if validation['has_slip_numbers']:
-                                    score += 10
-
-                                if score > best_score:
-                                    best_score = score
-                                    best_method = method_name
-
                                 st.dataframe(result['data'], use_container_width=True, height=400)
 
+                best_method = extractor.select_best_method(results)
+
                 if best_method:
                     st.header("🏆 Mejor Método de Extracción")
                     st.success(f"**{best_method}**")
@@ -1639,12 +4618,30 @@ def main():
                     best_data = results[best_method]['data']
                     st.session_state['extracted_data'] = best_data
 
+                    if save_snapshot:
+                        try:
+                            report_date = session_artifacts().get_or_compute(
+                                (extraction_key[0], 'report_date'),
+                                lambda: detect_report_date(io.BytesIO(pdf_bytes), uploaded_file.name))
+                            if report_date is None:
+                                st.warning("⚠️ No se encontró la fecha del reporte (ni en el nombre YYYYMMDD "
+                                           "ni en la cabecera): no se guarda en el histórico")
+                            elif SnapshotStore().save(report_date, best_data, source=uploaded_file.name,
+                                                      method=best_method):
+                                st.caption(f"🗄️ Guardado en el histórico como {report_date:%Y-%m-%d}")
+                        except Exception as e:
+                            st.warning(f"No se pudo guardar en el histórico: {e}")
+
                     st.subheader("💾 Exportar Datos")
                     col1, col2 = st.columns(2)
 
+                    memo = session_artifacts()
+                    fingerprint = frame_fingerprint(best_data)
+
                     with col1:
                         try:
-                            csv = best_data.to_csv(index=False)
+                            csv = memo.get_or_compute((fingerprint, 'csv'),
+                                                      lambda: best_data.to_csv(index=False))
                             st.download_button(
                                 "📄 Descargar CSV Simple",
                                 csv,
@@ -1655,24 +4652,27 @@ def main():
                         except Exception as e:
                             st.error(f"Error generando CSV: {e}")
 
-                    with col2:
-                        try:
-                            excel_buffer = export_to_professional_excel(best_data)
-                            if excel_buffer:
-                                st.download_button(
-                                    "📊 Descargar Excel Profesional",
-                                    excel_buffer.getvalue(),
-                                    f"analisis_completo_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                    help="Excel con múltiples hojas de análisis"
-                                )
-                        except Exception as e:
-                            st.error(f"Error generando Excel: {e}")
+                    def build_excel() -> Dict:
+                        stats = {}
+                        excel_buffer = export_to_professional_excel(best_data, stats=stats)
+                        if excel_buffer is None:
+                            raise RuntimeError("Error creando Excel profesional")
+                        return {'data': excel_buffer.getvalue(), 'stats': stats}
 
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
+                    with col2:
+                        # El libro se genera solo al pulsar el botón (Streamlit llama a data en ese momento)
+                        st.download_button(
+                            "📊 Descargar Excel Profesional",
+                            lambda: memo.get_or_compute((fingerprint, 'excel'), build_excel)['data'],
+                            f"analisis_completo_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            help="Excel con múltiples hojas de análisis"
+                        )
+                        excel = memo.get((fingerprint, 'excel'))
+                        if excel is not None:
+                            stats = excel['stats']
+                            st.caption(f"Excel generado en {stats['seconds']:.2f}s · "
+                                       f"{len(excel['data']) / 1024 / 1024:.1f} MB")
 
     with main_tabs[1]:
         if 'extracted_data' in st.session_state and st.session_state['extracted_data'] is not None:
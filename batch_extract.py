@@ -0,0 +1,244 @@
+# batch_extract.py
+"""
+Extracción por lotes sin interfaz (cron / línea de comandos)
+
+Procesa un directorio o patrón glob de PDFs con CamelotExtractorPro, escribe
+CSV + Excel profesional por archivo, guarda cada extracción en el almacén
+histórico local (por fecha de reporte) e imprime una tabla resumen.
+
+Códigos de salida:
+    0  todos los archivos se extrajeron correctamente
+    1  al menos un archivo falló
+    2  no se encontraron PDFs (o argumentos inválidos)
+
+Ejemplo:
+    python batch_extract.py /data/reportes --output-dir /data/salida --workers 4
+    python batch_extract.py "/data/reportes/**/*.pdf" --mode adaptive
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from app import (
+    LATTICE_DRAFT_RESOLUTION,
+    LATTICE_RESOLUTION,
+    CamelotExtractorPro,
+    ExtractionCache,
+    LayoutTemplateStore,
+    SnapshotStore,
+    _get_process_pool_context,
+    detect_report_date,
+    export_to_professional_excel,
+)
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_NO_INPUT = 2
+
+
+def find_pdfs(inputs: List[str]) -> List[str]:
+    """Resuelve directorios y patrones glob a una lista ordenada de PDFs sin duplicados"""
+    found = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            candidates = glob.glob(os.path.join(entry, '*.pdf')) + glob.glob(os.path.join(entry, '*.PDF'))
+        else:
+            candidates = glob.glob(entry, recursive=True)
+        found.extend(path for path in candidates if path.lower().endswith('.pdf') and os.path.isfile(path))
+
+    return sorted({os.path.abspath(path) for path in found})
+
+
+def output_names(pdfs: List[str]) -> Dict[str, str]:
+    """
+    Nombre de salida (sin extensión) de cada PDF: su nombre de archivo, o la
+    ruta relativa al directorio común (con '_' en lugar de separadores) si
+    otro PDF de la lista tiene el mismo. Un sufijo numérico resuelve lo que aún choque.
+    """
+    def stem(path: str) -> str:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    # Insensible a mayúsculas: el directorio de salida puede estarlo
+    counts = Counter(stem(path).lower() for path in pdfs)
+    common = os.path.commonpath([os.path.dirname(path) for path in pdfs]) if pdfs else ''
+
+    names, used = {}, set()
+    for path in pdfs:
+        name = stem(path)
+        if counts[name.lower()] > 1:
+            name = os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, '_')
+        unique, n = name, 2
+        while unique.lower() in used:
+            unique, n = f"{name}_{n}", n + 1
+        used.add(unique.lower())
+        names[path] = unique
+    return names
+
+
+def report_errors(pdf_path: str):
+    """Suscriptor de eventos del extractor: los errores van a stderr con el nombre del archivo"""
+    name = os.path.basename(pdf_path)
+
+    def listener(event):
+        if event.kind == 'error':
+            print(f"{name}: {event.message}", file=sys.stderr)
+
+    return listener
+
+
+def process_pdf(pdf_path: str, output_dir: str, output_name: str, options: Dict, mode: str,
+                min_completeness: float, max_discrepancies: int, store_path: Optional[str] = None) -> Dict:
+    """
+    Extrae un PDF, elige el mejor método y escribe output_name.csv + .xlsx (y la
+    instantánea del histórico si hay store_path). Se ejecuta en un proceso worker.
+    """
+    start = time.perf_counter()
+    # Con nombres repetidos la tabla resumen muestra el de salida
+    summary = {'file': output_name + os.path.splitext(pdf_path)[1], 'status': 'failed', 'method': '-',
+               'rows': 0, 'seconds': 0.0, 'error': ''}
+
+    try:
+        extractor = CamelotExtractorPro(**options)
+        extractor.events.subscribe(report_errors(pdf_path))
+
+        if mode == 'adaptive':
+            results = extractor.extract_adaptive(pdf_path, min_completeness=min_completeness,
+                                                 max_discrepancies=max_discrepancies)
+        else:
+            results = extractor.extract_with_all_methods(pdf_path)
+
+        best_method = extractor.select_best_method(results)
+        if best_method is None:
+            errors = [r.get('error') for r in results.values() if r.get('error')]
+            summary['error'] = errors[0] if errors else 'ningún método extrajo datos'
+            return summary
+
+        best_data = results[best_method]['data']
+        best_data.to_csv(os.path.join(output_dir, f"{output_name}.csv"), index=False)
+        with open(os.path.join(output_dir, f"{output_name}.xlsx"), 'wb') as f:
+            f.write(export_to_professional_excel(best_data).getvalue())
+
+        if store_path:
+            report_date = detect_report_date(pdf_path, os.path.basename(pdf_path))
+            if report_date is None:
+                # Sin fecha no hay clave: no se reemplaza la instantánea de otro día
+                summary['error'] = "sin fecha de reporte (nombre YYYYMMDD o cabecera): no se guardó en el histórico"
+            else:
+                SnapshotStore(store_path).save(report_date, best_data, source=os.path.basename(pdf_path),
+                                               method=best_method)
+
+        summary.update(status='ok', method=best_method, rows=len(best_data))
+    except Exception as e:
+        summary['error'] = str(e)
+    finally:
+        summary['seconds'] = time.perf_counter() - start
+
+    return summary
+
+
+def print_summary(summaries: List[Dict], elapsed: float):
+    """Tabla resumen por archivo en stdout"""
+    file_width = max([len('Archivo')] + [len(s['file']) for s in summaries])
+    method_width = max([len('Método')] + [len(s['method']) for s in summaries])
+
+    header = f"{'Archivo':<{file_width}}  {'Estado':<6}  {'Método':<{method_width}}  {'Filas':>6}  {'Segundos':>8}"
+    print(header)
+    print('-' * len(header))
+    for s in summaries:
+        line = (f"{s['file']:<{file_width}}  {s['status']:<6}  {s['method']:<{method_width}}  "
+                f"{s['rows']:>6}  {s['seconds']:>8.2f}")
+        if s['error']:
+            line += f"  {s['error']}"
+        print(line)
+    print('-' * len(header))
+
+    failed = sum(1 for s in summaries if s['status'] != 'ok')
+    print(f"{len(summaries)} archivos · {len(summaries) - failed} ok · {failed} fallidos · {elapsed:.2f}s total")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extracción por lotes de PDFs 'Outstanding Count Returns'")
+    parser.add_argument('inputs', nargs='+', help="Directorios o patrones glob de PDFs")
+    parser.add_argument('-o', '--output-dir', default='salida', help="Directorio de salida (default: salida)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="Procesos worker en paralelo (default: nº de CPUs)")
+    parser.add_argument('--mode', choices=['full', 'adaptive'], default='full',
+                        help="full: los 8 métodos; adaptive: se detiene en el primero que supera el umbral")
+    parser.add_argument('--min-completeness', type=float, default=99.0,
+                        help="Modo adaptativo: completitud mínima de slips (%%)")
+    parser.add_argument('--max-discrepancies', type=int, default=0,
+                        help="Modo adaptativo: discrepancias de tablillas permitidas")
+    parser.add_argument('--engine', choices=['rows', 'vectorized'], default='rows',
+                        help="Motor de correcciones")
+    parser.add_argument('--no-cache', action='store_true', help="No usar la caché persistente de extracciones")
+    parser.add_argument('--no-prescan', action='store_true',
+                        help="No omitir las páginas sin albaranes (pre-escaneo de texto)")
+    parser.add_argument('--lattice-dpi', type=int, default=LATTICE_RESOLUTION,
+                        help=f"Resolución de render de los métodos lattice (default: {LATTICE_RESOLUTION})")
+    parser.add_argument('--no-lattice-draft', action='store_true',
+                        help=f"No intentar antes los métodos lattice a {LATTICE_DRAFT_RESOLUTION} dpi")
+    parser.add_argument('--templates', default=None,
+                        help="Almacén JSON de plantillas de layout (default: el de la aplicación)")
+    parser.add_argument('--store', default=None,
+                        help="Almacén histórico SQLite (default: el de la aplicación)")
+    parser.add_argument('--no-store', action='store_true', help="No guardar las extracciones en el histórico")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No se encontraron PDFs en: " + ", ".join(args.inputs), file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    options = CamelotExtractorPro(
+        cache=None if args.no_cache else ExtractionCache(),
+        correction_engine=args.engine,
+        prescan=not args.no_prescan,
+        template_store=LayoutTemplateStore(args.templates),
+        lattice_resolution=args.lattice_dpi,
+        lattice_draft_resolution=None if args.no_lattice_draft else LATTICE_DRAFT_RESOLUTION,
+    ).worker_options()
+
+    store_path = None if args.no_store else SnapshotStore(args.store).path
+
+    names = output_names(pdfs)
+
+    start = time.perf_counter()
+    summaries = []
+    workers = max(1, min(args.workers, len(pdfs)))
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_get_process_pool_context()) as executor:
+        futures = {executor.submit(process_pdf, pdf, args.output_dir, names[pdf], options, args.mode,
+                                   args.min_completeness, args.max_discrepancies, store_path): pdf
+                   for pdf in pdfs}
+
+        for future in as_completed(futures):
+            pdf = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                # El worker murió (p. ej. sin memoria): el archivo cuenta como fallido
+                summary = {'file': names[pdf] + os.path.splitext(pdf)[1], 'status': 'failed', 'method': '-',
+                           'rows': 0, 'seconds': 0.0, 'error': str(e) or type(e).__name__}
+            summaries.append(summary)
+            print(f"[{len(summaries)}/{len(pdfs)}] {summary['file']}: {summary['status']}", file=sys.stderr)
+
+    summaries.sort(key=lambda s: s['file'])
+    print_summary(summaries, time.perf_counter() - start)
+
+    return EXIT_OK if all(s['status'] == 'ok' for s in summaries) else EXIT_FAILURES
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# benchmark.py
+"""
+Benchmark de extracción sobre PDFs sintéticos (10 / 100 / 1000 páginas)
+
+Para cada tamaño y cada método camelot mide, en un proceso aislado:
+    - parse camelot del método (method_*)
+    - process_tables completo y cada una de las 8 correcciones (tiempo y llamadas)
+    - export_to_professional_excel (tiempo y memoria pico de la exportación)
+    - memoria del DataFrame antes y después del esquema tipado
+    - pre-escaneo de texto: segundos y páginas omitidas
+    - páginas/s, filas/s y memoria pico (RSS) del proceso
+    - calidad (score_extraction) y si el método supera el umbral del modo
+      adaptativo; superarlo con menos albaranes que los generados es una
+      regresión y el benchmark termina con código 1
+
+Los resultados se escriben en JSON (por defecto benchmark_results.json).
+
+Uso:
+    python benchmark.py                              # 10, 100 y 1000 páginas, 8 métodos
+    python benchmark.py --pages 10 100 --methods method_stream_standard --engine vectorized
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from app import (
+    CamelotExtractorPro,
+    _get_process_pool_context,
+    export_to_professional_excel,
+    profile_stage,
+    stage_profiler,
+)
+from synthetic_pdf import generate_outstanding_report
+
+try:
+    import resource
+except ImportError:  # Windows: sin memoria pico
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """Memoria residente pico del proceso actual en MB (None si no está disponible)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS, bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Umbral por defecto del modo adaptativo (extract_adaptive)
+MIN_COMPLETENESS = 99.0
+MAX_DISCREPANCIES = 0
+
+
+def benchmark_method(pdf_path: str, method_name: str, engine: str, pages: int, generated_slips: int) -> Dict:
+    """Mide un método sobre un PDF. Se ejecuta en un proceso worker propio."""
+    baseline_mb = peak_rss_mb()
+    extractor = CamelotExtractorPro(correction_engine=engine, share_layout=False)
+    run = {'pages': pages, 'method': method_name, 'engine': engine, 'success': False,
+           'tables': 0, 'rows': 0, 'error': None, 'export_peak_mb': None, 'memory': None,
+           'prescan': None, 'quality': None, 'passed_quality': False, 'quality_regression': False}
+
+    with stage_profiler() as profiler:
+        result = extractor.run_method(pdf_path, method_name)
+        run['tables'] = result.get('tables_found', 0)
+        run['error'] = result.get('error')
+        run['memory'] = result.get('memory')
+        scan = extractor.page_scans.get(pdf_path)
+        if scan is not None:
+            run['prescan'] = {key: scan[key] for key in ('page_count', 'skipped', 'seconds')}
+
+        df = result.get('data')
+        if result.get('success') and df is not None and not df.empty:
+            run['rows'] = len(df)
+            quality = extractor.score_extraction(df, extractor.expected_slips(pdf_path))
+            run['quality'] = quality
+            run['passed_quality'] = (quality['completeness'] >= MIN_COMPLETENESS and
+                                     quality['discrepancies'] <= MAX_DISCREPANCIES)
+            # El umbral no puede aprobar un método que pierde albaranes
+            run['quality_regression'] = run['passed_quality'] and quality['slip_count'] < generated_slips
+            export_stats = {}
+            with profile_stage('export'):
+                export_to_professional_excel(df, stats=export_stats, trace_memory=True)
+            run['export_peak_mb'] = export_stats.get('peak_mb')
+            run['success'] = True
+
+    # Etapas planas: "method_x/process_tables/fix_tablets_total_split"
+    stages = {'/'.join(path): {'seconds': record['seconds'], 'calls': record['calls']}
+              for path, record in profiler.stages.items()}
+    extraction_seconds = profiler.stages.get((method_name,), {}).get('seconds', 0.0)
+
+    run['stages'] = stages
+    run['extraction_seconds'] = extraction_seconds
+    run['pages_per_sec'] = pages / extraction_seconds if extraction_seconds else None
+    run['rows_per_sec'] = run['rows'] / extraction_seconds if extraction_seconds else None
+    run['baseline_rss_mb'] = baseline_mb
+    run['peak_rss_mb'] = peak_rss_mb()
+    return run
+
+
+def synthetic_pdf_path(workdir: str, pages: int, rows_per_page: int, seed: int,
+                       summary_pages: int = 0) -> Tuple[str, Dict]:
+    """Genera (o reutiliza) el PDF sintético de un tamaño y sus cifras de control (JSON junto al PDF)"""
+    suffix = f"_{summary_pages}sum" if summary_pages else ''
+    path = os.path.join(workdir, f"synthetic_{pages}p_{rows_per_page}r_s{seed}{suffix}.pdf")
+    stats_path = os.path.splitext(path)[0] + '.json'
+    if os.path.exists(path) and os.path.exists(stats_path):
+        with open(stats_path, encoding='utf-8') as f:
+            return path, json.load(f)
+
+    start = time.perf_counter()
+    stats = generate_outstanding_report(path, pages=pages, rows_per_page=rows_per_page, seed=seed,
+                                        summary_pages=summary_pages)
+    with open(stats_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f)
+    print(f"Generado {path}: {stats['slips']} albaranes en {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+    return path, stats
+
+
+def print_run(run: Dict):
+    stages = run['stages']
+    parse = stages.get(f"{run['method']}/camelot_parse", {}).get('seconds', 0.0)
+    process = stages.get(f"{run['method']}/process_tables", {}).get('seconds', 0.0)
+    export = stages.get('export', {}).get('seconds', 0.0)
+    rate = f"{run['pages_per_sec']:.2f}" if run['pages_per_sec'] else '-'
+    completeness = f"{run['quality']['completeness']:.1f}" if run['quality'] else '-'
+    print(f"{run['pages']:>5}  {run['method']:<26} {run['rows']:>7}  {parse:>9.2f}  {process:>9.2f}  "
+          f"{export:>7.2f}  {rate:>8}  {run['peak_rss_mb'] or 0:>8.0f}  {completeness:>6}"
+          + (f"  {run['error']}" if run['error'] else '')
+          + ("  REGRESIÓN: supera el umbral con albaranes perdidos" if run['quality_regression'] else ''))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de extracción sobre PDFs sintéticos")
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000],
+                        help="Tamaños de PDF en páginas (default: 10 100 1000)")
+    parser.add_argument('--rows-per-page', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--summary-pages', type=int, default=0,
+                        help="Páginas de resumen sin albaranes añadidas a cada PDF")
+    parser.add_argument('--methods', nargs='+', default=None,
+                        help="Métodos a medir (default: los 8 de CamelotExtractorPro)")
+    parser.add_argument('--engine', choices=['rows', 'vectorized'], default='rows',
+                        help="Motor de correcciones")
+    parser.add_argument('--workdir', default='benchmark_pdfs', help="Directorio de los PDFs sintéticos")
+    parser.add_argument('--output', default='benchmark_results.json', help="Archivo JSON de resultados")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    method_names = args.methods or [m.__name__ for m in CamelotExtractorPro().extraction_methods]
+    unknown = [name for name in method_names if not hasattr(CamelotExtractorPro, name)]
+    if unknown:
+        print(f"Métodos desconocidos: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.workdir, exist_ok=True)
+    runs: List[Dict] = []
+
+    print(f"{'Págs':>5}  {'Método':<26} {'Filas':>7}  {'Parse s':>9}  {'Process s':>9}  "
+          f"{'Export s':>7}  {'Págs/s':>8}  {'Pico MB':>8}  {'Compl%':>6}")
+
+    for pages in args.pages:
+        pdf_path, stats = synthetic_pdf_path(args.workdir, pages, args.rows_per_page, args.seed,
+                                             args.summary_pages)
+
+        for method_name in method_names:
+            # Un proceso por medición: la memoria pico no se mezcla entre métodos
+            with ProcessPoolExecutor(max_workers=1, mp_context=_get_process_pool_context()) as executor:
+                run = executor.submit(benchmark_method, pdf_path, method_name, args.engine, pages,
+                                      stats['slips']).result()
+            runs.append(run)
+            print_run(run)
+
+    results = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'engine': args.engine,
+        'rows_per_page': args.rows_per_page,
+        'seed': args.seed,
+        'summary_pages': args.summary_pages,
+        'runs': runs,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.output}", file=sys.stderr)
+
+    regressions = [run['method'] for run in runs if run['quality_regression']]
+    if regressions:
+        print(f"Regresión de calidad (umbral superado con albaranes perdidos): {', '.join(regressions)}",
+              file=sys.stderr)
+
+    return 0 if all(run['success'] for run in runs) and not regressions else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
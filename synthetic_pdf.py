@@ -0,0 +1,214 @@
+# synthetic_pdf.py
+"""
+Generador de PDFs sintéticos "Outstanding Count Returns"
+
+Reproduce el formato del reporte de Alsina Forms (18 columnas) con los casos
+que corrigen las 8 funciones de autocorrección:
+
+- Primera columna multilínea (estado / warehouse / slip apilados en la celda)
+- Columna Open vacía (albaranes cerrados y páginas completas de cierre de mes)
+- Total y Open juntos en la misma celda ("3 1656T, 1661A")
+- Customer pegado a Definitive ("Coastal Forms Inc No")
+- Códigos de Tablets / Open que continúan en la línea siguiente
+- Warehouses mixtos (RO-XX, 61D, 612D, 298T...)
+- Páginas de resumen sin albaranes al final (opcional)
+
+Requiere reportlab (solo para benchmarks, no lo usa la aplicación):
+    pip install reportlab
+
+Uso:
+    python synthetic_pdf.py salida.pdf --pages 100
+"""
+
+import argparse
+import random
+from typing import Dict
+
+HEADERS = ['Wh', 'Return', 'Return packing slip', 'Return p.slip date', 'Jobsite', 'Cost Center',
+           'Invoice', 'Invoice', 'Customer name', 'Job name', 'Definitive', 'Counted date',
+           'Tablets', 'Total', 'Open', 'Tablets total', 'Counting delay', 'Validation delay']
+
+# Coordenada x de inicio de cada columna (página apaisada de 1000 x 612 pt)
+COLUMN_X = [20, 42, 72, 130, 188, 230, 270, 310, 350, 460, 540, 580, 625, 705, 730, 825, 870, 920]
+PAGE_SIZE = (1000, 612)
+RIGHT_EDGE = 975
+
+STATES = ['FL', 'TX', 'GA', 'NC', 'CA']
+WAREHOUSES = ['61D', '612D', '298T', '61d', 'RO-FL', 'RO-TX', 'RO-GA', '612d']
+CUSTOMERS = ['Thales Builders Corp', 'Coastal Forms Inc', 'Acme Concrete LLC', 'Baker Structures',
+             'Gulf Shore Contractors', 'Pinnacle Civil Group']
+JOB_NAMES = ['Residences at Martin', 'Tower B', 'Bridge 12', 'Harbor Point', 'Parking Deck C']
+SUFFIXES = 'MALT'
+
+LINE_HEIGHT = 7
+ROW_PADDING = 7
+
+
+def _date(rng: random.Random, month: int) -> str:
+    return f"{month}/{rng.randint(1, 28)}/2025"
+
+
+def _make_row(rng: random.Random, slip: int, closed: bool) -> Dict:
+    """Valores de una fila (listas para Tablets/Open) y los casos especiales que se dibujan"""
+    tablets = sorted({str(rng.randint(60, 2999)) for _ in range(rng.randint(1, 8))}, key=int)
+    open_codes = [] if closed else [t + rng.choice(SUFFIXES)
+                                    for t in rng.sample(tablets, rng.randint(1, len(tablets)))]
+    state = rng.choice(STATES)
+    return {
+        'values': [state, rng.choice(WAREHOUSES), str(slip), _date(rng, 10),
+                   f"4003{rng.randint(0, 9999):04d}", f"{state}0{rng.randint(10, 99)}",
+                   _date(rng, 8), _date(rng, 9), rng.choice(CUSTOMERS), rng.choice(JOB_NAMES),
+                   'Yes' if closed else 'No', _date(rng, 10) if closed else '',
+                   None, str(len(open_codes)), None, str(len(tablets)),
+                   str(rng.randint(0, 20)), str(rng.randint(0, 5))],
+        'tablets': tablets,
+        'open': open_codes,
+        'multiline': rng.random() < 0.10,
+        'total_open_joined': bool(open_codes) and rng.random() < 0.10,
+        'customer_definitive_joined': rng.random() < 0.05,
+    }
+
+
+def _split_codes(codes, per_line: int = 4):
+    """Parte una lista de códigos en líneas de per_line (la última sin coma final)"""
+    lines = [codes[i:i + per_line] for i in range(0, len(codes), per_line)] or [[]]
+    return [', '.join(chunk) + (',' if i < len(lines) - 1 else '') for i, chunk in enumerate(lines)]
+
+
+def _draw_summary_page(pdf, page_number: int, totals: Dict):
+    """Página de resumen por warehouse: texto del reporte pero sin slips"""
+    pdf.setFont('Helvetica', 8)
+    pdf.drawString(20, 596, 'Alsina Forms Co., Inc.')
+    pdf.drawString(20, 584, 'Outstanding count returns - Summary by warehouse')
+    y = 560
+    for warehouse, (slips, tablets) in sorted(totals.items()):
+        pdf.drawString(40, y, warehouse)
+        pdf.drawString(140, y, f"{slips} returns")
+        pdf.drawString(240, y, f"{tablets} tablets")
+        y -= 12
+    pdf.drawString(20, 30, f"Page {page_number}")
+    pdf.showPage()
+
+
+def generate_outstanding_report(path: str, pages: int = 10, rows_per_page: int = 20, seed: int = 0,
+                                month_close_ratio: float = 0.1, ruled: bool = True,
+                                summary_pages: int = 0) -> Dict:
+    """
+    Escribe un reporte sintético en path y devuelve sus cifras de control.
+
+    month_close_ratio: fracción de páginas con todos los albaranes cerrados
+    (columna Open completamente vacía). ruled: dibuja la cuadrícula de la
+    tabla para que los métodos lattice encuentren celdas. summary_pages:
+    páginas de resumen sin albaranes añadidas tras las de datos.
+    """
+    try:
+        from reportlab.pdfgen import canvas
+    except ImportError as e:
+        raise ImportError("El generador sintético requiere reportlab: pip install reportlab") from e
+
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(path, pagesize=PAGE_SIZE)
+    slip = 729000010000
+    stats = {'pages': pages + summary_pages, 'slips': 0, 'tablets': 0, 'open_tablets': 0,
+             'month_close_pages': 0, 'summary_pages': summary_pages}
+    totals = {}
+
+    for page in range(pages):
+        month_close = rng.random() < month_close_ratio
+        stats['month_close_pages'] += month_close
+
+        pdf.setFont('Helvetica', 6)
+        pdf.drawString(20, 596, 'Alsina Forms Co., Inc.')
+        pdf.drawString(20, 588, 'Outstanding count returns')
+        pdf.drawString(20, 580, f"10/{1 + page % 28}/2025 07:00")
+
+        top = 570
+        y = top - 10
+        for x, header in zip(COLUMN_X, HEADERS):
+            pdf.drawString(x, y, header)
+        row_lines = [top, top - 14]
+        y = top - 14
+
+        for _ in range(rows_per_page):
+            slip += 1
+            row = _make_row(rng, slip, closed=month_close or rng.random() < 0.3)
+            values = row['values']
+            tablet_lines = _split_codes(row['tablets'])
+            open_lines = _split_codes(row['open']) if row['open'] else ['']
+
+            if row['total_open_joined']:
+                open_lines = [f"{values[13]} {open_lines[0]}"] + open_lines[1:]
+            if row['customer_definitive_joined']:
+                values[8] = f"{values[8]} {values[10]}"
+                values[10] = ''
+
+            first_cell = values[:3] if row['multiline'] else [None]
+            height = max(len(first_cell), len(tablet_lines), len(open_lines)) * LINE_HEIGHT + ROW_PADDING
+            baseline = y - LINE_HEIGHT - 2
+
+            for col, (x, value) in enumerate(zip(COLUMN_X, values)):
+                if row['multiline'] and col < 3:
+                    continue
+                if col == 13 and row['total_open_joined']:
+                    continue
+                if value:
+                    pdf.drawString(x, baseline, value)
+
+            if row['multiline']:
+                for i, value in enumerate(first_cell):
+                    pdf.drawString(COLUMN_X[0], baseline - i * LINE_HEIGHT, value)
+
+            open_x = COLUMN_X[13] if row['total_open_joined'] else COLUMN_X[14]
+            for i, text in enumerate(tablet_lines):
+                pdf.drawString(COLUMN_X[12], baseline - i * LINE_HEIGHT, text)
+            for i, text in enumerate(open_lines):
+                if text:
+                    pdf.drawString(open_x if i == 0 else COLUMN_X[14], baseline - i * LINE_HEIGHT, text)
+
+            y -= height
+            row_lines.append(y)
+            stats['slips'] += 1
+            stats['tablets'] += len(row['tablets'])
+            slips, tablets = totals.get(values[1], (0, 0))
+            totals[values[1]] = (slips + 1, tablets + len(row['tablets']))
+            stats['open_tablets'] += len(row['open'])
+
+            if y < 60:
+                break
+
+        if ruled:
+            for line_y in row_lines:
+                pdf.line(COLUMN_X[0] - 3, line_y, RIGHT_EDGE, line_y)
+            for x in COLUMN_X + [RIGHT_EDGE + 3]:
+                pdf.line(x - 3, top, x - 3, row_lines[-1])
+
+        pdf.drawString(20, 30, f"Page {page + 1}")
+        pdf.showPage()
+
+    for page in range(summary_pages):
+        _draw_summary_page(pdf, pages + page + 1, totals)
+
+    pdf.save()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un reporte Outstanding Count Returns sintético")
+    parser.add_argument('output', help="Ruta del PDF a generar")
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--rows-per-page', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--month-close-ratio', type=float, default=0.1)
+    parser.add_argument('--no-ruling', action='store_true', help="Sin cuadrícula (solo texto)")
+    parser.add_argument('--summary-pages', type=int, default=0, help="Páginas de resumen sin albaranes")
+    args = parser.parse_args()
+
+    stats = generate_outstanding_report(args.output, pages=args.pages, rows_per_page=args.rows_per_page,
+                                        seed=args.seed, month_close_ratio=args.month_close_ratio,
+                                        ruled=not args.no_ruling, summary_pages=args.summary_pages)
+    print(f"{args.output}: {stats['pages']} páginas, {stats['slips']} albaranes, "
+          f"{stats['tablets']} tablillas ({stats['open_tablets']} abiertas)")
+
+
+if __name__ == '__main__':
+    main()